@@ -0,0 +1,33 @@
+"""
+Categorias dos produtos.
+
+Usadas pelo modelo Product (categoria calculada ao salvar) e pela ingestão
+(campo derivado category dos snapshots), sem que os modelos dependam da camada
+de serviços.
+"""
+
+from typing import Optional
+
+# Palavras-chave das categorias principais
+MAIN_CATEGORIES = {
+    "Cartuchos": ["cartucho", "tinta", "hp 6", "hp 9"],
+    "Tintas": ["tinta", "garrafa", "gt", "ink"],
+    "Suprimentos": ["kit", "combo", "refil"]
+}
+
+
+def main_category(text: Optional[str]) -> Optional[str]:
+    """Categoria principal (MAIN_CATEGORIES) cujas palavras-chave aparecem no texto"""
+    text = (text or "").lower()
+    for category, keywords in MAIN_CATEGORIES.items():
+        if any(keyword in text for keyword in keywords):
+            return category
+    return None
+
+
+def assign_category(search_terms: Optional[str], family: Optional[str] = None) -> str:
+    """
+    Categoria de um produto cadastrado, calculada ao salvá-lo: a categoria
+    principal do termo de busca ou, se não houver, a família do produto
+    """
+    return main_category(search_terms) or family or "Outros"
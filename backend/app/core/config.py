@@ -58,6 +58,63 @@ class Settings(BaseSettings):
 
     # Verificação de preços
     DEFAULT_PRICE_CHECK_INTERVAL: int = 6  # horas
+
+    # Cache de produtos cadastrados (invalidado também pelo CRUD de produtos)
+    PRODUCT_CACHE_TTL_SECONDS: int = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", 300))
+
+    # Cache de resultados de analytics/dashboard (invalidado a cada ingestão)
+    QUERY_CACHE_ENABLED: bool = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_CACHE_MAX_ENTRIES: int = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 512))
+    QUERY_CACHE_TTL_SECONDS: int = int(os.getenv("QUERY_CACHE_TTL_SECONDS", 3600))
+    QUERY_CACHE_USE_REDIS: bool = os.getenv("QUERY_CACHE_USE_REDIS", "false").lower() == "true"
+
+    # Janelas de tempo das consultas analíticas (alinhadas para serem cacheáveis)
+    ANALYTICS_WINDOW_ALIGNMENT: str = os.getenv("ANALYTICS_WINDOW_ALIGNMENT", "day")  # day ou hour
+    ANALYTICS_TIMEZONE: str = os.getenv("ANALYTICS_TIMEZONE", "America/Sao_Paulo")
+
+    # Conexão com o Elasticsearch: sonda rápida e reconexão em segundo plano com backoff
+    ES_PROBE_TIMEOUT_SECONDS: float = float(os.getenv("ES_PROBE_TIMEOUT_SECONDS", 2))
+    ES_RECONNECT_MAX_BACKOFF_SECONDS: float = float(os.getenv("ES_RECONNECT_MAX_BACKOFF_SECONDS", 60))
+
+    # Janela dos IDs determinísticos de snapshots: reenvios na mesma hora (ou dia) substituem o documento
+    SNAPSHOT_ID_BUCKET: str = os.getenv("SNAPSHOT_ID_BUCKET", "hour")  # hour ou day
+
+    # Estatísticas incrementais de preço por produto × vendedor: peso do preço mais recente na EWMA
+    PRICE_STATS_EWMA_ALPHA: float = float(os.getenv("PRICE_STATS_EWMA_ALPHA", 0.3))
+
+    # Alertas de preço avaliados na ingestão a partir do preço de referência dos produtos
+    PRICE_ALERTS_ENABLED: bool = os.getenv("PRICE_ALERTS_ENABLED", "true").lower() == "true"
+    PRICE_ALERT_STRONG_DROP: float = float(os.getenv("PRICE_ALERT_STRONG_DROP", 0.2))  # 20% abaixo da referência
+    PRICE_ALERT_EMAIL_TO: str = os.getenv("PRICE_ALERT_EMAIL_TO", "")  # destinatários separados por vírgula
+
+    # Snapshots materializados do dashboard/analytics, recalculados após cada rastreamento
+    DASHBOARD_SNAPSHOTS_ENABLED: bool = os.getenv("DASHBOARD_SNAPSHOTS_ENABLED", "true").lower() == "true"
+    DASHBOARD_SNAPSHOT_PERIODS: str = os.getenv("DASHBOARD_SNAPSHOT_PERIODS", "7,30,90")  # dias, separados por vírgula
+    DASHBOARD_SNAPSHOT_DELAY_SECONDS: float = float(os.getenv("DASHBOARD_SNAPSHOT_DELAY_SECONDS", 30))  # espera sem ingestões
+
+    # Compressão das respostas (brotli se o módulo estiver instalado, senão gzip)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))  # respostas menores seguem sem compressão
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    # Histórico de preços no banco relacional (tabela price_history, particionada por mês no PostgreSQL)
+    PRICE_HISTORY_ENABLED: bool = os.getenv("PRICE_HISTORY_ENABLED", "true").lower() == "true"
+    # Cubo vendedor × produto × dia derivado do histórico (recalcula só os dias tocados em cada ingestão)
+    PRICE_CUBE_ENABLED: bool = os.getenv("PRICE_CUBE_ENABLED", "true").lower() == "true"
+
+    # Arquivos de resultados dos rastreadores (scrapers/resultados)
+    RESULTS_COMPACT_AFTER_DAYS: float = float(os.getenv("RESULTS_COMPACT_AFTER_DAYS", 7))  # zips mensais; 0 desativa
+
+    # Backend das consultas de analytics: elasticsearch, duckdb ou sqlite (embutidos, sem cluster)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "elasticsearch")
+    COLUMNAR_STORAGE_PATH: str = os.getenv("COLUMNAR_STORAGE_PATH", "data/analytics.db")  # ":memory:" na CI
+
+    # Instrumentação das consultas ao Elasticsearch (/api/metrics/elasticsearch)
+    ES_METRICS_ENABLED: bool = os.getenv("ES_METRICS_ENABLED", "true").lower() == "true"
+    ES_SLOW_QUERY_MS: float = float(os.getenv("ES_SLOW_QUERY_MS", 500))
+    ES_SLOW_QUERY_LOG_SIZE: int = int(os.getenv("ES_SLOW_QUERY_LOG_SIZE", 100))
+    ES_PROFILE_SAMPLE_RATE: float = float(os.getenv("ES_PROFILE_SAMPLE_RATE", 0.0))  # 0.0 a 1.0
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,50 @@
+"""
+Serialização JSON das respostas da API.
+
+Com o orjson instalado, as respostas são serializadas por ele (várias vezes
+mais rápido que o json da biblioteca padrão nos payloads grandes de logs,
+buscas e séries de preço); sem ele, cai no json padrão com a mesma saída
+compacta.
+"""
+
+import json
+import math
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+
+def _finite(content: Any) -> Any:
+    """Troca NaN/Infinity por None, como o orjson faz"""
+    if isinstance(content, float):
+        return content if math.isfinite(content) else None
+    if isinstance(content, dict):
+        return {key: _finite(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [_finite(value) for value in content]
+    return content
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serializa conteúdo já convertido por jsonable_encoder em bytes UTF-8"""
+    if orjson is not None:
+        # NaN/Infinity saem como null, em vez de erro do json padrão
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    try:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        # Mesma saída do orjson: NaN/Infinity como null (só percorre o conteúdo quando há algum)
+        return json.dumps(_finite(content), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Classe de resposta padrão da API (orjson quando disponível)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
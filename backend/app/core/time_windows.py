@@ -0,0 +1,59 @@
+"""
+Janelas de tempo usadas pelas consultas de analytics e dashboard.
+
+O início do período é alinhado a um limite fixo (início do dia ou da hora) no
+fuso configurado. Assim, todas as requisições feitas dentro do mesmo dia (ou
+hora) geram exatamente a mesma consulta, o que permite que o request cache do
+Elasticsearch e o cache da aplicação reaproveitem o resultado.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+
+# Alinhamentos aceitos em ANALYTICS_WINDOW_ALIGNMENT
+ALIGNMENTS = ("day", "hour")
+
+
+def _now(tz: ZoneInfo) -> datetime:
+    return datetime.now(tz)
+
+
+def period_start(period_days: int, alignment: Optional[str] = None, timezone: Optional[str] = None) -> datetime:
+    """
+    Retorna o início alinhado de uma janela dos últimos `period_days` dias.
+
+    Args:
+        period_days: Tamanho da janela em dias
+        alignment: "day" ou "hour" (padrão: ANALYTICS_WINDOW_ALIGNMENT)
+        timezone: Fuso usado no alinhamento (padrão: ANALYTICS_TIMEZONE)
+
+    Returns:
+        datetime: Início da janela, sem fuso (os timestamps dos documentos são
+        gravados no horário local do rastreador, sem indicação de fuso)
+    """
+    alignment = alignment or settings.ANALYTICS_WINDOW_ALIGNMENT
+    if alignment not in ALIGNMENTS:
+        raise ValueError(f"Alinhamento inválido: {alignment}")
+
+    tz = ZoneInfo(timezone or settings.ANALYTICS_TIMEZONE)
+    now = _now(tz)
+
+    if alignment == "day":
+        boundary = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        boundary = now.replace(minute=0, second=0, microsecond=0)
+
+    return (boundary - timedelta(days=period_days)).replace(tzinfo=None)
+
+
+def period_start_iso(period_days: int, alignment: Optional[str] = None, timezone: Optional[str] = None) -> str:
+    """Início alinhado da janela em ISO 8601, para filtros no campo timestamp"""
+    return period_start(period_days, alignment, timezone).isoformat()
+
+
+def period_start_day(period_days: int, timezone: Optional[str] = None) -> str:
+    """Primeiro dia da janela (YYYY-MM-DD), para consultas ao resumo diário"""
+    return period_start(period_days, "day", timezone).date().isoformat()
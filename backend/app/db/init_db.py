@@ -1,9 +1,55 @@
+import logging
+
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 from app.core.security import get_password_hash
 from app.models.user import User
+from app.models.product import Product
+from app.models.price_history import PriceHistory  # noqa: F401 (tabela criada pelo create_all)
+from app.models.price_cube import PriceCube  # noqa: F401 (tabela criada pelo create_all)
+from app.core.categories import assign_category
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+def upgrade_products_table(db: Session) -> None:
+    """
+    Adiciona a coluna category a bancos criados antes dela (create_all não altera
+    tabelas existentes) e calcula a categoria dos produtos que ainda não a têm
+    """
+    columns = {column["name"] for column in inspect(db.get_bind()).get_columns("products")}
+    if "category" not in columns:
+        db.execute(text("ALTER TABLE products ADD COLUMN category VARCHAR"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_products_category ON products (category)"))
+        db.commit()
+
+    pending = db.query(Product).filter(Product.category == None).all()
+    for product in pending:
+        product.category = assign_category(product.search_terms, product.family)
+    if pending:
+        db.commit()
+
+def upgrade_price_history_table(db: Session) -> None:
+    """Adiciona a coluna rating a históricos de preço criados antes dela"""
+    columns = {column["name"] for column in inspect(db.get_bind()).get_columns("price_history")}
+    if "rating" not in columns:
+        db.execute(text("ALTER TABLE price_history ADD COLUMN rating FLOAT"))
+        db.commit()
+
+def prepare_price_history() -> None:
+    """Cria antecipadamente as partições mensais do histórico de preços (PostgreSQL)"""
+    from app.services.price_history import price_history_store
+
+    try:
+        price_history_store.prepare()
+    except Exception as e:
+        logger.error(f"Erro ao preparar as partições do histórico de preços: {e}")
+
 def init_db(db: Session) -> None:
+    upgrade_products_table(db)
+    upgrade_price_history_table(db)
+    prepare_price_history()
+
     # Verifica se já existe um usuário admin
     user = db.query(User).filter(User.email == "admin@example.com").first()
     if not user:
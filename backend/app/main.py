@@ -1,13 +1,20 @@
 import os
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.core.config import settings
 from app.db.session import engine, Base, SessionLocal
 from app.db.init_db import init_db
-from app.routers import auth, chat, openai, scraping, users, settings as settings_router, logs, dashboard, products, analytics, data_analysis_ai
+from app.routers import auth, chat, openai, scraping, users, settings as settings_router, logs, dashboard, products, analytics, data_analysis_ai, metrics
 from app.middlewares.logging import LoggingMiddleware
+from app.middlewares.query_metrics import QueryMetricsMiddleware
+from app.middlewares.conditional import ConditionalGetMiddleware
+from app.middlewares.compression import CompressionMiddleware
+from app.core.responses import FastJSONResponse
 from app.middlewares.debug import log_request_details  # Importando o middleware de depuração
+from app.services.elasticsearch_service import get_es_service, ElasticsearchUnavailable
+from app.services.dashboard_snapshots import dashboard_snapshots
 
 # Criar tabelas no banco de dados
 Base.metadata.create_all(bind=engine)
@@ -22,7 +29,9 @@ finally:
 app = FastAPI(
     title="Mercado Livre Tracker API",
     description="API para rastreamento de preços e análise de reputação de produtos no Mercado Livre",
-    version="1.0.0"
+    version="1.0.0",
+    # Serialização com orjson (quando instalado) em todas as rotas
+    default_response_class=FastJSONResponse
 )
 
 # Configurar CORS
@@ -52,6 +61,18 @@ app.add_middleware(
     allow_headers=["*"],
 ) # Adicionar middleware de logging
 app.add_middleware(LoggingMiddleware)
+# Identificar o endpoint nas métricas de consultas ao Elasticsearch
+app.add_middleware(QueryMetricsMiddleware)
+# Responder 304 aos snapshots do dashboard que o cliente já tem (If-None-Match)
+app.add_middleware(ConditionalGetMiddleware)
+# Comprimir respostas grandes (logs, buscas, séries de preço) com brotli/gzip
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_BYTES,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
 
 # Adicionar middleware de depuração para inspecionar requisições
 @app.middleware("http")
@@ -72,6 +93,37 @@ app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"]
 app.include_router(products.router, prefix="/api/products", tags=["Produtos"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])  # Adicionando a rota de analytics
 app.include_router(data_analysis_ai.router, prefix="/api/ai", tags=["Análise de Dados com IA"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Métricas"])
+
+@app.on_event("startup")
+async def connect_elasticsearch():
+    # Conecta em segundo plano: a API sobe mesmo com o Elasticsearch lento ou fora do ar
+    get_es_service().connect_in_background()
+    # Materializa os snapshots do dashboard; se o Elasticsearch ainda não
+    # estiver disponível, a materialização é reagendada
+    dashboard_snapshots.schedule_refresh(0)
+
+@app.exception_handler(ElasticsearchUnavailable)
+async def elasticsearch_unavailable_handler(request: Request, exc: ElasticsearchUnavailable):
+    # Modo degradado: o cliente pode tentar novamente após Retry-After
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={
+            "success": False,
+            "degraded": True,
+            "detail": "Elasticsearch indisponível no momento; tentando reconectar",
+            "retry_after": exc.retry_after
+        }
+    )
+
+@app.get("/api/health", tags=["Saúde"])
+async def health():
+    es_status = get_es_service().status()
+    return {
+        "status": "ok" if es_status["conectado"] else "degraded",
+        "elasticsearch": es_status
+    }
 
 # Rota pública para busca de produtos (sem autenticação)
 @app.get("/api/scraping/search-public", tags=["Scraping Público"])
@@ -111,11 +163,6 @@ async def search_products_public(query: str):
 
         print(f"Encontrados {len(formatted_products)} produtos")
 
-        # Converter para dicionários para visualizar o formato exato da resposta
-        import json
-        response_data = [product.dict() for product in formatted_products]
-        print(f"Resposta enviada ao frontend: {json.dumps(response_data[:2], ensure_ascii=False)}")
-
         return formatted_products
     except Exception as e:
         print(f"Erro na busca pública: {str(e)}")
@@ -145,7 +192,6 @@ async def get_recent_products_public(limit: int = 5):
     try:
         from app.models.product import Product
         from app.db.session import SessionLocal
-        import json
 
         db = SessionLocal()
         try:
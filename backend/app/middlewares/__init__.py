@@ -1,3 +1,6 @@
 from .logging import LoggingMiddleware
+from .query_metrics import QueryMetricsMiddleware
+from .conditional import ConditionalGetMiddleware
+from .compression import CompressionMiddleware
 
-__all__ = ["LoggingMiddleware"]
+__all__ = ["LoggingMiddleware", "QueryMetricsMiddleware", "ConditionalGetMiddleware", "CompressionMiddleware"]
@@ -0,0 +1,201 @@
+import gzip
+import zlib
+from typing import List, Optional, Tuple
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+# Tipos que já chegam comprimidos ou são fluxos contínuos
+EXCLUDED_CONTENT_TYPES = ("image/", "video/", "audio/", "font/", "application/zip",
+                          "application/gzip", "text/event-stream")
+# Acima deste tamanho a compressão de um corpo completo sai do event loop
+THREAD_MINIMUM_SIZE = 256 * 1024
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Escolhe a codificação a partir do Accept-Encoding, respeitando q=0:
+    br (se o módulo brotli estiver instalado), depois gzip; None para identidade
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    def allowed(encoding: str) -> bool:
+        return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Compressor incremental de gzip ou brotli"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress_body(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """
+    Comprime as respostas com brotli ou gzip conforme o Accept-Encoding do
+    cliente. Corpos menores que minimum_size seguem sem compressão; respostas
+    em streaming (exportações) são comprimidas por partes. O ETag de uma
+    resposta comprimida vira fraco (W/), já que o corpo enviado muda com a
+    codificação.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressionResponder(self, encoding, send).run(scope, receive)
+
+
+class _CompressionResponder:
+    """Estado da compressão de uma resposta"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.buffer: List[bytes] = []
+        self.buffered = 0
+
+    async def run(self, scope: Scope, receive: Receive) -> None:
+        await self.middleware.app(scope, receive, self.send_wrapper)
+
+    def _should_skip(self, headers: Headers, status: int) -> bool:
+        content_type = headers.get("content-type", "").lower()
+        return (
+            "content-encoding" in headers
+            or status in (204, 206, 304)
+            or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+        )
+
+    def _compressed_headers(self, extra: List[Tuple[str, str]]) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        _weaken_etag(headers)
+        for name, value in extra:
+            headers[name] = value
+        return headers
+
+    async def send_wrapper(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = self._should_skip(headers, message["status"])
+            if message["status"] == 304:
+                # O 304 repete o ETag que a resposta comprimida teria
+                _weaken_etag(MutableHeaders(raw=message["headers"]))
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # Acumula até saber se o corpo passa de minimum_size: atrás de
+            # middlewares HTTP o corpo chega em partes mesmo quando é pequeno
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if more_body and self.buffered < self.middleware.minimum_size:
+                return
+
+            body = b"".join(self.buffer)
+            self.buffer = []
+            if not more_body:
+                await self._send_complete(body)
+                return
+
+            # Streaming (exportações): comprime cada parte conforme chega
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            self._compressed_headers([])
+            await self.send(self.start_message)
+
+        chunk = self.compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_complete(self, body: bytes) -> None:
+        """Corpo completo (o caso das respostas JSON): comprime de uma vez se passar do limite"""
+        if len(body) < self.middleware.minimum_size:
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        args = (body, self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            compressed = await anyio.to_thread.run_sync(compress_body, *args)
+        else:
+            compressed = compress_body(*args)
+        self._compressed_headers([("Content-Length", str(len(compressed)))])
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,36 @@
+from typing import Callable
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparação fraca do If-None-Match (RFC 9110): ignora o prefixo W/"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+class ConditionalGetMiddleware(BaseHTTPMiddleware):
+    """
+    Responde 304 Not Modified a GETs cujo If-None-Match coincide com o ETag da
+    resposta (os snapshots materializados do dashboard), sem enviar o corpo.
+    """
+
+    def __init__(self, app: ASGIApp):
+        super().__init__(app)
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        response = await call_next(request)
+
+        if_none_match = request.headers.get("if-none-match")
+        etag = response.headers.get("etag")
+        if (request.method in ("GET", "HEAD") and response.status_code == 200
+                and if_none_match and etag and etag_matches(if_none_match, etag)):
+            headers = {
+                name: value for name, value in response.headers.items()
+                if name.lower() in ("etag", "cache-control", "vary", "x-snapshot-version", "x-snapshot-materialized-at")
+            }
+            return Response(status_code=304, headers=headers)
+        return response
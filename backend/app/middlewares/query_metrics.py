@@ -0,0 +1,23 @@
+from typing import Callable
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp
+
+from app.services.es_metrics import current_endpoint
+
+
+class QueryMetricsMiddleware(BaseHTTPMiddleware):
+    """
+    Identifica o endpoint da requisição para que as consultas ao Elasticsearch
+    feitas durante o processamento sejam agregadas por rota.
+    """
+
+    def __init__(self, app: ASGIApp):
+        super().__init__(app)
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        token = current_endpoint.set(f"{request.method} {request.url.path}")
+        try:
+            return await call_next(request)
+        finally:
+            current_endpoint.reset(token)
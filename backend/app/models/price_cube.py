@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, PrimaryKeyConstraint
+
+from app.db.session import Base
+
+class PriceCube(Base):
+    """
+    Cubo de métricas vendedor × produto × dia, derivado da tabela price_history
+    e recalculado pelo app.services.price_cube só para os dias tocados em cada
+    ingestão. As somas (e não as médias) são guardadas para que qualquer corte
+    do cubo possa ser reagregado exatamente.
+    """
+    __tablename__ = "price_cube"
+
+    product_key = Column(String, nullable=False)  # rollup_product_key: "db:<id>" ou "title:<título>"
+    seller = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    product_id = Column(Integer, nullable=True)  # Produto cadastrado (product_db_id), quando houver
+
+    min_price = Column(Float, nullable=False)
+    max_price = Column(Float, nullable=False)
+    sum_price = Column(Float, nullable=False)
+    snapshots = Column(Integer, nullable=False)  # Snapshots com preço no dia
+    listings = Column(Integer, nullable=False)  # Anúncios distintos no dia
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_count = Column(Integer, nullable=False, default=0)
+
+    refreshed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("product_key", "seller", "day"),
+        Index("ix_price_cube_day", "day"),
+        Index("ix_price_cube_product_id_day", "product_id", "day"),
+        Index("ix_price_cube_seller_day", "seller", "day"),
+    )
+
+    def __repr__(self):
+        return f"<PriceCube(product_key='{self.product_key}', seller='{self.seller}', day={self.day})>"
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, PrimaryKeyConstraint
+
+from app.db.session import Base
+
+class PriceHistory(Base):
+    """
+    Histórico de preços: um registro por snapshot ingerido (mesmo ID do
+    documento no Elasticsearch). No PostgreSQL a tabela é particionada por mês
+    em "timestamp" (partições price_history_AAAAMM, criadas pelo
+    app.services.price_history), por isso a chave primária inclui o timestamp.
+    """
+    __tablename__ = "price_history"
+
+    snapshot_id = Column(String(64), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    product_id = Column(Integer, nullable=True)  # Produto cadastrado (product_db_id), quando houver
+    product_key = Column(String, nullable=False)  # rollup_product_key: "db:<id>" ou "title:<título>"
+    listing_id = Column(String, nullable=True)
+    seller = Column(String, nullable=True)
+    price = Column(Float, nullable=False)
+    rating = Column(Float, nullable=True)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("snapshot_id", "timestamp"),
+        # Séries por produto: varredura de um intervalo de tempo do produto
+        Index("ix_price_history_product_id_timestamp", "product_id", "timestamp"),
+        Index("ix_price_history_product_key_timestamp", "product_key", "timestamp"),
+        # Dados chegam em ordem de tempo: BRIN é minúsculo e basta para filtros por período
+        Index("ix_price_history_timestamp_brin", "timestamp", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    def __repr__(self):
+        return f"<PriceHistory(snapshot_id='{self.snapshot_id}', product_key='{self.product_key}', price={self.price})>"
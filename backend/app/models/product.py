@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Table
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Table, event
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from typing import List, Optional
 
 from app.db.session import Base
+from app.core.categories import assign_category
 
 class Product(Base):
     __tablename__ = "products"
@@ -14,6 +15,7 @@ class Product(Base):
     search_terms = Column(String, nullable=False)  # Termos de busca para ML
     url = Column(String)
     family = Column(String)
+    category = Column(String, index=True)  # Calculada ao salvar (assign_category)
     printer_models = Column(JSON)  # Lista de modelos de impressora compatíveis
     reference_price = Column(Float, default=0.0)
     check_interval = Column(Integer, default=6)  # Em horas
@@ -25,3 +27,10 @@ class Product(Base):
     last_search = Column(DateTime, nullable=True)
 
     # Relacionamentos podem ser adicionados aqui para histórico de preços, etc.
+
+
+@event.listens_for(Product, "before_insert")
+@event.listens_for(Product, "before_update")
+def _set_category(mapper, connection, product: Product) -> None:
+    """Calcula a categoria uma única vez, quando o produto é salvo"""
+    product.category = assign_category(product.search_terms, product.family)
@@ -1,18 +1,40 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import List, Dict, Any, Optional
-from ..services.elasticsearch_service import ElasticsearchService
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Iterator
+from ..services.elasticsearch_service import get_es_service, rollup_product_key, ElasticsearchUnavailable
+from ..services import analytics_queries as queries
+from ..services.query_cache import cached_query
+from ..services.dashboard_snapshots import materialized
+from ..services.storage_backend import get_storage_backend
+from ..services import search_results_stats
+from ..services.results_archive import results_archive
+from ..services.price_history import price_history_store
+from ..services.price_cube import price_cube
+from ..services.timeseries import choose_interval, downsample_points, DEFAULT_RESOLUTION, MIN_RESOLUTION, MAX_RESOLUTION
+from ..core.time_windows import period_start, period_start_iso
 from ..core.security import get_current_user
+from ..models.user import User
+import os
+import csv
+import json
 import logging
+from io import StringIO
 from datetime import datetime, timedelta
 
 router = APIRouter(tags=["analytics"])
 
-# Instanciando o serviço Elasticsearch
-es_service = ElasticsearchService()
+# Serviço Elasticsearch compartilhado (conecta no primeiro uso)
+es_service = get_es_service()
 
 logger = logging.getLogger(__name__)
 
+# Colunas exportadas em CSV quando nenhum campo é informado
+DEFAULT_EXPORT_FIELDS = ["timestamp", "title", "price", "seller", "url", "search_term", "rating", "product_db_id"]
+
 @router.get("/price-distribution")
+@materialized("analytics/price-distribution")
+@cached_query("analytics/price-distribution")
 async def get_price_distribution(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -20,150 +42,42 @@ async def get_price_distribution(
     Retorna a distribuição de produtos por faixas de preço
     """
     try:
-        # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "price_ranges": {
-                    "range": {
-                        "field": "price",  # Usando "price" em vez de "preco"
-                        "ranges": [
-                            { "to": 100 },
-                            { "from": 100, "to": 200 },
-                            { "from": 200, "to": 300 },
-                            { "from": 300, "to": 400 },
-                            { "from": 400, "to": 500 },
-                            { "from": 500 }
-                        ]
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
-
-        # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados
-        price_distribution = []
-        for bucket in response["aggregations"]["price_ranges"]["buckets"]:
-            range_label = "R$ 0-100" if bucket["key"] == "*-100.0" else \
-                         f"R$ {int(bucket['from'])}-{int(bucket['to'])}" if "from" in bucket and "to" in bucket else \
-                         f"R$ {int(bucket['from'])}+" if "from" in bucket else \
-                         "Sem preço"
-
-            price_distribution.append({
-                "range": range_label,
-                "count": bucket["doc_count"]
-            })
-
-        return price_distribution
+        return get_storage_backend(es_service).price_distribution(period_days)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar distribuição de preços: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar distribui��ão de preços: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar distribuição de preços: {str(e)}")
 
 @router.get("/price-evolution")
+@materialized("analytics/price-evolution", product="all")
+@cached_query("analytics/price-evolution")
 async def get_price_evolution(
     product: str = Query(..., description="Nome do produto ou 'all' para todos"),
-    period_days: int = Query(30, description="Período em dias para análise")
+    period_days: int = Query(30, description="Período em dias para análise"),
+    resolution: int = Query(DEFAULT_RESOLUTION, ge=MIN_RESOLUTION, le=MAX_RESOLUTION,
+                            description="Número máximo de pontos retornados")
 ):
     """
-    Retorna a evolução de preço de produtos ao longo do tempo
+    Retorna a evolução de preço de produtos ao longo do tempo,
+    consultando o resumo diário de preços em vez dos documentos brutos.
+    O intervalo do histograma é escolhido conforme a resolução pedida.
     """
     try:
-        # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Prepara a consulta base
-        query_base = {
-            "range": {
-                "timestamp": {
-                    "gte": start_date
-                }
-            }
-        }
-
-        # Adiciona filtro de produto se não for 'all'
-        if product.lower() != 'all':
-            query = {
-                "bool": {
-                    "must": [
-                        query_base,
-                        {
-                            "match": {
-                                "title": product  # Usando "title" em vez de "titulo"
-                            }
-                        }
-                    ]
-                }
-            }
-        else:
-            query = query_base
-
-        # Cria a consulta para o Elasticsearch com agregação por data
-        agg_query = {
-            "query": query,
-            "aggs": {
-                "price_over_time": {
-                    "date_histogram": {
-                        "field": "timestamp",
-                        "calendar_interval": "1d"  # Intervalo de 1 dia
-                    },
-                    "aggs": {
-                        "avg_price": {
-                            "avg": {
-                                "field": "price"  # Usando "price" em vez de "preco"
-                            }
-                        },
-                        "min_price": {
-                            "min": {
-                                "field": "price"  # Usando "price" em vez de "preco"
-                            }
-                        },
-                        "max_price": {
-                            "max": {
-                                "field": "price"  # Usando "price" em vez de "preco"
-                            }
-                        }
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        interval = choose_interval(period_days, resolution)
+        price_history = get_storage_backend(es_service).price_evolution(product, period_days, interval)
 
-        # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=agg_query)
-
-        # Processa os resultados
-        price_history = []
-        for bucket in response["aggregations"]["price_over_time"]["buckets"]:
-            # Só inclui pontos que tenham dados
-            if bucket["doc_count"] > 0:
-                # Formata a data como YYYY-MM
-                date_str = datetime.fromtimestamp(bucket["key"] / 1000).strftime('%Y-%m')
-
-                price_history.append({
-                    "date": date_str,
-                    "avgPrice": round(bucket["avg_price"]["value"], 2) if bucket["avg_price"]["value"] is not None else 0,
-                    "minPrice": round(bucket["min_price"]["value"], 2) if bucket["min_price"]["value"] is not None else 0,
-                    "maxPrice": round(bucket["max_price"]["value"], 2) if bucket["max_price"]["value"] is not None else 0
-                })
-
-        return price_history
+        # Garante o limite de pontos mesmo quando o histograma gera buckets a mais
+        return downsample_points(price_history, resolution, "timestamp", "avgPrice")
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar evolução de preço: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar evolução de preço: {str(e)}")
 
 @router.get("/search-trends")
+@materialized("analytics/search-trends")
+@cached_query("analytics/search-trends")
 async def get_search_trends(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -172,45 +86,21 @@ async def get_search_trends(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "search_terms": {
-                    "terms": {
-                        "field": "search_term.keyword",  # Usando "search_term" em vez de "busca"
-                        "size": 10
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados
-        search_trends = []
-        for bucket in response["aggregations"]["search_terms"]["buckets"]:
-            search_trends.append({
-                "term": bucket["key"],
-                "count": bucket["doc_count"]
-            })
+        response = es_service.client.search(index="hp-traker-ml", body=queries.search_trends_query(start_date))
 
-        return search_trends
+        return queries.parse_search_trends(response)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar tendências de busca: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar tendências de busca: {str(e)}")
 
 @router.get("/top-products")
+@materialized("analytics/top-products")
+@cached_query("analytics/top-products")
 async def get_top_products(
     size: int = Query(10, description="Número de produtos a retornar"),
     period_days: int = Query(30, description="Período em dias para análise")
@@ -221,11 +111,15 @@ async def get_top_products(
     try:
         # Obtém os produtos do Elasticsearch
         return es_service.get_top_products(size, period_days)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar top produtos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar top produtos: {str(e)}")
 
 @router.get("/daily-searches")
+@materialized("analytics/daily-searches")
+@cached_query("analytics/daily-searches")
 async def get_daily_searches(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -234,48 +128,21 @@ async def get_daily_searches(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "searches_per_day": {
-                    "date_histogram": {
-                        "field": "timestamp",
-                        "calendar_interval": "1d"
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
+        response = es_service.client.search(index="hp-traker-ml", body=queries.daily_searches_query(start_date))
 
-        # Processa os resultados
-        daily_searches = []
-        for bucket in response["aggregations"]["searches_per_day"]["buckets"]:
-            # Formata a data como YYYY-MM-DD
-            date_str = datetime.fromtimestamp(bucket["key"] / 1000).strftime('%Y-%m-%d')
-
-            daily_searches.append({
-                "date": date_str,
-                "count": bucket["doc_count"]
-            })
-
-        return daily_searches
+        return queries.parse_daily_searches(response)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar buscas diárias: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar buscas diárias: {str(e)}")
 
 @router.get("/top-rated-products")
+@materialized("analytics/top-rated-products")
+@cached_query("analytics/top-rated-products")
 async def get_top_rated_products(
     size: int = Query(10, description="Número de produtos a retornar"),
     period_days: int = Query(30, description="Período em dias para análise")
@@ -285,306 +152,371 @@ async def get_top_rated_products(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "sort": [
-                {
-                    "rating": {  # Usando "rating" em vez de "avaliacao"
-                        "order": "desc"
-                    }
-                }
-            ],
-            "size": size
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados
-        top_rated = []
-        for hit in response["hits"]["hits"]:
-            product = hit["_source"]
-            top_rated.append({
-                "id": product.get("id", hit["_id"]),
-                "title": product.get("title", "Sem título"),  # Usando "title" em vez de "titulo"
-                "price": product.get("price", 0),  # Usando "price" em vez de "preco"
-                "rating": product.get("rating", 0),  # Usando "rating" em vez de "avaliacao"
-                "seller": product.get("seller", "Desconhecido"),  # Usando "seller" em vez de "vendedor"
-                "timestamp": product.get("timestamp", "")
-            })
-
-        return top_rated
+        response = es_service.client.search(index="hp-traker-ml", body=queries.top_rated_query(start_date, size))
+
+        return queries.parse_top_rated(response)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar produtos melhor avaliados: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar produtos melhor avaliados: {str(e)}")
 
 @router.get("/category-distribution")
+@materialized("analytics/category-distribution")
+@cached_query("analytics/category-distribution")
 async def get_category_distribution(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
     """
-    Retorna a distribuição de produtos por categoria com base nas categorias reais
-    da base de dados em vez de extrair do título
+    Retorna a distribuição de produtos por categoria. A categoria de cada
+    documento é gravada na ingestão a partir das categorias dos produtos
+    cadastrados, então a consulta é uma única agregação
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Obter produtos cadastrados no banco de dados para definir categorias válidas
-        from ..models.product import Product
-        from ..db.session import SessionLocal
-
-        db = SessionLocal()
-        registered_products = db.query(Product).filter(Product.is_active == True).all()
-
-        # Extrair informações de família/categoria dos produtos registrados
-        valid_families = {}
-        for product in registered_products:
-            family = product.family or "Sem categoria"
-            if family not in valid_families:
-                valid_families[family] = []
-            valid_families[family].append(product.search_terms.lower() if product.search_terms else "")
-
-        # Adicionar categorias principais com base nos produtos registrados
-        main_categories = {
-            "Cartuchos": ["cartucho", "tinta", "hp 6", "hp 9"],
-            "Tintas": ["tinta", "garrafa", "gt", "ink"],
-            "Suprimentos": ["kit", "combo", "refil"]
-        }
-
-        # Mapear termos de busca para categorias principais
-        search_term_to_category = {}
-        for product in registered_products:
-            if not product.search_terms:
-                continue
-
-            term = product.search_terms.lower()
-
-            # Determinar a categoria principal com base no termo de busca
-            assigned_category = None
-            for category, keywords in main_categories.items():
-                if any(keyword in term for keyword in keywords):
-                    assigned_category = category
-                    break
-
-            # Se não foi categorizado em nenhuma principal, usar a família
-            if not assigned_category:
-                assigned_category = product.family or "Outros"
-
-            search_term_to_category[term] = assigned_category
-
-        # Fechar a conexão com o banco de dados
-        db.close()
-
-        # Cria a consulta para o Elasticsearch para buscar termos de busca
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "search_terms": {
-                    "terms": {
-                        "field": "search_term.keyword",
-                        "size": 100
-                    }
-                }
-            },
-            "size": 0
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Inicializar contagem de categorias
-        category_counts = {}
-
-        # Processar os termos de busca encontrados no Elasticsearch
-        for bucket in response["aggregations"]["search_terms"]["buckets"]:
-            search_term = bucket["key"].lower()
-            count = bucket["doc_count"]
-
-            # Encontrar a categoria correspondente ao termo de busca
-            category = "Outros"  # Categoria padrão
-
-            # Verificar nas categorias mapeadas
-            if search_term in search_term_to_category:
-                category = search_term_to_category[search_term]
-            else:
-                # Se não encontrar o termo exato, verificar se o termo contém alguma das palavras-chave
-                for cat, keywords in main_categories.items():
-                    if any(keyword in search_term for keyword in keywords):
-                        category = cat
-                        break
-
-            # Adicionar à contagem
-            if category not in category_counts:
-                category_counts[category] = 0
-            category_counts[category] += count
-
-        # Formatar para o resultado esperado
-        category_distribution = [
-            {"name": category, "value": count}
-            for category, count in category_counts.items()
-            if count > 0  # Exclui categorias vazias
-        ]
-
-        # Ordenar por contagem (maior primeiro)
-        category_distribution.sort(key=lambda x: x["value"], reverse=True)
-
-        return category_distribution
+        response = es_service.client.search(index="hp-traker-ml", body=queries.category_distribution_query(start_date))
+
+        return queries.parse_category_distribution(response)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar distribuição por categoria: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar distribuição por categoria: {str(e)}")
 
 @router.get("/stock-availability")
+@materialized("analytics/stock-availability")
+@cached_query("analytics/stock-availability")
 async def get_stock_availability(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
     """
-    Retorna a disponibilidade de estoque dos produtos inferida pelos dados
+    Retorna a disponibilidade de estoque dos produtos, agregando o status
+    calculado na ingestão (availability_status) sobre todo o período
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch para obter todos os produtos
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "size": 1000,  # Limitar a 1000 resultados para não sobrecarregar
-            "_source": ["price", "title", "free_shipping"]  # Usando campos em inglês
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Categorias de disponibilidade
-        availability_counts = {
-            "Em Estoque": 0,
-            "Frete Grátis": 0,
-            "Promoção": 0,
-            "Esgotado": 0
-        }
-
-        # Processar os produtos
-        for hit in response["hits"]["hits"]:
-            source = hit["_source"]
-
-            # Verificar frete grátis
-            if source.get("free_shipping") == True:
-                availability_counts["Frete Grátis"] += 1
-            else:
-                availability_counts["Em Estoque"] += 1
-
-            # Verificar se parece ser uma promoção pelo título
-            title = source.get("title", "").lower()
-            if "promoção" in title or "promocao" in title or "desconto" in title or "oferta" in title:
-                availability_counts["Promoção"] += 1
-
-            # Produtos sem preço ou com preço zero são considerados esgotados
-            if source.get("price") is None or source.get("price") == 0:
-                availability_counts["Esgotado"] += 1
-                # Subtrair de Em Estoque se foi contabilizado lá
-                if source.get("free_shipping") != True:
-                    availability_counts["Em Estoque"] -= 1
-
-        # Formatar para o resultado esperado
-        stock_availability = [
-            {"status": status, "count": count}
-            for status, count in availability_counts.items()
-            if count > 0  # Exclui status sem ocorrências
-        ]
-
-        # Ordenar por contagem (maior primeiro)
-        stock_availability.sort(key=lambda x: x["count"], reverse=True)
-
-        return stock_availability
+        response = es_service.client.search(index="hp-traker-ml", body=queries.stock_availability_query(start_date))
+
+        return queries.parse_stock_availability(response)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar disponibilidade de estoque: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar disponibilidade de estoque: {str(e)}")
 
 @router.get("/seller-performance")
+@materialized("analytics/seller-performance")
+@cached_query("analytics/seller-performance")
 async def get_seller_performance(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
     """
-    Retorna o desempenho dos principais vendedores
+    Retorna o desempenho dos principais vendedores, ranqueados sobre todos os
+    vendedores do período
     """
     try:
-        # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "sellers": {
-                    "terms": {
-                        "field": "seller.keyword",  # Usando "seller" em vez de "vendedor"
-                        "size": 10
-                    },
-                    "aggs": {
-                        "avg_rating": {
-                            "avg": {
-                                "field": "rating"  # Usando "rating" em vez de "avaliacao"
-                            }
-                        },
-                        "avg_price": {
-                            "avg": {
-                                "field": "price"  # Usando "price" em vez de "preco"
-                            }
-                        }
-                    }
-                }
-            },
-            "size": 0
-        }
-
-        # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados
-        seller_performance = []
-        for bucket in response["aggregations"]["sellers"]["buckets"]:
-            # Estimar número de vendas baseado em popularidade (doc_count)
-            estimated_sales = bucket["doc_count"] * 10  # Multiplicador arbitrário para ilustração
-
-            seller_performance.append({
-                "name": bucket["key"] or "Desconhecido",
-                "reputation": round(bucket["avg_rating"]["value"] or 4.0, 1),  # Default para 4.0 se null
-                "sales": estimated_sales,
-                "products": bucket["doc_count"],
-                "avgPrice": round(bucket["avg_price"]["value"] or 0, 2)
-            })
-
-        # Ordena por número de produtos (popularidade)
-        seller_performance.sort(key=lambda x: x["products"], reverse=True)
-
-        return seller_performance
+        return get_storage_backend(es_service).seller_performance(period_days)
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar desempenho de vendedores: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar desempenho de vendedores: {str(e)}")
+
+@router.get("/sellers")
+@materialized("analytics/sellers")
+@cached_query("analytics/sellers")
+async def get_sellers(
+    period_days: int = Query(30, description="Período em dias para análise"),
+    size: int = Query(100, ge=1, le=1000, description="Vendedores por página"),
+    cursor: Optional[str] = Query(None, description="Cursor next_cursor retornado pela página anterior")
+):
+    """
+    Retorna as estatísticas de todos os vendedores do período, paginadas por
+    cursor em ordem de nome: snapshots, anúncios distintos, percentis de preço
+    e avaliações
+    """
+    try:
+        after = queries.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return get_storage_backend(es_service).seller_stats(period_days, size, after)
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar estatísticas de vendedores: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar estatísticas de vendedores: {str(e)}")
+
+@router.get("/reviews")
+@cached_query("analytics/reviews")
+async def get_reviews(
+    listing_id: Optional[str] = Query(None, description="ID do anúncio (ex.: MLB123456)"),
+    product_db_id: Optional[int] = Query(None, description="ID do produto cadastrado"),
+    size: int = Query(50, ge=1, le=500, description="Número de comentários a retornar"),
+    offset: int = Query(0, ge=0, description="Deslocamento para paginação")
+):
+    """
+    Retorna os comentários de um anúncio ou produto, armazenados no índice de avaliações
+    """
+    try:
+        return es_service.get_reviews(listing_id, product_db_id, size, offset)
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar comentários: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar comentários: {str(e)}")
+
+@router.get("/listings/{listing_id}")
+@cached_query("analytics/listings")
+async def get_listing(
+    listing_id: str,
+    include_reviews: bool = Query(True, description="Incluir os comentários do anúncio"),
+    reviews_size: int = Query(50, ge=1, le=500, description="Número de comentários a retornar")
+):
+    """
+    Retorna o snapshot mais recente de um anúncio junto com seus comentários
+    """
+    try:
+        listing = es_service.get_listing(listing_id, include_reviews, reviews_size)
+        if listing["snapshot"] is None:
+            raise HTTPException(status_code=404, detail=f"Anúncio {listing_id} não encontrado")
+        return listing
+    except HTTPException:
+        raise
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar anúncio: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar anúncio: {str(e)}")
+
+@router.get("/price-history")
+@cached_query("analytics/price-history")
+async def get_price_history(
+    product_db_id: Optional[int] = Query(None, description="ID do produto cadastrado"),
+    title: Optional[str] = Query(None, description="Título do produto (documentos sem produto cadastrado)"),
+    seller: Optional[str] = Query(None, description="Vendedor (opcional; sem ele, todos os vendedores)"),
+    period_days: int = Query(30, ge=1, description="Período em dias para análise"),
+    resolution: int = Query(DEFAULT_RESOLUTION, ge=MIN_RESOLUTION, le=MAX_RESOLUTION,
+                            description="Número máximo de pontos retornados")
+):
+    """
+    Retorna o histórico de preço de um produto (médio, mínimo e máximo por
+    intervalo) a partir da tabela price_history do banco relacional, sem
+    consultar o Elasticsearch
+    """
+    if product_db_id is None and not title:
+        raise HTTPException(status_code=400, detail="Informe product_db_id ou title")
+
+    try:
+        interval_days = int(choose_interval(period_days, resolution)[:-1])
+        product_key = None if product_db_id is not None else rollup_product_key({"title": title})
+        points = await run_in_threadpool(
+            price_history_store.history, period_start(period_days), interval_days,
+            product_db_id, product_key, seller
+        )
+        return downsample_points(points, resolution, "timestamp", "avgPrice")
+    except Exception as e:
+        logger.error(f"Erro ao buscar histórico de preço: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar histórico de preço: {str(e)}")
+
+@router.get("/cube")
+@cached_query("analytics/cube")
+async def get_price_cube(
+    dimensions: str = Query("seller,product", description="Dimensões separadas por vírgula: seller, product, day, category"),
+    period_days: int = Query(30, ge=1, description="Período em dias (ignorado se start_date for informado)"),
+    start_date: Optional[str] = Query(None, description="Dia inicial (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Dia final (YYYY-MM-DD)"),
+    product_db_id: Optional[int] = Query(None, description="ID do produto cadastrado"),
+    title: Optional[str] = Query(None, description="Título do produto (documentos sem produto cadastrado)"),
+    seller: Optional[str] = Query(None, description="Vendedor"),
+    category: Optional[str] = Query(None, description="Categoria do produto cadastrado"),
+    below_reference: bool = Query(False, description="Apenas vendedor × produto × dia com preço abaixo da referência"),
+    order_by: str = Query("snapshots", description="Métrica de ordenação"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Ordem (asc ou desc)"),
+    size: int = Query(100, ge=1, le=1000, description="Número máximo de linhas")
+):
+    """
+    Fatia o cubo vendedor × produto × dia (preço mínimo, médio e máximo,
+    snapshots, anúncios distintos, avaliação média e dias abaixo do preço de
+    referência), mantido incrementalmente na ingestão. Ex.: vendedores abaixo
+    da referência de um produto no trimestre:
+    ?dimensions=seller&product_db_id=12&period_days=90&below_reference=true&order_by=min_price&order=asc
+    """
+    dimension_list = [dimension.strip() for dimension in dimensions.split(",") if dimension.strip()]
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else period_start(period_days).date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else datetime.now().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato YYYY-MM-DD")
+
+    product_key = None
+    if product_db_id is None and title:
+        product_key = rollup_product_key({"title": title})
+
+    try:
+        rows = await run_in_threadpool(
+            price_cube.query, start, end, dimension_list,
+            product_db_id, product_key, seller, category, below_reference,
+            order_by, order == "desc", size
+        )
+        return {"success": True, "data": rows, "start_date": start.isoformat(), "end_date": end.isoformat()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao consultar o cubo de preços: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar o cubo de preços: {str(e)}")
+
+@router.get("/price-stats")
+@cached_query("analytics/price-stats")
+async def get_price_stats(
+    product_db_id: Optional[int] = Query(None, description="ID do produto cadastrado"),
+    title: Optional[str] = Query(None, description="Título do produto (documentos sem produto cadastrado)"),
+    seller: Optional[str] = Query(None, description="Vendedor (opcional; sem ele, todos os vendedores)")
+):
+    """
+    Retorna as estatísticas acumuladas de preço de um produto (média, desvio
+    padrão, EWMA, mínimo, máximo e último preço), mantidas na ingestão sem
+    percorrer o histórico
+    """
+    if product_db_id is None and not title:
+        raise HTTPException(status_code=400, detail="Informe product_db_id ou title")
+
+    try:
+        product_key = rollup_product_key({"product_db_id": product_db_id, "title": title})
+        return es_service.get_price_stats(product_key, seller)
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar estatísticas de preço: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar estatísticas de preço: {str(e)}")
+
+@router.get("/price-alerts")
+async def get_price_alerts(
+    product_db_id: Optional[int] = Query(None, description="ID do produto cadastrado"),
+    level: Optional[str] = Query(None, pattern="^(abaixo_referencia|queda_forte)$", description="Nível do alerta"),
+    size: int = Query(50, ge=1, le=500, description="Número de alertas a retornar"),
+    offset: int = Query(0, ge=0, description="Deslocamento para paginação")
+):
+    """
+    Retorna os alertas de preço gerados na ingestão quando um anúncio fica abaixo
+    do preço de referência do produto cadastrado
+    """
+    try:
+        return es_service.get_price_alerts(product_db_id, level, size, offset)
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar alertas de preço: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar alertas de preço: {str(e)}")
+
+@router.get("/search-results")
+async def get_search_results_stats(
+    period_days: Optional[int] = Query(None, ge=1, description="Analisa todas as buscas dos últimos N dias"),
+    files: Optional[str] = Query(None, description="Arquivos ultima_busca_*.json separados por vírgula"),
+    term: Optional[str] = Query(None, description="Apenas as buscas que incluíram este termo"),
+    bins: int = Query(20, ge=1, le=200, description="Número de faixas do histograma de preços")
+):
+    """
+    Estatísticas dos resultados salvos pelo rastreador (scrapers/resultados):
+    faixa de preços com percentis e histograma, vendedores, modelos de cartucho
+    e detalhamento por modelo. Sem parâmetros, analisa a última busca. Os
+    arquivos vêm do manifesto de resultados, inclusive os já compactados.
+    """
+    try:
+        if period_days:
+            paths = search_results_stats.list_result_files(start=datetime.now() - timedelta(days=period_days), term=term)
+        elif files:
+            paths = []
+            for name in files.split(","):
+                name = os.path.basename(name.strip())
+                if not search_results_stats.RESULT_FILE_PATTERN.match(name):
+                    raise HTTPException(status_code=400, detail=f"Arquivo de resultados inválido: {name}")
+                path = os.path.join(search_results_stats.RESULTS_DIR, name)
+                if not os.path.exists(path) and not results_archive.get(name):
+                    raise HTTPException(status_code=404, detail=f"Arquivo de resultados não encontrado: {name}")
+                paths.append(path)
+        else:
+            paths = search_results_stats.list_result_files(term=term)[-1:]
+
+        # Cálculo pesado em períodos longos: fora do event loop
+        stats = await run_in_threadpool(search_results_stats.evaluate_result_files, paths, bins)
+        if "erro" in stats:
+            raise HTTPException(status_code=404, detail=stats["erro"])
+
+        return {"success": True, "data": stats}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao avaliar resultados de busca: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao avaliar resultados de busca: {str(e)}")
+
+@router.get("/export")
+async def export_products(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de exportação (ndjson ou csv)"),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (padrão: todos em NDJSON)"),
+    start_date: Optional[str] = Query(None, description="Data inicial (ISO 8601)"),
+    end_date: Optional[str] = Query(None, description="Data final (ISO 8601)"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Exporta todo o índice de produtos em streaming (NDJSON ou CSV).
+    Os documentos são lidos com point-in-time e search_after, então o
+    consumo de memória não depende do tamanho do índice.
+    """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    if format == "csv" and not field_list:
+        field_list = DEFAULT_EXPORT_FIELDS
+
+    # Filtro opcional por período
+    time_range = {}
+    for key, value in (("gte", start_date), ("lte", end_date)):
+        if value:
+            try:
+                time_range[key] = datetime.fromisoformat(value).isoformat()
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Data inválida: {value}")
+    query = {"range": {"timestamp": time_range}} if time_range else None
+
+    # Falha antes de iniciar o streaming quando o Elasticsearch está indisponível
+    es_service.client
+
+    logger.info(f"Exportação {format} iniciada por {current_user.email} (campos: {field_list or 'todos'})")
+
+    def generate_ndjson() -> Iterator[str]:
+        for doc in es_service.iter_documents(query=query, fields=field_list):
+            yield json.dumps(doc, ensure_ascii=False, default=str) + "\n"
+
+    def generate_csv() -> Iterator[str]:
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(field_list)
+        for doc in es_service.iter_documents(query=query, fields=field_list):
+            writer.writerow([
+                json.dumps(doc.get(field), ensure_ascii=False) if isinstance(doc.get(field), (dict, list)) else doc.get(field, "")
+                for field in field_list
+            ])
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if format == "csv":
+        content, media_type, extension = generate_csv(), "text/csv", "csv"
+    else:
+        content, media_type, extension = generate_ndjson(), "application/x-ndjson", "ndjson"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=produtos_export_{timestamp}.{extension}"}
+    )
@@ -1,20 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Dict, Any, Optional
-from ..services.elasticsearch_service import ElasticsearchService
+from ..services.elasticsearch_service import get_es_service, ElasticsearchUnavailable, ES_INDEX, ES_ROLLUP_INDEX
 from ..services.openai_service import OpenAIService
-from ..core.security import get_current_user
+from ..services import analytics_queries as queries
+from ..services.query_cache import cached_query
+from ..services.dashboard_snapshots import materialized, dashboard_snapshots
+from ..services.storage_backend import get_storage_backend, ElasticsearchBackend, SELLER_STATS_PAGE_SIZE
+from ..services.product_cache import resolve_registered_products
+from ..services.timeseries import choose_interval, downsample_points, DEFAULT_RESOLUTION, MIN_RESOLUTION, MAX_RESOLUTION
+from ..core.time_windows import period_start_iso, period_start_day
+from ..core.security import get_current_user, get_current_active_superuser
+from ..models.user import User
 import logging
-from datetime import datetime, timedelta
 
 router = APIRouter(tags=["dashboard"])
 
-# Instanciando os serviços
-es_service = ElasticsearchService()
+# Serviços (o Elasticsearch conecta no primeiro uso)
+es_service = get_es_service()
 openai_service = OpenAIService()
 
 logger = logging.getLogger(__name__)
 
+# Limite de produtos em uma comparação (um bucket de agregação por produto)
+MAX_COMPARISON_PRODUCTS = 50
+
 @router.get("/top-products")
+@materialized("dashboard/top-products")
+@cached_query("dashboard/top-products")
 async def get_top_products(
     size: int = Query(10, description="Número de produtos a retornar"),
     period_days: int = Query(30, description="Período em dias para análise")
@@ -29,30 +41,123 @@ async def get_top_products(
             "data": products,
             "message": f"Top {len(products)} produtos encontrados"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar top produtos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar produtos: {str(e)}")
 
 @router.get("/price-evolution")
+@materialized("dashboard/price-evolution", product="all")
+@cached_query("dashboard/price-evolution")
 async def get_price_evolution(
     product: str = Query(..., description="Nome do produto para análise"),
-    period_days: int = Query(30, description="Período em dias para análise")
+    period_days: int = Query(30, description="Período em dias para análise"),
+    resolution: int = Query(DEFAULT_RESOLUTION, ge=MIN_RESOLUTION, le=MAX_RESOLUTION,
+                            description="Número máximo de pontos retornados")
 ):
     """
     Retorna a evolução de preço de um produto específico
     """
     try:
-        price_data = es_service.get_price_evolution(product, period_days)
+        price_data = es_service.get_price_evolution(product, period_days, resolution)
         return {
             "success": True,
             "data": price_data,
             "message": f"Evolução de preço para '{product}' nos últimos {period_days} dias"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar evolução de preço: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar evolução de preço: {str(e)}")
 
+@router.get("/price-comparison")
+@cached_query("dashboard/price-comparison")
+async def get_price_comparison(
+    products: Optional[str] = Query(None, description="IDs dos produtos cadastrados separados por vírgula"),
+    pns: Optional[str] = Query(None, description="Part numbers separados por vírgula"),
+    period_days: int = Query(30, ge=1, description="Período em dias para análise"),
+    resolution: int = Query(DEFAULT_RESOLUTION, ge=MIN_RESOLUTION, le=MAX_RESOLUTION,
+                            description="Número máximo de pontos de cada série")
+):
+    """
+    Compara a evolução de preço de vários produtos cadastrados (ex.: todas as
+    variantes do HP 667) em uma única agregação: séries alinhadas no mesmo eixo
+    de tempo, resumo de cada produto e dispersão de preço entre eles.
+
+    Cada produto reúne os snapshots com seu product_db_id e, como nos alertas,
+    os gravados sem ID cujo termo de busca é o do produto. Resumos diários
+    anteriores ao campo search_term só entram após scripts/rebuild_price_rollup.py
+    """
+    try:
+        ids = [int(value) for value in (products or "").split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="IDs de produtos devem ser números inteiros")
+    pn_list = [value.strip() for value in (pns or "").split(",") if value.strip()]
+    if not ids and not pn_list:
+        raise HTTPException(status_code=400, detail="Informe products (IDs) ou pns")
+    if len(ids) + len(pn_list) > MAX_COMPARISON_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"Compare no máximo {MAX_COMPARISON_PRODUCTS} produtos por vez")
+
+    try:
+        found, missing = resolve_registered_products(ids, pn_list)
+        if not found:
+            raise HTTPException(status_code=404, detail=f"Produtos não encontrados: {', '.join(missing)}")
+
+        interval = choose_interval(period_days, resolution)
+        comparison = get_storage_backend(es_service).price_comparison(found, period_days, interval)
+        return {
+            "success": True,
+            "data": comparison,
+            "missing": missing,
+            "message": f"Comparação de preço de {len(found)} produtos nos últimos {period_days} dias"
+        }
+    except HTTPException:
+        raise
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao comparar preços: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao comparar preços: {str(e)}")
+
+def format_search_trends(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Formato que o frontend espera: {termo: string, buscas: number}"""
+    return [
+        {"termo": item["term"], "buscas": item["count"]}
+        for item in queries.parse_search_trends(response)
+    ]
+
+def format_daily_searches(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Formato que o frontend espera: {data: string, buscas: number}"""
+    return [
+        {"data": item["date"], "buscas": item["count"]}
+        for item in queries.parse_daily_searches(response)
+    ]
+
+def format_price_distribution(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Formato que o frontend espera: {faixa_preco: string, quantidade: number}"""
+    return [
+        {"faixa_preco": item["range"], "quantidade": item["count"]}
+        for item in queries.parse_price_distribution(response)
+    ]
+
+def format_top_rated(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Formato que o frontend espera: {produto, avaliacao_media, num_avaliacoes, preco_medio}"""
+    top_rated = []
+    for hit in response["hits"]["hits"]:
+        product = hit["_source"]
+        top_rated.append({
+            "produto": product.get("titulo", "Sem título"),
+            "avaliacao_media": product.get("avaliacao", 0),
+            "num_avaliacoes": 1,  # Valor padrão pois não temos esse dado específico no Elasticsearch
+            "preco_medio": product.get("preco", 0)
+        })
+    return top_rated
+
 @router.get("/search-trends")
+@materialized("dashboard/search-trends")
+@cached_query("dashboard/search-trends")
 async def get_search_trends(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -61,49 +166,27 @@ async def get_search_trends(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "search_terms": {
-                    "terms": {
-                        "field": "busca.keyword",
-                        "size": 10
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
+        response = es_service.client.search(index="hp-traker-ml", body=queries.search_trends_query(start_date, "busca.keyword"))
 
-        # Processa os resultados - Formato que o frontend espera: {termo: string, buscas: number}
-        search_trends = []
-        for bucket in response["aggregations"]["search_terms"]["buckets"]:
-            search_trends.append({
-                "termo": bucket["key"],  # Mudando de "term" para "termo"
-                "buscas": bucket["doc_count"]  # Mudando de "count" para "buscas"
-            })
+        search_trends = format_search_trends(response)
 
         return {
             "success": True,
             "data": search_trends,
             "message": f"{len(search_trends)} termos de busca encontrados"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar tendências de busca: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar tendências de busca: {str(e)}")
 
 @router.get("/daily-searches")
+@materialized("dashboard/daily-searches")
+@cached_query("dashboard/daily-searches")
 async def get_daily_searches(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -112,52 +195,25 @@ async def get_daily_searches(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "searches_per_day": {
-                    "date_histogram": {
-                        "field": "timestamp",
-                        "calendar_interval": "1d"
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados - Formato que o frontend espera: {data: string, buscas: number}
-        daily_searches = []
-        for bucket in response["aggregations"]["searches_per_day"]["buckets"]:
-            # Formata a data como YYYY-MM-DD
-            date_str = datetime.fromtimestamp(bucket["key"] / 1000).strftime('%Y-%m-%d')
-
-            daily_searches.append({
-                "data": date_str,  # Mudando de "date" para "data"
-                "buscas": bucket["doc_count"]  # Mudando de "count" para "buscas"
-            })
+        response = es_service.client.search(index="hp-traker-ml", body=queries.daily_searches_query(start_date))
 
         return {
             "success": True,
-            "data": daily_searches,
+            "data": format_daily_searches(response),
             "message": f"Dados de buscas diárias para os últimos {period_days} dias"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar buscas diárias: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar buscas diárias: {str(e)}")
 
 @router.get("/price-distribution")
+@materialized("dashboard/price-distribution")
+@cached_query("dashboard/price-distribution")
 async def get_price_distribution(
     period_days: int = Query(30, description="Período em dias para análise")
 ):
@@ -166,61 +222,27 @@ async def get_price_distribution(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "aggs": {
-                "price_ranges": {
-                    "range": {
-                        "field": "preco",
-                        "ranges": [
-                            { "to": 100 },
-                            { "from": 100, "to": 200 },
-                            { "from": 200, "to": 300 },
-                            { "from": 300, "to": 400 },
-                            { "from": 400, "to": 500 },
-                            { "from": 500 }
-                        ]
-                    }
-                }
-            },
-            "size": 0  # Não precisamos dos documentos, apenas das agregações
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados - Formato que o frontend espera: {faixa_preco: string, quantidade: number}
-        price_distribution = []
-        for bucket in response["aggregations"]["price_ranges"]["buckets"]:
-            range_label = "R$ 0-100" if bucket["key"] == "*-100.0" else \
-                         f"R$ {int(float(bucket['from']))}-{int(float(bucket['to']))}" if "from" in bucket and "to" in bucket else \
-                         f"R$ {int(float(bucket['from']))}+" if "from" in bucket else \
-                         "Sem preço"
+        response = es_service.client.search(index="hp-traker-ml", body=queries.price_distribution_query(start_date, "preco"))
 
-            price_distribution.append({
-                "faixa_preco": range_label,  # Mudando de "range" para "faixa_preco"
-                "quantidade": bucket["doc_count"]  # Mudando de "count" para "quantidade"
-            })
+        price_distribution = format_price_distribution(response)
 
         return {
             "success": True,
             "data": price_distribution,
             "message": f"Distribuição de preços em {len(price_distribution)} faixas"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar distribuição de preços: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar distribuição de preços: {str(e)}")
 
 @router.get("/top-rated-products")
+@materialized("dashboard/top-rated-products")
+@cached_query("dashboard/top-rated-products")
 async def get_top_rated_products(
     size: int = Query(10, description="Número de produtos a retornar"),
     period_days: int = Query(30, description="Período em dias para análise")
@@ -230,46 +252,113 @@ async def get_top_rated_products(
     """
     try:
         # Calcula a data de início do período
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
-
-        # Cria a consulta para o Elasticsearch
-        query = {
-            "query": {
-                "range": {
-                    "timestamp": {
-                        "gte": start_date
-                    }
-                }
-            },
-            "sort": [
-                {
-                    "avaliacao": {
-                        "order": "desc"
-                    }
-                }
-            ],
-            "size": size
-        }
+        start_date = period_start_iso(period_days)
 
         # Executa a consulta no Elasticsearch
-        response = es_service.client.search(index="hp-traker-ml", body=query)
-
-        # Processa os resultados - Formato que o frontend espera: {produto: string, avaliacao_media: number, num_avaliacoes: number, preco_medio: number}
-        top_rated = []
-        for hit in response["hits"]["hits"]:
-            product = hit["_source"]
-            top_rated.append({
-                "produto": product.get("titulo", "Sem título"),  # Mudando de "titulo" para "produto"
-                "avaliacao_media": product.get("avaliacao", 0),  # Mudando de "avaliacao" para "avaliacao_media"
-                "num_avaliacoes": 1,  # Valor padrão pois não temos esse dado específico no Elasticsearch
-                "preco_medio": product.get("preco", 0)  # Mudando de "preco" para "preco_medio"
-            })
+        response = es_service.client.search(index="hp-traker-ml", body=queries.top_rated_query(start_date, size, "avaliacao"))
+
+        top_rated = format_top_rated(response)
 
         return {
             "success": True,
             "data": top_rated,
             "message": f"Top {len(top_rated)} produtos melhor avaliados"
         }
+    except ElasticsearchUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar produtos melhor avaliados: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar produtos melhor avaliados: {str(e)}")
+
+@router.get("/bundle")
+@materialized("dashboard/bundle")
+@cached_query("dashboard/bundle")
+async def get_dashboard_bundle(
+    size: int = Query(10, description="Número de produtos nos rankings"),
+    period_days: int = Query(30, description="Período em dias para análise"),
+    resolution: int = Query(DEFAULT_RESOLUTION, ge=MIN_RESOLUTION, le=MAX_RESOLUTION,
+                            description="Número máximo de pontos na evolução de preço")
+):
+    """
+    Retorna os dados de todos os widgets do dashboard e da análise de dados
+    em uma única resposta, executando as consultas em um único _msearch.
+    Widgets que falharem retornam null e aparecem em "errors".
+    """
+    try:
+        # Calcula a data de início do período
+        start_date = period_start_iso(period_days)
+        start_day = period_start_day(period_days)
+
+        # Cada widget: (nome, índice, consulta, função que formata a resposta)
+        widgets = [
+            ("searchTrends", ES_INDEX, queries.search_trends_query(start_date, "busca.keyword"), format_search_trends),
+            ("dailySearches", ES_INDEX, queries.daily_searches_query(start_date), format_daily_searches),
+            ("priceDistribution", ES_INDEX, queries.price_distribution_query(start_date, "preco"), format_price_distribution),
+            ("topRatedProducts", ES_INDEX, queries.top_rated_query(start_date, size, "avaliacao"), format_top_rated),
+            ("priceHistory", ES_ROLLUP_INDEX,
+             queries.price_evolution_query(start_day, "all", choose_interval(period_days, resolution)),
+             lambda response: downsample_points(queries.parse_price_evolution(response), resolution, "timestamp", "avgPrice")),
+            ("categoryDistribution", ES_INDEX, queries.category_distribution_query(start_date),
+             queries.parse_category_distribution),
+            ("stockAvailability", ES_INDEX, queries.stock_availability_query(start_date), queries.parse_stock_availability),
+            # Mesmo ranking exato de /api/analytics/seller-performance: a primeira página da
+            # composite vai no _msearch e as seguintes, se houver, são buscadas em seguida
+            ("sellerPerformance", ES_INDEX, queries.seller_stats_query(start_date, SELLER_STATS_PAGE_SIZE),
+             lambda response: ElasticsearchBackend(es_service).rank_sellers(
+                 period_days, queries.parse_seller_stats(response, SELLER_STATS_PAGE_SIZE))),
+        ]
+
+        data: Dict[str, Any] = {"topProducts": []}
+        top_products_query = es_service.top_products_query(size, period_days)
+        if top_products_query is not None:
+            widgets.append(("topProducts", ES_INDEX, top_products_query,
+                            lambda response: es_service.format_top_products(response["hits"]["hits"], size)))
+
+        responses = es_service.multi_search([(index, query) for _, index, query, _ in widgets])
+
+        errors = {}
+        for (name, _, _, formatter), response in zip(widgets, responses):
+            if "error" in response:
+                logger.error(f"Erro no widget '{name}' do dashboard: {response['error']}")
+                data[name] = None
+                errors[name] = str(response["error"])
+                continue
+            try:
+                data[name] = formatter(response)
+            except Exception as e:
+                logger.error(f"Erro ao processar widget '{name}' do dashboard: {str(e)}")
+                data[name] = None
+                errors[name] = str(e)
+
+        return {
+            "success": not errors,
+            "data": data,
+            "errors": errors,
+            "message": f"{len(widgets) - len(errors)} de {len(widgets)} widgets carregados para os últimos {period_days} dias"
+        }
+    except ElasticsearchUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar pacote do dashboard: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar pacote do dashboard: {str(e)}")
+
+@router.get("/snapshots")
+async def get_snapshots_status(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """
+    Estado dos snapshots materializados: versão, ETag e data de cada um e o
+    resultado da última materialização. Apenas administradores.
+    """
+    return dashboard_snapshots.status()
+
+@router.post("/snapshots/refresh")
+async def refresh_snapshots(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """
+    Agenda a materialização imediata dos snapshots do dashboard (por exemplo,
+    após uma ingestão feita por outro processo sem Redis). Apenas administradores.
+    """
+    dashboard_snapshots.schedule_refresh(0)
+    return {"success": True, "message": "Materialização dos snapshots do dashboard agendada"}
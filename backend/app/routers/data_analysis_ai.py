@@ -1,18 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel
+from ..core.time_windows import period_start_iso
 from ..core.security import get_current_user, get_current_user_optional
 from ..services.openai_service import OpenAIService
 from ..schemas.user import User
-from ..services.elasticsearch_service import ElasticsearchService
-from datetime import datetime, timedelta
+from ..services.elasticsearch_service import get_es_service
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Instanciando o serviço Elasticsearch
-es_service = ElasticsearchService()
+# Serviço Elasticsearch compartilhado (conecta no primeiro uso)
+es_service = get_es_service()
 
 class DataAnalysisRequest(BaseModel):
     dashboardData: Optional[Dict[str, Any]] = None
@@ -152,7 +152,7 @@ async def get_dashboard_data():
     try:
         # Período padrão de 30 dias
         period_days = 30
-        start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
+        start_date = period_start_iso(period_days)
 
         # Usar o método search_products em vez de search
         # Obtém top produtos
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Dict, Any
+
+from app.core.security import get_current_active_superuser
+from app.models.user import User
+from app.services.es_metrics import query_metrics
+
+router = APIRouter()
+
+
+@router.get("/elasticsearch")
+async def get_elasticsearch_metrics(
+    current_user: User = Depends(get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    Histogramas de latência das consultas ao Elasticsearch por endpoint:
+    took do servidor, tempo no cliente, shards, hits e a última amostra de profile.
+    Apenas administradores.
+    """
+    return query_metrics.summary()
+
+
+@router.get("/elasticsearch/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000, description="Número máximo de consultas retornadas"),
+    current_user: User = Depends(get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    Consultas que ultrapassaram ES_SLOW_QUERY_MS, das mais recentes para as mais antigas.
+    Apenas administradores.
+    """
+    queries = query_metrics.slow_queries(limit)
+    return {
+        "limite_ms": query_metrics.slow_query_ms,
+        "total": len(queries),
+        "consultas": queries
+    }
+
+
+@router.delete("/elasticsearch")
+async def reset_elasticsearch_metrics(
+    current_user: User = Depends(get_current_active_superuser)
+) -> Dict[str, Any]:
+    """Zera as métricas acumuladas. Apenas administradores."""
+    query_metrics.reset()
+    return {"success": True, "message": "Métricas do Elasticsearch reiniciadas"}
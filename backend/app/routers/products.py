@@ -10,6 +10,7 @@ from app.models.product import Product
 from app.models.system_log import SystemLog, LogLevel, LogCategory
 from app.schemas.product import ProductCreate, ProductSearch
 from app.scrapers.mercado_livre import search_products_ml
+from app.services.product_cache import invalidate_registered_products
 
 router = APIRouter()
 
@@ -44,6 +45,7 @@ async def create_product(
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    invalidate_registered_products()
 
     # Registrar log
     log = SystemLog(
@@ -111,6 +113,7 @@ async def get_product(
         "search_terms": product.search_terms,
         "url": product.url,
         "family": product.family,
+        "category": product.category,
         "printer_models": product.printer_models,
         "reference_price": product.reference_price,
         "check_interval": product.check_interval,
@@ -151,6 +154,7 @@ async def update_product(
 
     db.commit()
     db.refresh(db_product)
+    invalidate_registered_products()
 
     # Registrar log
     log = SystemLog(
@@ -197,6 +201,7 @@ async def delete_product(
     # Remover produto
     db.delete(db_product)
     db.commit()
+    invalidate_registered_products()
 
     # Registrar log
     log = SystemLog(
@@ -376,6 +381,7 @@ async def import_products(
 
         # Commit das alterações
         db.commit()
+        invalidate_registered_products()
 
         # Registrar log
         log = SystemLog(
@@ -6,88 +6,71 @@ import json
 import os
 from datetime import datetime
 from typing import List, Dict, Any, Optional
-from elasticsearch import Elasticsearch, helpers
 import logging
+import sys
+
+# Permite importar o pacote app quando o script é executado diretamente
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+from app.services.elasticsearch_service import ES_INDEX, get_es_service
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Configurações do Elasticsearch
-ES_INDEX = "hp-traker-ml"
-# URL local para o Elasticsearch no Docker
-ES_LOCAL_URL = os.getenv("ELASTICSEARCH_URL", "http://elasticsearch:9200")
-# Configurações do Elasticsearch na nuvem como fallback
-ES_CLOUD_HOST = "https://cce7c968e5f94cb59b5922e251810730.us-central1.gcp.cloud.es.io:443"
-ES_CLOUD_API_KEY = "TGFmSlhKY0ItRGtNRXVmY1YxeDg6bThDUFBwdHlwNkgzTDk4eHJFNHBWUQ=="
-
-def get_elasticsearch_client():
-    """Retorna um cliente Elasticsearch configurado"""
-    # Tentar conectar ao Elasticsearch local primeiro
-    try:
-        logger.info(f"Tentando conectar ao Elasticsearch local: {ES_LOCAL_URL}")
-        client = Elasticsearch(ES_LOCAL_URL)
-        # Testar a conexão
-        client.info()
-        logger.info("Conectado ao Elasticsearch local com sucesso")
-        return client
-    except Exception as e:
-        logger.warning(f"Falha ao conectar ao Elasticsearch local: {e}")
-        logger.info("Usando Elasticsearch na nuvem como fallback")
-        return Elasticsearch(
-            ES_CLOUD_HOST,
-            api_key=ES_CLOUD_API_KEY
-        )
-
-def save_to_elasticsearch(produtos: List[Dict[str, Any]], busca: str) -> bool:
+def save_to_elasticsearch(produtos: List[Dict[str, Any]], busca: str,
+                          product_db_id: Optional[int] = None) -> bool:
     """
-    Salva os resultados da busca no Elasticsearch
+    Salva os resultados da busca no Elasticsearch pelo caminho normal de
+    ingestão (ElasticsearchService.bulk_index_products): upsert dos snapshots,
+    comentários no índice de avaliações e after_ingest (resumo diário,
+    estatísticas, alertas, histórico, cubo, cache e snapshots do dashboard)
 
     Args:
         produtos: Lista de produtos para salvar
         busca: Termo de busca usado para encontrar os produtos
+        product_db_id: ID do produto cadastrado buscado (opcional)
 
     Returns:
         bool: True se salvo com sucesso, False caso contrário
     """
     try:
-        # Inicializa o cliente Elasticsearch
-        client = get_elasticsearch_client()
-
         # Prepara os documentos para inserção
         docs = []
         timestamp = datetime.now().isoformat()
 
         for produto in produtos:
             doc = {
-                "_index": ES_INDEX,
-                "_source": {
-                    "busca": busca,
-                    "timestamp": timestamp,
-                    "id": str(produto['id']),
-                    "titulo": str(produto['titulo']),
-                    "preco": float(produto['preco']),
-                    "link": str(produto['link']),
-                    "vendedor": produto.get('vendedor', 'Não informado'),
-                    "avaliacao": float(produto.get('avaliacao')) if produto.get('avaliacao') else None,
-                    "num_avaliacoes": int(produto.get('num_avaliacoes', 0)),
-                    "comentarios": produto.get('comentarios', []),
-                    "fonte": "produto_cadastrado"  # Indica que é uma busca de produto cadastrado
-                }
+                "busca": busca,
+                "search_term": busca,
+                "timestamp": timestamp,
+                "id": str(produto['id']),
+                "titulo": str(produto['titulo']),
+                "preco": float(produto['preco']),
+                "link": str(produto['link']),
+                "vendedor": produto.get('vendedor', 'Não informado'),
+                "avaliacao": float(produto.get('avaliacao')) if produto.get('avaliacao') else None,
+                "num_avaliacoes": int(produto.get('num_avaliacoes', 0)),
+                "comentarios": produto.get('comentarios', []),
+                "fonte": "produto_cadastrado"  # Indica que é uma busca de produto cadastrado
             }
+            if product_db_id is not None:
+                doc["product_db_id"] = product_db_id
             docs.append(doc)
 
-        # Insere os documentos em lote
-        if docs:
-            bulk_response = helpers.bulk(client, docs)
-            logger.info(f"✓ Dados salvos no Elasticsearch com sucesso!")
-            logger.info(f"  - Total de produtos: {len(produtos)}")
-            logger.info(f"  - Índice: {ES_INDEX}")
-            return True
-        else:
+        if not docs:
             logger.warning("Nenhum produto para salvar")
             return False
 
+        # Falhas de snapshot fazem bulk_index_products retornar False; comentários já gravados (409) são ignorados
+        if not get_es_service().bulk_index_products(docs):
+            logger.error("✗ Nem todos os produtos foram salvos no Elasticsearch")
+            return False
+
+        logger.info(f"✓ Dados salvos no Elasticsearch com sucesso!")
+        logger.info(f"  - Total de produtos: {len(produtos)}")
+        logger.info(f"  - Índice: {ES_INDEX}")
+        return True
+
     except Exception as e:
         logger.error(f"Erro ao salvar no Elasticsearch: {str(e)}")
         import traceback
@@ -103,13 +86,15 @@ def extrair_preco(preco_text: str) -> float:
     except:
         return 0.0
 
-def search_ml_products(termo_busca: str, save_to_elastic: bool = False) -> List[Dict[str, Any]]:
+def search_ml_products(termo_busca: str, save_to_elastic: bool = False,
+                       product_db_id: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Busca produtos no Mercado Livre com base no termo de busca
 
     Args:
         termo_busca: Termo para buscar no Mercado Livre
         save_to_elastic: Se True, salva os resultados no Elasticsearch
+        product_db_id: ID do produto cadastrado buscado, gravado nos snapshots
 
     Returns:
         Lista de produtos encontrados
@@ -174,7 +159,7 @@ def search_ml_products(termo_busca: str, save_to_elastic: bool = False) -> List[
         # Salva no Elasticsearch se solicitado
         if save_to_elastic:
             logger.info("Salvando resultados no Elasticsearch...")
-            save_to_elasticsearch(produtos, termo_busca)
+            save_to_elasticsearch(produtos, termo_busca, product_db_id)
         else:
             logger.info("Resultados não serão salvos no Elasticsearch (busca individual)")
 
@@ -208,7 +193,7 @@ def scheduled_search_for_registered_products(produtos_cadastrados: List[Dict[str
             logger.info(f"Buscando produto ID {produto_id}: '{termo_busca}'")
 
             # Executa a busca e salva no Elasticsearch
-            resultados = search_ml_products(termo_busca, save_to_elastic=True)
+            resultados = search_ml_products(termo_busca, save_to_elastic=True, product_db_id=produto_id)
 
             logger.info(f"Busca concluída para produto ID {produto_id}: {len(resultados)} resultados")
 
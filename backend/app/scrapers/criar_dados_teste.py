@@ -1,8 +1,12 @@
 import asyncio
 import json
 import os
+import sys
 from datetime import datetime
 
+# Raiz do backend no PYTHONPATH para registrar o arquivo no manifesto
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+
 # Diretório de resultados
 results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
 os.makedirs(results_dir, exist_ok=True)
@@ -183,6 +187,13 @@ async def save_mock_results():
         json.dump(mock_data, f, ensure_ascii=False, indent=2)
 
     print(f"Dados de simulação salvos em: {file_path}")
+
+    # Registrar no manifesto de resultados, como o rastreador faz
+    try:
+        from app.services.results_archive import results_archive
+        results_archive.record(file_path, mock_data)
+    except ImportError:
+        print("AVISO: manifesto de resultados indisponível; será recriado na próxima leitura.")
     return file_path
 
 # Executar o script
@@ -314,7 +314,7 @@ async def run_enhanced_scraper(db):
                     product_data["product_db_id"] = product.id
                     product_data["product_name"] = product.name
                     product_data["product_sku"] = product.pn  # Usar pn em vez de sku
-                    product_data["category"] = product.family  # Usar family como category
+                    product_data["category"] = product.category  # Categoria calculada ao salvar o produto
                     product_data["brand"] = "HP"  # Definir brand como HP por padrão
 
                     # Salvar no Elasticsearch
@@ -6,11 +6,9 @@ import json
 import uuid
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
 from urllib.parse import quote
-from collections import defaultdict
-from statistics import mean, median
 
 # Adicionar o diretório raiz do projeto ao PYTHONPATH
 # Isso permite importações absolutas em vez de relativas
@@ -20,8 +18,8 @@ sys.path.insert(0, project_root)
 
 # Importar com caminho absoluto em vez de relativo
 try:
-    from app.services.elasticsearch_service import ElasticsearchService
-    es_service = ElasticsearchService()
+    from app.services.elasticsearch_service import get_es_service
+    es_service = get_es_service()
 except ImportError:
     print("AVISO: Não foi possível importar ElasticsearchService.")
     print("Os dados serão coletados, mas não serão enviados para o Elasticsearch.")
@@ -226,11 +224,21 @@ async def save_last_search_results(results, filename=None):
         # Caminho completo do arquivo
         file_path = os.path.join(results_dir, filename)
 
-        # Salvar resultados como JSON
+        # Salvar resultados como JSON (sem indentação: arquivos menores e leitura mais rápida)
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+            json.dump(results, f, ensure_ascii=False, separators=(',', ':'))
 
         logger.info(f"Resultados da busca salvos em: {file_path}")
+
+        # Registrar no manifesto e compactar os arquivos antigos, se houver
+        try:
+            from app.services.results_archive import results_archive
+            if os.path.dirname(file_path) == results_archive.results_dir:
+                results_archive.record(file_path, results)
+                results_archive.maybe_compact()
+        except Exception as e:
+            logger.error(f"Erro ao atualizar o manifesto de resultados: {str(e)}")
+
         return file_path
 
     except Exception as e:
@@ -245,151 +253,55 @@ def get_last_search_file():
         str: Caminho do arquivo mais recente ou None se nenhum for encontrado
     """
     try:
-        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
-        if not os.path.exists(results_dir):
-            logger.error("Diretório de resultados não encontrado")
-            return None
-
-        # Listar todos os arquivos JSON no diretório de resultados
-        json_files = [f for f in os.listdir(results_dir) if f.endswith('.json') and f.startswith('ultima_busca_')]
+        from app.services.results_archive import results_archive
 
-        if not json_files:
+        # Entrada mais recente do manifesto, sem listar o diretório
+        latest = results_archive.latest()
+        if not latest:
             logger.error("Nenhum arquivo de resultado encontrado")
             return None
 
-        # Ordenar por data de modificação (mais recente primeiro)
-        json_files.sort(key=lambda x: os.path.getmtime(os.path.join(results_dir, x)), reverse=True)
-
-        # Retornar o caminho do arquivo mais recente
-        return os.path.join(results_dir, json_files[0])
+        return results_archive.path(latest)
 
     except Exception as e:
         logger.error(f"Erro ao buscar último arquivo de resultados: {str(e)}")
         return None
 
-def evaluate_search_results(results=None, file_path=None):
+def evaluate_search_results(results=None, file_path=None, file_paths=None, period_days=None, bins=20):
     """
-    Avalia os resultados da última busca e fornece estatísticas e insights
+    Avalia os resultados de busca e fornece estatísticas e insights. O cálculo
+    é vetorizado (app.services.search_results_stats) e aceita um arquivo, vários
+    arquivos ou todos os arquivos de um período.
 
     Args:
-        results (list, optional): Lista de produtos para avaliar. Se None, tenta carregar do arquivo.
+        results (list, optional): Lista de produtos para avaliar. Se None, carrega dos arquivos.
         file_path (str, optional): Caminho para o arquivo de resultados. Se None, usa o mais recente.
+        file_paths (list, optional): Vários arquivos analisados como um único conjunto.
+        period_days (int, optional): Analisa todos os arquivos dos últimos N dias.
+        bins (int): Número de faixas do histograma de preços.
 
     Returns:
         dict: Estatísticas e insights sobre os resultados
     """
+    from app.services.results_archive import results_archive
+    from app.services.search_results_stats import analyze_search_results, evaluate_result_files, list_result_files
+
     try:
-        # Se nenhum resultado foi fornecido, tentar carregar do arquivo
-        if not results:
+        if results:
+            return analyze_search_results(results, bins=bins)
+
+        if period_days:
+            file_paths = list_result_files(start=datetime.now() - timedelta(days=period_days))
+        elif not file_paths:
             if not file_path:
                 file_path = get_last_search_file()
 
-            if not file_path or not os.path.exists(file_path):
+            if not file_path or not (os.path.exists(file_path) or results_archive.get(file_path)):
                 logger.error("Arquivo de resultados não encontrado")
                 return {"erro": "Nenhum resultado de busca encontrado"}
+            file_paths = [file_path]
 
-            # Carregar resultados do arquivo
-            with open(file_path, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-
-        if not results:
-            return {"erro": "Nenhum resultado disponível para análise"}
-
-        # Inicializar estatísticas
-        stats = {
-            "total_produtos": len(results),
-            "termos_busca": set(),
-            "faixa_precos": {
-                "min": float('inf'),
-                "max": 0,
-                "media": 0,
-                "mediana": 0
-            },
-            "vendedores": defaultdict(int),
-            "produtos_originais": 0,
-            "produtos_remanufaturados": 0,
-            "frete_gratis": 0,
-            "produtos_internacionais": 0,
-            "modelos_cartucho": defaultdict(int),
-            "produtos_mercado_livre_full": 0,
-            "avaliacoes": {
-                "media": 0,
-                "produtos_avaliados": 0
-            }
-        }
-
-        # Preços para cálculo de média e mediana
-        precos = []
-        avaliacoes = []
-
-        # Processar cada produto
-        for produto in results:
-            # Termos de busca
-            stats["termos_busca"].add(produto.get('search_term', 'Não especificado'))
-
-            # Faixa de preços
-            preco = produto.get('price', 0)
-            if preco > 0:
-                precos.append(preco)
-                stats["faixa_precos"]["min"] = min(stats["faixa_precos"]["min"], preco)
-                stats["faixa_precos"]["max"] = max(stats["faixa_precos"]["max"], preco)
-
-            # Vendedores
-            vendedor = produto.get('seller', 'Não especificado')
-            stats["vendedores"][vendedor] += 1
-
-            # Tipos de produto
-            if produto.get('is_original', False):
-                stats["produtos_originais"] += 1
-
-            if produto.get('is_remanufactured', False):
-                stats["produtos_remanufaturados"] += 1
-
-            # Frete grátis
-            if produto.get('free_shipping', False):
-                stats["frete_gratis"] += 1
-
-            # Produtos internacionais
-            if produto.get('is_international', False):
-                stats["produtos_internacionais"] += 1
-
-            # Modelos de cartucho
-            modelo = produto.get('cartridge_model', 'Não identificado')
-            stats["modelos_cartucho"][modelo] += 1
-
-            # Produtos MercadoLivre Full
-            if produto.get('is_mercado_livre_full', False):
-                stats["produtos_mercado_livre_full"] += 1
-
-            # Avaliações
-            avaliacao = produto.get('rating', 0)
-            if avaliacao > 0:
-                avaliacoes.append(avaliacao)
-                stats["avaliacoes"]["produtos_avaliados"] += 1
-
-        # Calcular estatísticas de preço
-        if precos:
-            stats["faixa_precos"]["media"] = round(mean(precos), 2)
-            stats["faixa_precos"]["mediana"] = round(median(precos), 2)
-        else:
-            stats["faixa_precos"]["min"] = 0
-
-        # Calcular média de avaliações
-        if avaliacoes:
-            stats["avaliacoes"]["media"] = round(mean(avaliacoes), 1)
-
-        # Converter termos de busca para lista
-        stats["termos_busca"] = list(stats["termos_busca"])
-
-        # Encontrar os 5 vendedores mais frequentes
-        top_vendedores = sorted(stats["vendedores"].items(), key=lambda x: x[1], reverse=True)[:5]
-        stats["top_vendedores"] = dict(top_vendedores)
-
-        # Encontrar os 5 modelos de cartucho mais frequentes
-        top_modelos = sorted(stats["modelos_cartucho"].items(), key=lambda x: x[1], reverse=True)[:5]
-        stats["top_modelos_cartucho"] = dict(top_modelos)
-
-        return stats
+        return evaluate_result_files(file_paths, bins=bins)
 
     except Exception as e:
         logger.error(f"Erro ao avaliar resultados da busca: {str(e)}")
@@ -444,29 +356,35 @@ async def run_scraper(db):
         return []
 
 # Adicionar uma função para avaliar a última busca realizada (para ser chamada externamente)
-async def avaliar_ultima_busca():
+async def avaliar_ultima_busca(dias=None):
     """
-    Avalia os resultados da última busca realizada e exibe um resumo
+    Avalia os resultados da última busca realizada (ou de todas as buscas dos
+    últimos `dias` dias) e exibe um resumo
 
     Returns:
         dict: Estatísticas e insights sobre os resultados
     """
     print("\n" + "=" * 50)
-    print("AVALIAÇÃO DA ÚLTIMA BUSCA")
+    print("AVALIAÇÃO DA ÚLTIMA BUSCA" if not dias else f"AVALIAÇÃO DAS BUSCAS DOS ÚLTIMOS {dias} DIAS")
     print("=" * 50)
 
-    # Obter caminho do último arquivo de resultados
-    arquivo_resultados = get_last_search_file()
+    if dias:
+        avaliacao = evaluate_search_results(period_days=dias)
+        if "arquivos" in avaliacao:
+            print(f"Analisando {avaliacao['arquivos']['quantidade']} arquivos de resultados")
+    else:
+        # Obter caminho do último arquivo de resultados
+        arquivo_resultados = get_last_search_file()
 
-    if not arquivo_resultados:
-        print("Nenhum resultado de busca anterior encontrado.")
-        print("Execute o scraper primeiro para gerar resultados.")
-        return {"erro": "Nenhum resultado de busca anterior encontrado"}
+        if not arquivo_resultados:
+            print("Nenhum resultado de busca anterior encontrado.")
+            print("Execute o scraper primeiro para gerar resultados.")
+            return {"erro": "Nenhum resultado de busca anterior encontrado"}
 
-    print(f"Analisando resultados do arquivo: {os.path.basename(arquivo_resultados)}")
+        print(f"Analisando resultados do arquivo: {os.path.basename(arquivo_resultados)}")
 
-    # Avaliar os resultados
-    avaliacao = evaluate_search_results(file_path=arquivo_resultados)
+        # Avaliar os resultados
+        avaliacao = evaluate_search_results(file_path=arquivo_resultados)
 
     if "erro" in avaliacao:
         print(f"Erro: {avaliacao['erro']}")
@@ -480,6 +398,8 @@ async def avaliar_ultima_busca():
         print(f"Faixa de preços: R$ {avaliacao['faixa_precos']['min']:.2f} a R$ {avaliacao['faixa_precos']['max']:.2f}")
         print(f"Preço médio: R$ {avaliacao['faixa_precos']['media']:.2f}")
         print(f"Preço mediano: R$ {avaliacao['faixa_precos']['mediana']:.2f}")
+        percentis = avaliacao['faixa_precos']['percentis']
+        print("Percentis: " + " | ".join(f"{nome}: R$ {valor:.2f}" for nome, valor in percentis.items()))
 
     print(f"Produtos originais: {avaliacao['produtos_originais']} ({(avaliacao['produtos_originais']/avaliacao['total_produtos']*100):.1f}%)")
     print(f"Produtos remanufaturados/compatíveis: {avaliacao['produtos_remanufaturados']} ({(avaliacao['produtos_remanufaturados']/avaliacao['total_produtos']*100):.1f}%)")
@@ -495,6 +415,15 @@ async def avaliar_ultima_busca():
     for modelo, count in avaliacao['top_modelos_cartucho'].items():
         print(f"  - {modelo}: {count} produtos")
 
+    print("\nPreços por modelo de cartucho:")
+    for modelo in avaliacao['por_modelo'][:10]:
+        precos = modelo['precos']
+        if precos:
+            print(f"  - {modelo['modelo']}: {modelo['total']} produtos, {modelo['vendedores']} vendedores, "
+                  f"R$ {precos['min']:.2f} a R$ {precos['max']:.2f} (mediana R$ {precos['mediana']:.2f})")
+        else:
+            print(f"  - {modelo['modelo']}: {modelo['total']} produtos, sem preço")
+
     if avaliacao['avaliacoes']['produtos_avaliados'] > 0:
         print(f"\nAvaliação média: {avaliacao['avaliacoes']['media']} estrelas (em {avaliacao['avaliacoes']['produtos_avaliados']} produtos avaliados)")
 
@@ -519,8 +448,9 @@ if __name__ == "__main__":
 
     # Verificar se o usuário quer executar o scraper ou avaliar a última busca
     if len(sys.argv) > 1 and sys.argv[1] == "--avaliar":
-        # Executar avaliação da última busca
-        asyncio.run(avaliar_ultima_busca())
+        # Executar avaliação da última busca (ou do período: --avaliar 30)
+        dias = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        asyncio.run(avaliar_ultima_busca(dias))
     else:
         # Executar o scraper normalmente
         print(f"\nIniciando pesquisa de {len(PRODUTOS_DIRETOS)} produtos no Mercado Livre...")
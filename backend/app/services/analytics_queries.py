@@ -0,0 +1,565 @@
+"""
+Consultas dos widgets de analytics e dashboard.
+Cada widget tem uma função que monta o corpo da consulta ao Elasticsearch e
+outra que converte a resposta no formato esperado pelo frontend. As rotas
+individuais e o endpoint de pacote (/api/dashboard/bundle) usam as mesmas
+funções, o que permite executar vários widgets em um único _msearch.
+"""
+
+import json
+import base64
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+# Faixas de preço usadas nos gráficos de distribuição
+PRICE_RANGES = [
+    {"to": 100},
+    {"from": 100, "to": 200},
+    {"from": 200, "to": 300},
+    {"from": 300, "to": 400},
+    {"from": 400, "to": 500},
+    {"from": 500}
+]
+
+# Percentis de preço calculados por vendedor
+SELLER_PRICE_PERCENTILES = [25, 50, 75, 90]
+
+
+def _period_filter(start_date: str, field: str = "timestamp") -> Dict[str, Any]:
+    return {
+        "range": {
+            field: {
+                "gte": start_date
+            }
+        }
+    }
+
+
+# Distribuição de preços
+
+def price_distribution_query(start_date: str, price_field: str = "price") -> Dict[str, Any]:
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "price_ranges": {
+                "range": {
+                    "field": price_field,
+                    "ranges": PRICE_RANGES
+                }
+            }
+        },
+        "size": 0  # Não precisamos dos documentos, apenas das agregações
+    }
+
+
+def parse_price_distribution(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    price_distribution = []
+    for bucket in response["aggregations"]["price_ranges"]["buckets"]:
+        range_label = "R$ 0-100" if bucket["key"] == "*-100.0" else \
+                     f"R$ {int(float(bucket['from']))}-{int(float(bucket['to']))}" if "from" in bucket and "to" in bucket else \
+                     f"R$ {int(float(bucket['from']))}+" if "from" in bucket else \
+                     "Sem preço"
+
+        price_distribution.append({
+            "range": range_label,
+            "count": bucket["doc_count"]
+        })
+
+    return price_distribution
+
+
+def price_band(price: Optional[float]) -> str:
+    """Rótulo da faixa de PRICE_RANGES do preço, no formato de parse_price_distribution"""
+    if price is None:
+        return "Sem preço"
+    for price_range in PRICE_RANGES:
+        if "from" in price_range and price < price_range["from"]:
+            continue
+        if "to" in price_range and price >= price_range["to"]:
+            continue
+        if "from" not in price_range:
+            return f"R$ 0-{price_range['to']}"
+        if "to" not in price_range:
+            return f"R$ {price_range['from']}+"
+        return f"R$ {price_range['from']}-{price_range['to']}"
+    return "Sem preço"
+
+
+# Evolução de preço (consulta o resumo diário)
+
+def price_evolution_query(start_day: str, product: str, interval: str) -> Dict[str, Any]:
+    query_base = _period_filter(start_day, field="day")
+
+    # Adiciona filtro de produto se não for 'all'
+    if product.lower() != 'all':
+        query = {
+            "bool": {
+                "must": [
+                    query_base,
+                    {
+                        "match": {
+                            "title": product
+                        }
+                    }
+                ]
+            }
+        }
+    else:
+        query = query_base
+
+    return {
+        "query": query,
+        "aggs": {
+            "price_over_time": {
+                "date_histogram": {
+                    "field": "day",
+                    "fixed_interval": interval
+                },
+                "aggs": {
+                    "sum_price": {"sum": {"field": "sum_price"}},
+                    "sample_count": {"sum": {"field": "count"}},
+                    "min_price": {"min": {"field": "min_price"}},
+                    "max_price": {"max": {"field": "max_price"}}
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_price_evolution(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    price_history = []
+    for bucket in response["aggregations"]["price_over_time"]["buckets"]:
+        # Só inclui pontos que tenham dados
+        sample_count = bucket["sample_count"]["value"] or 0
+        if bucket["doc_count"] > 0 and sample_count > 0:
+            # Formata a data como YYYY-MM
+            date_str = datetime.fromtimestamp(bucket["key"] / 1000).strftime('%Y-%m')
+
+            # Média ponderada pelo número de amostras de cada dia/vendedor
+            avg_price = bucket["sum_price"]["value"] / sample_count
+
+            price_history.append({
+                "date": date_str,
+                "timestamp": bucket["key"],
+                "avgPrice": round(avg_price, 2),
+                "minPrice": round(bucket["min_price"]["value"], 2) if bucket["min_price"]["value"] is not None else 0,
+                "maxPrice": round(bucket["max_price"]["value"], 2) if bucket["max_price"]["value"] is not None else 0
+            })
+
+    return price_history
+
+
+# Comparação de preços entre produtos (uma única agregação para todos)
+
+def comparison_product_filter(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Documentos de um produto cadastrado, resolvidos como no motor de alertas:
+    product_db_id quando o scraper o grava, senão o termo de busca do produto
+    (snapshots de mercado_livre.py e buscar_produtos_ml.py sem product_db_id)
+    """
+    should = [{"term": {"product_db_id": product["id"]}}]
+    if product.get("search_terms"):
+        should.append({
+            "bool": {
+                "filter": [{"term": {"search_term": product["search_terms"].strip().lower()}}],
+                "must_not": [{"exists": {"field": "product_db_id"}}]
+            }
+        })
+    return {"bool": {"should": should, "minimum_should_match": 1}}
+
+
+def price_comparison_query(start_day: str, end_day: str, products: List[Dict[str, Any]], interval: str) -> Dict[str, Any]:
+    """
+    Um bucket "filters" por produto cadastrado (product_db_id ou termo de
+    busca, sem match no título), cada um com o mesmo date_histogram de limites
+    fixos: as séries voltam alinhadas e o custo não depende do número de produtos
+    """
+    product_filters = {str(product["id"]): comparison_product_filter(product) for product in products}
+    histogram_aggs = {
+        "sum_price": {"sum": {"field": "sum_price"}},
+        "sample_count": {"sum": {"field": "count"}},
+        "min_price": {"min": {"field": "min_price"}},
+        "max_price": {"max": {"field": "max_price"}}
+    }
+    return {
+        "query": {
+            "bool": {
+                "filter": [
+                    _period_filter(start_day, field="day"),
+                    {"bool": {"should": list(product_filters.values()), "minimum_should_match": 1}}
+                ]
+            }
+        },
+        "aggs": {
+            "products": {
+                "filters": {
+                    "filters": product_filters
+                },
+                "aggs": {
+                    "price_over_time": {
+                        "date_histogram": {
+                            "field": "day",
+                            "fixed_interval": interval,
+                            "min_doc_count": 0,
+                            "extended_bounds": {"min": start_day, "max": end_day}
+                        },
+                        "aggs": histogram_aggs
+                    },
+                    "sellers": {"cardinality": {"field": "seller"}},
+                    **histogram_aggs
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_price_comparison(response: Dict[str, Any], products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Séries alinhadas (mesmos timestamps para todos os produtos, None onde não
+    houve preço), resumo de cada produto e a dispersão entre os preços médios
+    dos produtos em cada ponto (menor, maior, diferença e produto mais barato)
+    """
+    buckets = response["aggregations"]["products"]["buckets"]
+    timestamps = sorted({
+        point["key"]
+        for bucket in buckets.values()
+        for point in bucket["price_over_time"]["buckets"]
+    })
+    position = {timestamp: i for i, timestamp in enumerate(timestamps)}
+
+    series = []
+    for product in products:
+        bucket = buckets.get(str(product["id"]))
+        avg_prices: List[Optional[float]] = [None] * len(timestamps)
+        min_prices: List[Optional[float]] = [None] * len(timestamps)
+        max_prices: List[Optional[float]] = [None] * len(timestamps)
+        summary = {"avgPrice": None, "minPrice": None, "maxPrice": None, "samples": 0, "sellers": 0}
+
+        if bucket is not None:
+            for point in bucket["price_over_time"]["buckets"]:
+                sample_count = point["sample_count"]["value"] or 0
+                if sample_count > 0:
+                    i = position[point["key"]]
+                    avg_prices[i] = round(point["sum_price"]["value"] / sample_count, 2)
+                    min_prices[i] = _round(point["min_price"]["value"])
+                    max_prices[i] = _round(point["max_price"]["value"])
+
+            sample_count = bucket["sample_count"]["value"] or 0
+            if sample_count > 0:
+                summary = {
+                    "avgPrice": round(bucket["sum_price"]["value"] / sample_count, 2),
+                    "minPrice": _round(bucket["min_price"]["value"]),
+                    "maxPrice": _round(bucket["max_price"]["value"]),
+                    "samples": int(sample_count),
+                    "sellers": int(bucket["sellers"]["value"] or 0)
+                }
+
+        series.append({
+            "product_db_id": product["id"],
+            "name": product.get("name"),
+            "pn": product.get("pn"),
+            "reference_price": product.get("reference_price"),
+            "avgPrice": avg_prices,
+            "minPrice": min_prices,
+            "maxPrice": max_prices,
+            "summary": summary
+        })
+
+    spread = []
+    cheapest_count: Dict[int, int] = {}
+    for i, timestamp in enumerate(timestamps):
+        prices = [(item["avgPrice"][i], item["product_db_id"]) for item in series if item["avgPrice"][i] is not None]
+        if len(prices) < 2:
+            continue
+        low, cheapest = min(prices)
+        high = max(price for price, _ in prices)
+        cheapest_count[cheapest] = cheapest_count.get(cheapest, 0) + 1
+        spread.append({
+            "timestamp": timestamp,
+            "min": low,
+            "max": high,
+            "spread": round(high - low, 2),
+            "spreadPct": round((high - low) / low * 100, 2) if low else None,
+            "cheapest": cheapest
+        })
+
+    spreads = [point["spread"] for point in spread]
+    return {
+        "timestamps": timestamps,
+        "dates": [datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime("%Y-%m-%d") for timestamp in timestamps],
+        "series": series,
+        "spread": spread,
+        "spreadSummary": {
+            "points": len(spread),
+            "avgSpread": round(sum(spreads) / len(spreads), 2) if spreads else None,
+            "maxSpread": max(spreads) if spreads else None,
+            "cheapestMostOften": max(cheapest_count, key=cheapest_count.get) if cheapest_count else None
+        }
+    }
+
+
+# Tendências de busca
+
+def search_trends_query(start_date: str, term_field: str = "search_term.keyword", size: int = 10) -> Dict[str, Any]:
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "search_terms": {
+                "terms": {
+                    "field": term_field,
+                    "size": size
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_search_trends(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"term": bucket["key"], "count": bucket["doc_count"]}
+        for bucket in response["aggregations"]["search_terms"]["buckets"]
+    ]
+
+
+# Buscas diárias
+
+def daily_searches_query(start_date: str) -> Dict[str, Any]:
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "searches_per_day": {
+                "date_histogram": {
+                    "field": "timestamp",
+                    "calendar_interval": "1d"
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_daily_searches(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    daily_searches = []
+    for bucket in response["aggregations"]["searches_per_day"]["buckets"]:
+        # Formata a data como YYYY-MM-DD
+        date_str = datetime.fromtimestamp(bucket["key"] / 1000).strftime('%Y-%m-%d')
+        daily_searches.append({
+            "date": date_str,
+            "count": bucket["doc_count"]
+        })
+
+    return daily_searches
+
+
+# Produtos melhor avaliados
+
+def top_rated_query(start_date: str, size: int, rating_field: str = "rating") -> Dict[str, Any]:
+    return {
+        "query": _period_filter(start_date),
+        "sort": [
+            {
+                rating_field: {
+                    "order": "desc"
+                }
+            }
+        ],
+        "size": size
+    }
+
+
+def parse_top_rated(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    top_rated = []
+    for hit in response["hits"]["hits"]:
+        product = hit["_source"]
+        top_rated.append({
+            "id": product.get("id", hit["_id"]),
+            "title": product.get("title", "Sem título"),
+            "price": product.get("price", 0),
+            "rating": product.get("rating", 0),
+            "seller": product.get("seller", "Desconhecido"),
+            "timestamp": product.get("timestamp", "")
+        })
+
+    return top_rated
+
+
+# Distribuição por categoria
+
+def category_distribution_query(start_date: str) -> Dict[str, Any]:
+    # category é calculado na ingestão (derived_fields), a partir das categorias dos produtos cadastrados
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "categories": {
+                "terms": {
+                    "field": "category",
+                    "size": 100
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_category_distribution(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Os buckets do terms já vêm ordenados por contagem (maior primeiro)
+    return [
+        {"name": bucket["key"], "value": bucket["doc_count"]}
+        for bucket in response["aggregations"]["categories"]["buckets"]
+        if bucket["doc_count"] > 0
+    ]
+
+
+# Disponibilidade de estoque
+
+def stock_availability_query(start_date: str) -> Dict[str, Any]:
+    # availability_status é calculado na ingestão (derived_fields); a contagem cobre todo o período
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "availability": {
+                "terms": {
+                    "field": "availability_status",
+                    "size": 10
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def parse_stock_availability(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Os buckets do terms já vêm ordenados por contagem (maior primeiro)
+    return [
+        {"status": bucket["key"], "count": bucket["doc_count"]}
+        for bucket in response["aggregations"]["availability"]["buckets"]
+        if bucket["doc_count"] > 0
+    ]
+
+
+# Desempenho de vendedores
+
+def _seller_summary(name: Optional[str], doc_count: int, avg_rating: Optional[float],
+                    avg_price: Optional[float]) -> Dict[str, Any]:
+    return {
+        "name": name or "Desconhecido",
+        "reputation": round(avg_rating or 4.0, 1),  # Default para 4.0 se null
+        # Estimar número de vendas baseado em popularidade (doc_count)
+        "sales": doc_count * 10,  # Multiplicador arbitrário para ilustração
+        "products": doc_count,
+        "avgPrice": round(avg_price or 0, 2)
+    }
+
+
+def parse_seller_performance(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    seller_performance = [
+        _seller_summary(bucket["key"], bucket["doc_count"],
+                        bucket["avg_rating"]["value"], bucket["avg_price"]["value"])
+        for bucket in response["aggregations"]["sellers"]["buckets"]
+    ]
+
+    # Ordena por número de produtos (popularidade)
+    seller_performance.sort(key=lambda x: x["products"], reverse=True)
+    return seller_performance
+
+
+def rank_seller_performance(sellers: List[Dict[str, Any]], limit: int = 10) -> List[Dict[str, Any]]:
+    """Ranking exato do widget a partir das estatísticas de todos os vendedores (parse_seller_stats)"""
+    ranked = sorted(sellers, key=lambda seller: (-seller["snapshots"], seller["name"]))[:limit]
+    return [
+        _seller_summary(seller["name"], seller["snapshots"], seller["rating"]["avg"], seller["price"]["avg"])
+        for seller in ranked
+    ]
+
+
+# Estatísticas paginadas de vendedores (composite aggregation)
+
+def seller_stats_query(start_date: str, size: int, after: Optional[Dict[str, Any]] = None,
+                       seller_field: str = "seller.keyword", price_field: str = "price",
+                       rating_field: str = "rating") -> Dict[str, Any]:
+    """
+    Uma página de vendedores em ordem de nome. A composite aggregation percorre
+    todos os vendedores do período, página a página, sem o erro de contagem nem
+    o custo de memória de um terms com size grande.
+    """
+    composite: Dict[str, Any] = {
+        "size": size,
+        "sources": [{"seller": {"terms": {"field": seller_field}}}]
+    }
+    if after:
+        composite["after"] = after
+
+    return {
+        "query": _period_filter(start_date),
+        "aggs": {
+            "sellers": {
+                "composite": composite,
+                "aggs": {
+                    "listings": {"cardinality": {"field": "listing_id"}},
+                    "price_stats": {"stats": {"field": price_field}},
+                    "price_percentiles": {
+                        "percentiles": {"field": price_field, "percents": SELLER_PRICE_PERCENTILES}
+                    },
+                    "rating_stats": {"stats": {"field": rating_field}}
+                }
+            }
+        },
+        "size": 0
+    }
+
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+def parse_seller_stats(response: Dict[str, Any], size: int) -> Dict[str, Any]:
+    """Página de vendedores e o cursor da próxima (None na última página)"""
+    aggregation = response["aggregations"]["sellers"]
+    sellers = []
+    for bucket in aggregation["buckets"]:
+        price = bucket["price_stats"]
+        rating = bucket["rating_stats"]
+        percentiles = bucket["price_percentiles"]["values"]
+        sellers.append({
+            "name": bucket["key"]["seller"],
+            "snapshots": bucket["doc_count"],
+            "listings": bucket["listings"]["value"],
+            "price": {
+                "min": _round(price["min"]),
+                "max": _round(price["max"]),
+                "avg": _round(price["avg"]),
+                **{
+                    f"p{percent}": _round(percentiles.get(f"{float(percent)}"))
+                    for percent in SELLER_PRICE_PERCENTILES
+                }
+            },
+            "rating": {
+                "avg": _round(rating["avg"]),
+                "min": rating["min"],
+                "max": rating["max"],
+                "count": rating["count"]
+            }
+        })
+
+    # Uma página incompleta é a última; o after_key continua presente nela
+    after_key = aggregation.get("after_key")
+    next_cursor = encode_cursor(after_key) if after_key and len(sellers) == size else None
+    return {"sellers": sellers, "next_cursor": next_cursor}
+
+
+def encode_cursor(after_key: Dict[str, Any]) -> str:
+    """Cursor opaco para a API a partir do after_key da composite aggregation"""
+    return base64.urlsafe_b64encode(json.dumps(after_key, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        after_key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    if not isinstance(after_key, dict) or "seller" not in after_key:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return after_key
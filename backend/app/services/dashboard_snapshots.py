@@ -0,0 +1,422 @@
+"""
+Snapshots materializados do dashboard e das telas de analytics.
+
+As rotas marcadas com @materialized são calculadas de antemão para os períodos
+padrão (DASHBOARD_SNAPSHOT_PERIODS, 7/30/90 dias) e gravadas já serializadas,
+com a versão dos dados (a geração do query_cache) e um ETag. Uma requisição
+com os parâmetros de um snapshot é respondida direto da memória (ou do Redis,
+quando o cache de consultas usa Redis) sem consultar o Elasticsearch; o
+ConditionalGetMiddleware responde 304 quando o If-None-Match do cliente
+coincide com o ETag.
+
+O recálculo é agendado pelo caminho de ingestão (ElasticsearchService.after_ingest)
+e só roda depois de DASHBOARD_SNAPSHOT_DELAY_SECONDS sem novas ingestões, ou
+seja, uma vez ao final de cada rastreamento. Enquanto ele não termina, os
+snapshots anteriores continuam sendo servidos; uma requisição que encontra um
+snapshot de geração antiga (por exemplo, após uma ingestão feita por outro
+processo) agenda o recálculo.
+
+Cada snapshot também guarda o início da janela (period_start_iso do
+period_days) com que foi calculado. Quando o limite da janela avança (virada
+do dia ou da hora, conforme ANALYTICS_WINDOW_ALIGNMENT) o snapshot deixa de
+ser servido, mesmo sem novas ingestões: a requisição é calculada normalmente e
+o recálculo é agendado.
+"""
+
+import json
+import time
+import asyncio
+import inspect
+import hashlib
+import logging
+import functools
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from app.core.config import settings
+from app.core.responses import dumps_json
+from app.core.time_windows import period_start_iso
+from app.services.query_cache import query_cache, track_degraded
+
+logger = logging.getLogger(__name__)
+
+# Prefixo das chaves dos snapshots e da trava de materialização no Redis
+REDIS_SNAPSHOT_PREFIX = "dashboard-snapshot"
+REDIS_LOCK_KEY = "dashboard-snapshot:lock"
+# Tempo máximo de uma materialização antes de a trava expirar
+LOCK_TIMEOUT_SECONDS = 600
+
+
+def snapshot_periods() -> List[int]:
+    """Períodos (em dias) materializados"""
+    return [int(value) for value in settings.DASHBOARD_SNAPSHOT_PERIODS.split(",") if value.strip()]
+
+
+def _default_params(func: Callable) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Valores padrão dos parâmetros da rota, como o FastAPI os passaria numa
+    requisição sem query string, e os nomes dos parâmetros obrigatórios
+    """
+    defaults, required = {}, []
+    for name, parameter in inspect.signature(func).parameters.items():
+        default = parameter.default
+        if hasattr(default, "is_required"):
+            default = inspect.Parameter.empty if default.is_required() else default.default
+        if default is inspect.Parameter.empty:
+            required.append(name)
+        else:
+            defaults[name] = default
+    return defaults, required
+
+
+def _normalize(params: Dict[str, Any]) -> str:
+    return json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+
+
+def window_start(params: Dict[str, Any]) -> Optional[str]:
+    """Início da janela usada pela rota; None para rotas sem period_days"""
+    if params.get("period_days") is None:
+        return None
+    return period_start_iso(int(params["period_days"]))
+
+
+class Snapshot:
+    """Resposta pré-serializada de uma rota para um conjunto de parâmetros"""
+
+    __slots__ = ("endpoint", "params", "version", "etag", "materialized_at", "period_start", "body")
+
+    def __init__(self, endpoint: str, params: Dict[str, Any], version: int,
+                 materialized_at: str, body: bytes, etag: Optional[str] = None,
+                 period_start: Optional[str] = None):
+        self.endpoint = endpoint
+        self.params = params
+        self.version = version
+        self.materialized_at = materialized_at
+        self.period_start = period_start
+        self.body = body
+        self.etag = etag or f'"{hashlib.sha1(body).hexdigest()}"'
+
+    @classmethod
+    def from_payload(cls, endpoint: str, params: Dict[str, Any], version: int, payload: Any,
+                     period_start: Optional[str] = None) -> "Snapshot":
+        # Mesma serialização da classe de resposta padrão da API
+        body = dumps_json(jsonable_encoder(payload))
+        return cls(endpoint, params, version, datetime.now().isoformat(), body, period_start=period_start)
+
+    @property
+    def expired(self) -> bool:
+        """A janela da rota avançou desde o cálculo do snapshot"""
+        return self.period_start != window_start(self.params)
+
+    def response(self) -> Response:
+        return Response(
+            content=self.body,
+            media_type="application/json",
+            headers={
+                "ETag": self.etag,
+                # O navegador sempre revalida; a revalidação custa um 304 sem corpo
+                "Cache-Control": "no-cache",
+                "X-Snapshot-Version": str(self.version),
+                "X-Snapshot-Materialized-At": self.materialized_at
+            }
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "endpoint": self.endpoint,
+            "params": self.params,
+            "version": self.version,
+            "etag": self.etag,
+            "materialized_at": self.materialized_at,
+            "period_start": self.period_start,
+            "body": self.body.decode("utf-8")
+        })
+
+    @classmethod
+    def from_json(cls, raw: Any) -> "Snapshot":
+        data = json.loads(raw)
+        return cls(data["endpoint"], data["params"], data["version"], data["materialized_at"],
+                   data["body"].encode("utf-8"), etag=data["etag"], period_start=data.get("period_start"))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "params": self.params,
+            "version": self.version,
+            "etag": self.etag,
+            "materialized_at": self.materialized_at,
+            "period_start": self.period_start,
+            "bytes": len(self.body)
+        }
+
+
+class DashboardSnapshots:
+    """Registro das rotas materializadas, armazenamento e agendamento do recálculo"""
+
+    def __init__(self):
+        # endpoint -> (função original da rota, variantes de parâmetros fixos)
+        self._routes: Dict[str, Tuple[Callable, List[Dict[str, Any]]]] = {}
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+        self._last_run: Optional[Dict[str, Any]] = None
+        # Limite de janela (period_start_iso(0)) para o qual um recálculo já foi agendado
+        self._scheduled_window: Optional[str] = None
+
+    # Registro
+
+    def register(self, endpoint: str, func: Callable, fixed_params: Dict[str, Any]) -> None:
+        with self._lock:
+            _, variants = self._routes.get(endpoint, (func, []))
+            variants.append(fixed_params)
+            self._routes[endpoint] = (inspect.unwrap(func), variants)
+
+    def _targets(self) -> List[Tuple[str, Callable, Dict[str, Any]]]:
+        """(endpoint, função, parâmetros) de cada snapshot a materializar"""
+        with self._lock:
+            routes = list(self._routes.items())
+
+        targets = []
+        for endpoint, (func, variants) in routes:
+            defaults, required = _default_params(func)
+            for fixed in variants:
+                missing = [name for name in required if name not in fixed]
+                if missing:
+                    logger.warning(f"Rota '{endpoint}' sem valor para {missing}; não será materializada")
+                    continue
+                params = dict(defaults, **fixed)
+                if "period_days" not in params:
+                    targets.append((endpoint, func, params))
+                    continue
+                for period in snapshot_periods():
+                    targets.append((endpoint, func, dict(params, period_days=period)))
+        return targets
+
+    # Armazenamento
+
+    def _key(self, endpoint: str, params: Dict[str, Any]) -> str:
+        return f"{REDIS_SNAPSHOT_PREFIX}:{endpoint}:{_normalize(params)}"
+
+    def get(self, endpoint: str, params: Dict[str, Any]) -> Optional[Snapshot]:
+        """
+        Snapshot dos parâmetros, da memória ou do Redis; None se não houver ou
+        se a janela da rota já avançou (Snapshot.expired)
+        """
+        if not settings.DASHBOARD_SNAPSHOTS_ENABLED:
+            return None
+
+        key = self._key(endpoint, params)
+        snapshot = self._snapshots.get(key)
+        generation = query_cache.generation
+
+        redis = query_cache.redis
+        if redis is not None and (snapshot is None or snapshot.version < generation or snapshot.expired):
+            # Outro worker pode já ter materializado uma versão mais nova
+            try:
+                raw = redis.get(key)
+                if raw is not None:
+                    stored = Snapshot.from_json(raw)
+                    if snapshot is None or (stored.version, stored.materialized_at) > \
+                            (snapshot.version, snapshot.materialized_at):
+                        snapshot = stored
+                        self._snapshots[key] = stored
+            except Exception as e:
+                logger.warning(f"Erro ao ler snapshot do dashboard no Redis: {e}")
+
+        if snapshot is not None and snapshot.expired:
+            # Uma vez por limite de janela, mesmo que a materialização falhe
+            boundary = period_start_iso(0)
+            if self._scheduled_window != boundary:
+                self._scheduled_window = boundary
+                self.schedule_refresh(0, replace=False)
+            return None
+
+        last_version = self._last_run["version"] if self._last_run else -1
+        if snapshot is not None and snapshot.version < generation and last_version < generation:
+            self.schedule_refresh(0, replace=False)
+        return snapshot
+
+    def _store(self, snapshot: Snapshot) -> None:
+        key = self._key(snapshot.endpoint, snapshot.params)
+        self._snapshots[key] = snapshot
+
+        redis = query_cache.redis
+        if redis is not None:
+            try:
+                redis.set(key, snapshot.to_json())
+            except Exception as e:
+                logger.warning(f"Erro ao gravar snapshot do dashboard no Redis: {e}")
+
+    # Materialização
+
+    def schedule_refresh(self, delay: Optional[float] = None, replace: bool = True) -> None:
+        """
+        Agenda a materialização. Com replace=True (ingestão) o prazo é
+        reiniciado a cada chamada, de modo que os vários lotes de um
+        rastreamento geram um único recálculo ao final.
+        """
+        if not settings.DASHBOARD_SNAPSHOTS_ENABLED or not self._routes:
+            return
+        if delay is None:
+            delay = settings.DASHBOARD_SNAPSHOT_DELAY_SECONDS
+
+        with self._lock:
+            if self._timer is not None:
+                if not replace:
+                    return
+                self._timer.cancel()
+            elif self._running and not replace:
+                return
+            self._timer = threading.Timer(delay, self._run_scheduled)
+            self._timer.name = "dashboard-snapshots"
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run_scheduled(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            asyncio.run(self.materialize())
+        except Exception as e:
+            logger.error(f"Erro ao materializar snapshots do dashboard: {e}")
+
+    def _acquire(self) -> bool:
+        """Uma materialização por vez no processo e, com Redis, entre workers"""
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+
+        redis = query_cache.redis
+        if redis is not None:
+            try:
+                if not redis.set(REDIS_LOCK_KEY, "1", nx=True, ex=LOCK_TIMEOUT_SECONDS):
+                    with self._lock:
+                        self._running = False
+                    return False
+            except Exception as e:
+                logger.warning(f"Erro ao obter trava de materialização no Redis: {e}")
+        return True
+
+    def _release(self) -> None:
+        redis = query_cache.redis
+        if redis is not None:
+            try:
+                redis.delete(REDIS_LOCK_KEY)
+            except Exception as e:
+                logger.warning(f"Erro ao liberar trava de materialização no Redis: {e}")
+        with self._lock:
+            self._running = False
+
+    async def materialize(self) -> Dict[str, Any]:
+        """Recalcula todos os snapshots e retorna um resumo da execução"""
+        from app.services.elasticsearch_service import ElasticsearchUnavailable
+        from app.services.es_metrics import current_endpoint
+
+        if not self._acquire():
+            logger.info("Materialização do dashboard já em andamento; ignorando")
+            return {"success": False, "message": "Materialização já em andamento"}
+
+        token = current_endpoint.set("materializacao-dashboard")
+        version = query_cache.generation
+        started = time.perf_counter()
+        stored, failed = 0, []
+        completed, retry_after = True, None
+        try:
+            for endpoint, func, params in self._targets():
+                try:
+                    with track_degraded() as degraded:
+                        payload = await func(**params)
+                    if degraded or (isinstance(payload, dict) and payload.get("success") is False):
+                        # Mantém o snapshot anterior em vez de fixar uma falha parcial
+                        failed.append(endpoint)
+                        continue
+                    self._store(Snapshot.from_payload(endpoint, params, version, payload,
+                                                      period_start=window_start(params)))
+                    stored += 1
+                except ElasticsearchUnavailable as e:
+                    # Sem cluster não adianta seguir; tenta de novo quando ele deve voltar
+                    logger.warning("Elasticsearch indisponível; materialização do dashboard adiada")
+                    failed.append(endpoint)
+                    completed, retry_after = False, e.retry_after
+                    break
+                except HTTPException as e:
+                    failed.append(endpoint)
+                    logger.error(f"Erro ao materializar '{endpoint}' {params}: {e.detail}")
+                except Exception as e:
+                    # Erros de serialização ou da própria rota não interrompem os demais snapshots
+                    failed.append(endpoint)
+                    logger.error(f"Erro ao materializar '{endpoint}' {params}: {e}")
+        finally:
+            # Sempre libera a trava (também no Redis), mesmo com erro inesperado
+            current_endpoint.reset(token)
+            self._finish(version, started, stored, failed, completed)
+            self._release()
+
+        if retry_after is not None:
+            self.schedule_refresh(retry_after)
+        return self._last_run
+
+    def _finish(self, version: int, started: float, stored: int, failed: List[str], completed: bool) -> None:
+        elapsed = time.perf_counter() - started
+        self._last_run = {
+            "success": completed and not failed,
+            "version": version,
+            "finished_at": datetime.now().isoformat(),
+            "seconds": round(elapsed, 3),
+            "snapshots": stored,
+            "failed": sorted(set(failed))
+        }
+        logger.info(
+            f"Snapshots do dashboard materializados: {stored} em {elapsed:.2f}s "
+            f"(versão {version}, {len(failed)} falhas)"
+        )
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._timer is not None
+            running = self._running
+        return {
+            "enabled": settings.DASHBOARD_SNAPSHOTS_ENABLED,
+            "periods": snapshot_periods(),
+            "generation": query_cache.generation,
+            "pending": pending,
+            "running": running,
+            "last_run": self._last_run,
+            "snapshots": sorted(
+                (snapshot.describe() for snapshot in list(self._snapshots.values())),
+                key=lambda item: (item["endpoint"], _normalize(item["params"]))
+            )
+        }
+
+
+dashboard_snapshots = DashboardSnapshots()
+
+
+def materialized(endpoint: str, **fixed_params: Any) -> Callable:
+    """
+    Decorador para rotas GET de dashboard/analytics, aplicado por fora do
+    @cached_query. A rota é materializada para os períodos padrão com seus
+    parâmetros padrão (mais fixed_params, para rotas com parâmetros
+    obrigatórios); requisições com exatamente esses parâmetros recebem o
+    snapshot. Pode ser empilhado para materializar mais de uma variante.
+    """
+    def decorator(func: Callable) -> Callable:
+        dashboard_snapshots.register(endpoint, func, fixed_params)
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            snapshot = dashboard_snapshots.get(endpoint, kwargs)
+            if snapshot is not None:
+                return snapshot.response()
+            return await func(**kwargs)
+
+        return wrapper
+
+    return decorator
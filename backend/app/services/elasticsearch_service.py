@@ -5,11 +5,18 @@ Este módulo fornece uma classe para conectar, indexar e buscar dados no Elastic
 """
 
 import os
-import uuid
+import re
+import time
+import hashlib
 import logging
+import threading
 from datetime import datetime, timedelta
 from elasticsearch import Elasticsearch, helpers
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
+
+from app.core.categories import main_category
+from .es_metrics import InstrumentedClient
+from .analytics_queries import price_band
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,14 +24,494 @@ logger = logging.getLogger(__name__)
 
 # Configurações do Elasticsearch
 ES_INDEX = "hp-traker-ml"
+# Índice com o resumo diário de preços (produto × vendedor × dia)
+ES_ROLLUP_INDEX = "hp-traker-ml-daily-prices"
+
+# Índice com as estatísticas acumuladas de preço (produto × vendedor), atualizadas na ingestão
+ES_PRICE_STATS_INDEX = "hp-traker-ml-price-stats"
+
+# Índice de alertas de preço: um alerta por regra, anúncio e dia (price_alerts)
+ES_PRICE_ALERTS_INDEX = "hp-traker-ml-price-alerts"
+
+# Índice de avaliações: cada comentário é gravado uma única vez por anúncio
+ES_REVIEWS_INDEX = "hp-traker-ml-reviews"
+
+# ID do anúncio no Mercado Livre (MLB123, MLB-123 ou wid=MLB123 nas URLs)
+MLB_ID_PATTERN = re.compile(r"MLB-?(\d+)", re.IGNORECASE)
+
+# Campos do snapshot adicionados depois da criação do índice (aplicados também a índices existentes)
+SNAPSHOT_EXTRA_MAPPINGS = {
+    "listing_id": {"type": "keyword"},
+    "num_comentarios": {"type": "integer"},
+    # Campos derivados calculados na ingestão (derived_fields)
+    "availability_status": {"type": "keyword"},
+    "stock_bucket": {"type": "keyword"},
+    "price_band": {"type": "keyword"},
+    "category": {"type": "keyword"},
+    "product_key": {"type": "keyword"}
+}
+
+# Palavras no título que indicam promoção
+PROMOTION_KEYWORDS = ["promoção", "promocao", "desconto", "oferta"]
+
+# Faixas de estoque (limite superior inclusivo → rótulo); acima da última: "100+"
+STOCK_BUCKETS = [(5, "1-5"), (20, "6-20"), (100, "21-100")]
+
+# Remove os comentários embutidos de snapshots antigos, mantendo apenas a contagem
+REMOVE_EMBEDDED_REVIEWS_SCRIPT = """
+if (ctx._source.containsKey('comentarios')) {
+    ctx._source.num_comentarios = ctx._source.comentarios == null ? 0 : ctx._source.comentarios.size();
+    ctx._source.remove('comentarios');
+}
+"""
+
+# Script de mesclagem usado ao atualizar um documento de resumo já existente
+ROLLUP_MERGE_SCRIPT = """
+def s = ctx._source;
+s.min_price = Math.min(s.min_price, params.min_price);
+s.max_price = Math.max(s.max_price, params.max_price);
+s.sum_price += params.sum_price;
+s.count += params.count;
+s.avg_price = s.sum_price / s.count;
+if (params.last_seen >= s.last_seen) {
+    s.last_price = params.last_price;
+    s.last_seen = params.last_seen;
+}
+"""
+
+# Documentos de estatísticas (um por vendedor) lidos por página em get_price_stats
+PRICE_STATS_PAGE_SIZE = 1000
+
+# Atualização incremental das estatísticas de preço: Welford para média e variância
+# e EWMA, aplicados a cada preço do lote em ordem de timestamp (O(1) por snapshot)
+PRICE_STATS_UPDATE_SCRIPT = """
+def s = ctx._source;
+for (int i = 0; i < params.prices.size(); i++) {
+    double x = params.prices[i];
+    s.count += 1;
+    double delta = x - s.mean;
+    s.mean += delta / s.count;
+    s.m2 += delta * (x - s.mean);
+    s.ewma = s.count == 1 ? x : params.alpha * x + (1 - params.alpha) * s.ewma;
+    s.min_price = s.count == 1 ? x : Math.min(s.min_price, x);
+    s.max_price = s.count == 1 ? x : Math.max(s.max_price, x);
+}
+s.variance = s.count > 1 ? s.m2 / (s.count - 1) : 0.0;
+s.stddev = Math.sqrt(s.variance);
+if (params.last_seen >= s.last_seen) {
+    s.last_price = params.last_price;
+    s.last_seen = params.last_seen;
+}
+"""
+
+
+def _first_value(doc: Dict[str, Any], *fields: str, default: Any = None) -> Any:
+    """Retorna o primeiro campo presente no documento (nomes em inglês ou português)"""
+    for field in fields:
+        value = doc.get(field)
+        if value is not None and value != "":
+            return value
+    return default
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Converte o timestamp de um documento em datetime, ignorando valores inválidos"""
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def rollup_product_key(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Chave do produto usada no resumo diário: o ID do produto cadastrado quando
+    existir, ou o título normalizado para documentos antigos.
+    """
+    product_db_id = doc.get("product_db_id")
+    if product_db_id is not None:
+        return f"db:{product_db_id}"
+    title = _first_value(doc, "title", "titulo")
+    if not title:
+        return None
+    return f"title:{str(title).strip().lower()}"
+
+
+def rollup_search_term(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Termo de busca normalizado do snapshot, usado para atribuir a um produto
+    cadastrado os documentos sem product_db_id (mesma regra dos alertas)
+    """
+    term = _first_value(doc, "search_term", "busca")
+    if not term:
+        return None
+    return str(term).strip().lower()
+
+
+def price_stats_id(product_key: str, seller: str) -> str:
+    """ID do documento de estatísticas de um produto × vendedor"""
+    return hashlib.sha1(f"{product_key}|{seller}".encode("utf-8")).hexdigest()
+
+
+def combine_price_stats(stats: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Combina estatísticas de vários vendedores em uma só (fórmula paralela de
+    Chan para média e variância). A EWMA não é combinável e fica de fora.
+    """
+    stats = [item for item in stats if item.get("count")]
+    if not stats:
+        return None
+
+    count, mean, m2 = 0, 0.0, 0.0
+    for item in stats:
+        n = item["count"]
+        delta = item["mean"] - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += item["m2"] + delta * delta * count * n / total
+        count = total
+
+    latest = max(stats, key=lambda item: item["last_seen"])
+    variance = m2 / (count - 1) if count > 1 else 0.0
+    return {
+        "count": count,
+        "mean": mean,
+        "variance": variance,
+        "stddev": variance ** 0.5,
+        "min_price": min(item["min_price"] for item in stats),
+        "max_price": max(item["max_price"] for item in stats),
+        "last_price": latest["last_price"],
+        "last_seen": latest["last_seen"]
+    }
+
+
+def listing_key(doc: Dict[str, Any]) -> str:
+    """
+    Identifica o anúncio: ID do Mercado Livre, ID extraído da URL ou, sem ID,
+    título + vendedor (+ URL, quando houver), para que anúncios de mesmo título
+    de vendedores diferentes não sejam tratados como um só
+    """
+    url = _first_value(doc, "url", "link")
+    for value in (doc.get("product_id"), url):
+        if value:
+            match = MLB_ID_PATTERN.search(str(value))
+            if match:
+                return f"MLB{match.group(1)}"
+    if doc.get("product_id"):
+        return str(doc["product_id"])
+    parts = [str(_first_value(doc, "title", "titulo", default="")).strip().lower(),
+             str(_first_value(doc, "seller", "vendedor", default="")).strip().lower()]
+    if url:
+        parts.append(str(url).strip())
+    return "|".join(parts)
+
+
+def snapshot_id(doc: Dict[str, Any], bucket: Optional[str] = None) -> str:
+    """
+    ID determinístico de um snapshot: anúncio + produto + janela de tempo.
+    Reenvios e execuções repetidas dentro da mesma janela (SNAPSHOT_ID_BUCKET,
+    hora ou dia) geram o mesmo ID e substituem o documento em vez de duplicá-lo.
+    """
+    from ..core.config import settings
+
+    bucket = bucket or settings.SNAPSHOT_ID_BUCKET
+    timestamp = _parse_timestamp(doc.get("timestamp")) or datetime.now()
+    if bucket == "day":
+        window = timestamp.strftime("%Y-%m-%d")
+    else:
+        window = timestamp.strftime("%Y-%m-%dT%H")
+
+    product = _first_value(doc, "product_db_id", "pn", "search_term", "busca", default="")
+    key = f"{listing_key(doc)}|{product}|{window}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _stock_quantity(doc: Dict[str, Any]) -> Optional[int]:
+    value = _first_value(doc, "stock", "estoque", "available_quantity")
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_sold_out(doc: Dict[str, Any], price: Optional[float], stock: Optional[int]) -> bool:
+    """Sem preço, estoque zerado ou indicado como esgotado pelo rastreador"""
+    if not price or stock == 0 or doc.get("is_available") is False:
+        return True
+    availability = str(_first_value(doc, "availability", "disponibilidade", default="")).lower()
+    return "esgotado" in availability
+
+
+def derived_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Classificações do snapshot calculadas uma única vez na ingestão e gravadas
+    como keyword, para que os widgets usem agregações em vez de percorrer hits:
+
+    - availability_status: lista com "Esgotado", "Frete Grátis" e/ou "Em Estoque",
+      mais "Promoção" quando o título indica oferta (um documento pode contar em
+      mais de um status, como no widget de disponibilidade)
+    - stock_bucket: faixa do estoque informado ("esgotado", "1-5", ..., "desconhecido")
+    - price_band: faixa de preço com os mesmos rótulos da distribuição de preços
+    - category: categoria do produto cadastrado ou, nas buscas avulsas, pelo termo e título
+    - product_key: chave do produto (rollup_product_key), usada no collapse do top produtos
+    """
+    price = _first_value(doc, "price", "preco")
+    try:
+        price = float(price) if price is not None else None
+    except (TypeError, ValueError):
+        price = None
+    stock = _stock_quantity(doc)
+    sold_out = _is_sold_out(doc, price, stock)
+
+    statuses = []
+    if sold_out:
+        statuses.append("Esgotado")
+    if _first_value(doc, "free_shipping", "frete_gratis") is True:
+        statuses.append("Frete Grátis")
+    elif not sold_out:
+        statuses.append("Em Estoque")
+    title = str(_first_value(doc, "title", "titulo", default="")).lower()
+    if any(keyword in title for keyword in PROMOTION_KEYWORDS):
+        statuses.append("Promoção")
+
+    if sold_out:
+        stock_bucket = "esgotado"
+    elif stock is None:
+        stock_bucket = "desconhecido"
+    else:
+        stock_bucket = next((label for limit, label in STOCK_BUCKETS if stock <= limit), "100+")
+
+    return {
+        "availability_status": statuses,
+        "stock_bucket": stock_bucket,
+        "price_band": price_band(price),
+        "category": _document_category(doc, title),
+        "product_key": rollup_product_key(doc)
+    }
+
+
+def _document_category(doc: Dict[str, Any], title: str) -> str:
+    """
+    Categoria do produto cadastrado (pelo ID ou pelo termo de busca, já calculada
+    ao salvar o produto) ou, para buscas avulsas, pelas palavras-chave do termo
+    e do título
+    """
+    from .product_cache import get_registered_categories
+
+    term = str(_first_value(doc, "search_term", "busca", default="")).strip().lower()
+    registered = get_registered_categories()
+    product_db_id = doc.get("product_db_id")
+    if product_db_id is not None and product_db_id in registered["by_id"]:
+        return registered["by_id"][product_db_id]
+    if term in registered["by_term"]:
+        return registered["by_term"][term]
+    return (main_category(term) or main_category(title)
+            or _first_value(doc, "category", "family", default="Outros"))
+
+
+def _normalize_review(review: Any) -> Optional[Dict[str, Any]]:
+    """Aceita comentários como texto simples ou objetos {usuario, texto, data}"""
+    if isinstance(review, str):
+        review = {"texto": review}
+    if not isinstance(review, dict):
+        return None
+    text = _first_value(review, "texto", "text", "comentario", "content", default="")
+    if not str(text).strip():
+        return None
+    return {
+        "usuario": _first_value(review, "usuario", "user", "author"),
+        "texto": str(text).strip(),
+        "data": _first_value(review, "data", "date")
+    }
+
+
+def review_hash(review: Dict[str, Any]) -> str:
+    """Hash do conteúdo do comentário, estável entre rastreamentos"""
+    key = f"{review.get('usuario') or ''}|{review['texto']}|{review.get('data') or ''}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def extract_reviews(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Remove os comentários embutidos no snapshot (comentarios/reviews), guarda
+    apenas a contagem em num_comentarios e devolve os comentários normalizados.
+    """
+    raw = []
+    found = False
+    for field in ("comentarios", "reviews"):
+        if field in doc:
+            found = True
+            raw.extend(doc.pop(field) or [])
+
+    reviews = [review for review in (_normalize_review(item) for item in raw) if review]
+    if found:
+        doc["num_comentarios"] = len(reviews)
+    return reviews
+
+
+def review_actions(doc: Dict[str, Any], reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ações bulk (op_type create) que gravam os comentários de um snapshot no índice de avaliações"""
+    listing_id = doc.get("listing_id") or listing_key(doc)
+    actions = []
+    for review in reviews:
+        digest = review_hash(review)
+        actions.append({
+            "_op_type": "create",
+            "_index": ES_REVIEWS_INDEX,
+            "_id": hashlib.sha1(f"{listing_id}|{digest}".encode("utf-8")).hexdigest(),
+            "_source": {
+                **review,
+                "listing_id": listing_id,
+                "review_hash": digest,
+                "product_db_id": doc.get("product_db_id"),
+                "title": _first_value(doc, "title", "titulo"),
+                "first_seen": doc.get("timestamp") or datetime.now().isoformat()
+            }
+        })
+    return actions
+
+class ElasticsearchUnavailable(Exception):
+    """Elasticsearch fora do ar; a API responde em modo degradado enquanto reconecta"""
+
+    def __init__(self, last_error: Optional[str] = None, retry_after: int = 1):
+        super().__init__(f"Elasticsearch indisponível: {last_error or 'conectando'}")
+        self.last_error = last_error
+        self.retry_after = retry_after
 
 class ElasticsearchService:
     """Classe para interagir com o Elasticsearch."""
 
-    def __init__(self):
-        """Inicializa o serviço Elasticsearch."""
-        self.client = self.get_elasticsearch_client()
-        self.setup_index()
+    def __init__(self, connect: bool = False):
+        """
+        Inicializa o serviço Elasticsearch sem abrir conexão: ela é estabelecida
+        no primeiro uso de `client` (ou por connect_in_background na inicialização
+        da API), para que importar as rotas não dependa do cluster.
+        """
+        self._client = None
+        self._lock = threading.Lock()
+        self._reconnect_thread: Optional[threading.Thread] = None
+        self._backoff = 0.0
+        self._next_attempt_at = 0.0
+        self._last_error: Optional[str] = None
+        if connect:
+            self.connect()
+
+    @property
+    def client(self):
+        """Cliente conectado; levanta ElasticsearchUnavailable em modo degradado"""
+        if self._client is not None:
+            return self._client
+
+        # Primeiro uso: uma tentativa rápida, a menos que a reconexão em segundo plano já esteja ativa
+        if not self._reconnecting() and time.monotonic() >= self._next_attempt_at and self.connect():
+            return self._client
+
+        self._start_reconnect()
+        raise ElasticsearchUnavailable(self._last_error, self.retry_after)
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def available(self) -> bool:
+        return self._client is not None
+
+    @property
+    def retry_after(self) -> int:
+        """Segundos até a próxima tentativa de reconexão"""
+        return max(1, int(self._next_attempt_at - time.monotonic()) + 1)
+
+    def connect(self) -> bool:
+        """
+        Tenta conectar uma vez, com a sonda rápida de ES_PROBE_TIMEOUT_SECONDS,
+        e prepara os índices. Retorna False em caso de falha, sem levantar exceção.
+        """
+        from ..core.config import settings
+
+        with self._lock:
+            if self._client is not None:
+                return True
+            try:
+                raw_client = self.get_elasticsearch_client()
+            except Exception as e:
+                self._last_error = str(e)
+                self._backoff = min(max(self._backoff * 2, 1.0), settings.ES_RECONNECT_MAX_BACKOFF_SECONDS)
+                self._next_attempt_at = time.monotonic() + self._backoff
+                logger.warning(f"Elasticsearch indisponível, nova tentativa em {self._backoff:.0f}s: {e}")
+                return False
+
+            self._client = InstrumentedClient(raw_client, on_connection_lost=self._connection_lost)
+            self._backoff = 0.0
+            self._last_error = None
+
+        for setup in (self.setup_index, self.setup_rollup_index, self.setup_price_stats_index,
+                      self.setup_reviews_index, self.setup_price_alerts_index):
+            try:
+                setup()
+            except Exception as e:
+                logger.error(f"Erro ao preparar índices do Elasticsearch: {e}")
+        return True
+
+    def connect_in_background(self) -> None:
+        """Inicia a conexão sem bloquear quem chamou (usado na inicialização da API)"""
+        self._start_reconnect(immediate=True)
+
+    def _connection_lost(self, error: Exception) -> None:
+        """
+        Chamado pelo InstrumentedClient quando o cluster cai depois de
+        conectado: descarta o cliente, inicia a reconexão em segundo plano e
+        levanta ElasticsearchUnavailable (503 na API) no lugar do erro de conexão
+        """
+        from ..core.config import settings
+
+        with self._lock:
+            if self._client is not None:
+                self._client = None
+                self._last_error = str(error)
+                self._backoff = min(max(self._backoff * 2, 1.0), settings.ES_RECONNECT_MAX_BACKOFF_SECONDS)
+                self._next_attempt_at = time.monotonic() + self._backoff
+                logger.warning(f"Conexão com o Elasticsearch perdida, reconectando em segundo plano: {error}")
+        self._start_reconnect()
+        raise ElasticsearchUnavailable(self._last_error, self.retry_after) from error
+
+    def _reconnecting(self) -> bool:
+        return self._reconnect_thread is not None and self._reconnect_thread.is_alive()
+
+    def _start_reconnect(self, immediate: bool = False) -> None:
+        with self._lock:
+            if self._client is not None or self._reconnecting():
+                return
+            if immediate:
+                self._next_attempt_at = time.monotonic()
+            self._reconnect_thread = threading.Thread(target=self._reconnect_loop, name="es-reconnect", daemon=True)
+            self._reconnect_thread.start()
+
+    def _reconnect_loop(self) -> None:
+        """Tenta reconectar com backoff exponencial até conseguir"""
+        while self._client is None:
+            delay = self._next_attempt_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if self.connect():
+                logger.info("Conexão com o Elasticsearch restabelecida")
+                # Descarta resultados que possam ter sido guardados durante a queda
+                from .query_cache import query_cache
+                query_cache.bump_generation()
+                return
+
+    def status(self) -> Dict[str, Any]:
+        """Estado da conexão para a rota de saúde"""
+        return {
+            "conectado": self.available,
+            "reconectando": self._reconnecting(),
+            "ultimo_erro": self._last_error,
+            "proxima_tentativa_em": None if self.available else self.retry_after
+        }
 
     def get_elasticsearch_client(self):
         """Obtém um cliente Elasticsearch configurado com base nas variáveis de ambiente"""
@@ -52,8 +539,8 @@ class ElasticsearchService:
                     "Content-Type": "application/vnd.elasticsearch+json; compatible-with=8"
                 }
             )
-            # Verifica a conexão
-            client.info()
+            # Verifica a conexão com uma sonda rápida, sem as novas tentativas das consultas
+            self._probe(client)
             logger.info("Conectado ao Elasticsearch local com sucesso!")
             return client
         except Exception as e:
@@ -63,13 +550,18 @@ class ElasticsearchService:
             logger.info(f"Tentando conectar ao Elasticsearch na nuvem: {es_cloud_url}")
             try:
                 client = Elasticsearch(es_cloud_url, api_key=es_api_key)
-                client.info()
+                self._probe(client)
                 logger.info("Conectado ao Elasticsearch na nuvem com sucesso!")
                 return client
             except Exception as cloud_e:
                 logger.error(f"Falha ao conectar ao Elasticsearch na nuvem: {cloud_e}")
                 raise
 
+    def _probe(self, client) -> None:
+        from ..core.config import settings
+
+        client.options(request_timeout=settings.ES_PROBE_TIMEOUT_SECONDS, max_retries=0).info()
+
     def setup_index(self):
         """Configura o índice no Elasticsearch caso não exista"""
         try:
@@ -111,14 +603,8 @@ class ElasticsearchService:
                         "url": {"type": "keyword"},
                         "avaliacao": {"type": "float"},
                         "num_avaliacoes": {"type": "integer"},
-                        "comentarios": {
-                            "type": "nested",
-                            "properties": {
-                                "usuario": {"type": "keyword"},
-                                "texto": {"type": "text"},
-                                "data": {"type": "date"}
-                            }
-                        }
+                        # Os comentários ficam em ES_REVIEWS_INDEX; o snapshot guarda só a contagem
+                        **SNAPSHOT_EXTRA_MAPPINGS
                     }
                 }
 
@@ -129,13 +615,184 @@ class ElasticsearchService:
                 logger.info(f"Índice '{ES_INDEX}' criado com sucesso!")
             else:
                 logger.info(f"Índice '{ES_INDEX}' já existe.")
+                self._ensure_snapshot_mappings()
+                self._warn_missing_derived_fields()
         except Exception as e:
             logger.error(f"Erro ao configurar índice: {e}")
             raise
 
+    def _ensure_snapshot_mappings(self):
+        """Adiciona a índices antigos os campos criados depois da primeira versão"""
+        # Campo a campo: um conflito com um mapeamento dinâmico antigo não bloqueia os demais
+        for field, mapping in SNAPSHOT_EXTRA_MAPPINGS.items():
+            try:
+                self.client.indices.put_mapping(index=ES_INDEX, body={"properties": {field: mapping}})
+            except Exception as e:
+                logger.warning(f"Não foi possível mapear '{field}' em '{ES_INDEX}': {e}")
+
+    def _warn_missing_derived_fields(self):
+        """
+        Avisa na inicialização quando há snapshots sem product_key: eles não
+        aparecem no top produtos até scripts/backfill_derived_fields.py ser executado
+        """
+        try:
+            missing = self.client.count(
+                index=ES_INDEX, body={"query": {"bool": {"must_not": {"exists": {"field": "product_key"}}}}}
+            )["count"]
+        except Exception as e:
+            logger.warning(f"Não foi possível verificar os campos derivados de '{ES_INDEX}': {e}")
+            return
+        if missing:
+            logger.warning(f"{missing} snapshots sem product_key em '{ES_INDEX}'; execute "
+                           f"scripts/backfill_derived_fields.py para incluí-los no top produtos")
+
+    def setup_reviews_index(self):
+        """Configura o índice de avaliações caso não exista"""
+        try:
+            if not self.client.indices.exists(index=ES_REVIEWS_INDEX):
+                logger.info(f"Criando índice '{ES_REVIEWS_INDEX}' no Elasticsearch...")
+                mappings = {
+                    "properties": {
+                        "listing_id": {"type": "keyword"},
+                        "review_hash": {"type": "keyword"},
+                        "product_db_id": {"type": "integer"},
+                        "title": {"type": "text"},
+                        "usuario": {"type": "keyword"},
+                        "texto": {"type": "text"},
+                        # Datas vêm em formatos variados das páginas; valores inválidos são ignorados
+                        "data": {"type": "date", "ignore_malformed": True},
+                        "first_seen": {"type": "date"}
+                    }
+                }
+
+                self.client.indices.create(
+                    index=ES_REVIEWS_INDEX,
+                    body={"mappings": mappings}
+                )
+                logger.info(f"Índice '{ES_REVIEWS_INDEX}' criado com sucesso!")
+            else:
+                logger.info(f"Índice '{ES_REVIEWS_INDEX}' já existe.")
+        except Exception as e:
+            logger.error(f"Erro ao configurar índice de avaliações: {e}")
+            raise
+
+    def setup_price_alerts_index(self):
+        """Configura o índice de alertas de preço caso não exista"""
+        try:
+            if not self.client.indices.exists(index=ES_PRICE_ALERTS_INDEX):
+                logger.info(f"Criando índice '{ES_PRICE_ALERTS_INDEX}' no Elasticsearch...")
+                mappings = {
+                    "properties": {
+                        "alert_id": {"type": "keyword"},
+                        "rule_id": {"type": "keyword"},
+                        "level": {"type": "keyword"},
+                        "product_db_id": {"type": "integer"},
+                        "product_name": {"type": "keyword", "ignore_above": 256},
+                        "listing_id": {"type": "keyword"},
+                        "title": {"type": "text"},
+                        "seller": {"type": "keyword"},
+                        "url": {"type": "keyword"},
+                        "price": {"type": "float"},
+                        "threshold": {"type": "float"},
+                        "reference_price": {"type": "float"},
+                        "discount_pct": {"type": "float"},
+                        "timestamp": {"type": "date"},
+                        "created_at": {"type": "date"}
+                    }
+                }
+
+                self.client.indices.create(
+                    index=ES_PRICE_ALERTS_INDEX,
+                    body={"mappings": mappings}
+                )
+                logger.info(f"Índice '{ES_PRICE_ALERTS_INDEX}' criado com sucesso!")
+        except Exception as e:
+            logger.error(f"Erro ao configurar índice de alertas de preço: {e}")
+            raise
+
+    def setup_rollup_index(self):
+        """Configura o índice de resumo diário de preços caso não exista"""
+        try:
+            if not self.client.indices.exists(index=ES_ROLLUP_INDEX):
+                logger.info(f"Criando índice '{ES_ROLLUP_INDEX}' no Elasticsearch...")
+                mappings = {
+                    "properties": {
+                        "product_key": {"type": "keyword"},
+                        "product_db_id": {"type": "integer"},
+                        "search_term": {"type": "keyword"},
+                        "title": {
+                            "type": "text",
+                            "fields": {
+                                "keyword": {
+                                    "type": "keyword",
+                                    "ignore_above": 256
+                                }
+                            }
+                        },
+                        "seller": {"type": "keyword"},
+                        "day": {"type": "date", "format": "yyyy-MM-dd"},
+                        "min_price": {"type": "float"},
+                        "max_price": {"type": "float"},
+                        "avg_price": {"type": "float"},
+                        "sum_price": {"type": "double"},
+                        "last_price": {"type": "float"},
+                        "last_seen": {"type": "date", "format": "epoch_millis"},
+                        "count": {"type": "long"}
+                    }
+                }
+
+                self.client.indices.create(
+                    index=ES_ROLLUP_INDEX,
+                    body={"mappings": mappings}
+                )
+                logger.info(f"Índice '{ES_ROLLUP_INDEX}' criado com sucesso!")
+            else:
+                # Índices antigos: search_term foi adicionado depois (comparação de preços)
+                self.client.indices.put_mapping(
+                    index=ES_ROLLUP_INDEX, body={"properties": {"search_term": {"type": "keyword"}}}
+                )
+        except Exception as e:
+            logger.error(f"Erro ao configurar índice de resumo diário: {e}")
+            raise
+
+    def setup_price_stats_index(self):
+        """Configura o índice de estatísticas de preço caso não exista"""
+        try:
+            if not self.client.indices.exists(index=ES_PRICE_STATS_INDEX):
+                logger.info(f"Criando índice '{ES_PRICE_STATS_INDEX}' no Elasticsearch...")
+                mappings = {
+                    "properties": {
+                        "product_key": {"type": "keyword"},
+                        "product_db_id": {"type": "integer"},
+                        "title": {"type": "keyword", "ignore_above": 256},
+                        "seller": {"type": "keyword"},
+                        "count": {"type": "long"},
+                        "mean": {"type": "double"},
+                        "m2": {"type": "double"},
+                        "variance": {"type": "double"},
+                        "stddev": {"type": "double"},
+                        "ewma": {"type": "double"},
+                        "min_price": {"type": "float"},
+                        "max_price": {"type": "float"},
+                        "last_price": {"type": "float"},
+                        "last_seen": {"type": "date", "format": "epoch_millis"}
+                    }
+                }
+
+                self.client.indices.create(
+                    index=ES_PRICE_STATS_INDEX,
+                    body={"mappings": mappings}
+                )
+                logger.info(f"Índice '{ES_PRICE_STATS_INDEX}' criado com sucesso!")
+        except Exception as e:
+            logger.error(f"Erro ao configurar índice de estatísticas de preço: {e}")
+            raise
+
     def index_product(self, product_data: Dict[str, Any]) -> bool:
         """
-        Indexa um produto no Elasticsearch
+        Indexa um produto no Elasticsearch com semântica de upsert. Só um
+        documento criado passa por after_ingest; a atualização de um snapshot
+        da mesma janela não é derivada de novo (veja bulk_index_products)
 
         Args:
             product_data: Dicionário com os dados do produto
@@ -144,23 +801,22 @@ class ElasticsearchService:
             bool: True se o documento foi indexado com sucesso, False caso contrário
         """
         try:
-            # Garantir que temos um ID único para o documento
-            if "id" not in product_data:
-                product_data["id"] = str(uuid.uuid4())
+            reviews = extract_reviews(product_data)
+            doc_id = self._prepare_snapshot(product_data)
 
-            # Garantir que temos um timestamp
-            if "timestamp" not in product_data:
-                product_data["timestamp"] = datetime.now().isoformat()
-
-            # Indexar o documento
-            response = self.client.index(
+            # Mesmo ID na mesma janela de tempo: o documento é atualizado, não duplicado
+            response = self.client.update(
                 index=ES_INDEX,
-                id=product_data["id"],
-                body=product_data,
+                id=doc_id,
+                body={"doc": product_data, "doc_as_upsert": True},
                 refresh=True  # Garantir que o documento esteja disponível imediatamente para consulta
             )
 
-            logger.info(f"Produto indexado com sucesso: {response['result']} - ID: {product_data['id']}")
+            logger.info(f"Produto indexado com sucesso: {response['result']} - ID: {doc_id}")
+            if reviews:
+                self.index_reviews(review_actions(product_data, reviews))
+            if response["result"] != "noop":
+                self.after_ingest([product_data] if response["result"] == "created" else [])
             return True
         except Exception as e:
             logger.error(f"Erro ao indexar produto: {e}")
@@ -168,7 +824,16 @@ class ElasticsearchService:
 
     def bulk_index_products(self, products: List[Dict[str, Any]]) -> bool:
         """
-        Indexa vários produtos no Elasticsearch usando a API Bulk
+        Indexa vários produtos no Elasticsearch usando a API Bulk com semântica
+        de upsert: reenviar o mesmo lote não cria documentos duplicados
+
+        Só os documentos criados passam por after_ingest. Um documento
+        atualizado (mesmo snapshot_id na mesma janela) mantém as estruturas
+        derivadas do primeiro envio: o resumo diário e as estatísticas são
+        acumulativos e contariam o snapshot duas vezes, e o histórico no banco
+        ignora snapshots já gravados. A troca aceita é que uma mudança de preço
+        dentro da mesma janela só aparece no documento bruto; para refletir,
+        reconstrua as estruturas (scripts/rebuild_*).
 
         Args:
             products: Lista de dicionários com os dados dos produtos
@@ -179,32 +844,705 @@ class ElasticsearchService:
         try:
             # Formatar documentos para a API Bulk
             bulk_docs = []
+            reviews = []
             for product in products:
-                # Garantir que temos um ID único para o documento
-                if "id" not in product:
-                    product["id"] = str(uuid.uuid4())
-
-                # Garantir que temos um timestamp
-                if "timestamp" not in product:
-                    product["timestamp"] = datetime.now().isoformat()
-
+                # Comentários vão para o índice de avaliações, não para o snapshot
+                product_reviews = extract_reviews(product)
                 bulk_docs.append({
+                    "_op_type": "update",
                     "_index": ES_INDEX,
-                    "_id": product["id"],
-                    "_source": product
+                    "_id": self._prepare_snapshot(product),
+                    "doc": product,
+                    "doc_as_upsert": True
                 })
+                reviews.extend(review_actions(product, product_reviews))
+
+            if not bulk_docs:
+                return False
+
+            results = {"created": 0, "updated": 0, "noop": 0, "erros": 0}
+            created = []
+            for product, (ok, item) in zip(products, helpers.streaming_bulk(self.client, bulk_docs,
+                                                                            raise_on_error=False)):
+                result = item.get("update", {}).get("result") if ok else None
+                if result in results:
+                    results[result] += 1
+                    if result == "created":
+                        created.append(product)
+                else:
+                    results["erros"] += 1
+                    logger.warning(f"Falha ao indexar produto em bulk: {item}")
+
+            logger.info(f"Resposta do bulk: {results}")
+            if reviews:
+                self.index_reviews(reviews)
+            if results["created"] or results["updated"]:
+                # Só documentos novos são derivados (veja a docstring)
+                self.after_ingest(created)
+            return results["erros"] == 0
+        except Exception as e:
+            logger.error(f"Erro ao indexar produtos em bulk: {e}")
+            return False
 
-            if bulk_docs:
-                bulk_response = helpers.bulk(self.client, bulk_docs)
-                logger.info(f"Resposta do bulk: {bulk_response}")
-                logger.info(f"Inseridos {bulk_response[0]} produtos com sucesso!")
-                return True
+    def _prepare_snapshot(self, product: Dict[str, Any]) -> str:
+        """Completa timestamp e id do documento e retorna o ID determinístico"""
+        # Garantir que temos um timestamp
+        if "timestamp" not in product:
+            product["timestamp"] = datetime.now().isoformat()
+
+        doc_id = snapshot_id(product)
+        product.setdefault("id", doc_id)
+        product.setdefault("listing_id", listing_key(product))
+        product.update(derived_fields(product))
+        return doc_id
+
+    def index_reviews(self, actions: List[Dict[str, Any]]) -> int:
+        """
+        Grava comentários no índice de avaliações. Cada comentário tem ID fixo por
+        anúncio e conteúdo, então os já gravados são rejeitados (409) e ignorados.
+
+        Returns:
+            int: Número de comentários novos
+        """
+        created = 0
+        try:
+            for ok, item in helpers.streaming_bulk(self.client, actions, raise_on_error=False):
+                status = item.get("create", {}).get("status")
+                if ok:
+                    created += 1
+                elif status != 409:
+                    logger.warning(f"Falha ao gravar comentário: {item}")
+            logger.info(f"Comentários: {created} novos de {len(actions)} recebidos")
+        except Exception as e:
+            logger.error(f"Erro ao gravar comentários: {e}")
+        return created
+
+    def after_ingest(self, products: List[Dict[str, Any]], evaluate_alerts: bool = True) -> None:
+        """
+        Atualiza as estruturas derivadas após uma ingestão bem-sucedida: resumo
+        diário, estatísticas de preço, alertas, histórico e cubo no banco,
+        geração do cache de consultas e snapshots do dashboard. Usado pela
+        ingestão normal e pela carga histórica, que pode desligar os alertas
+        (evaluate_alerts=False) para não disparar avisos sobre preços antigos.
+        """
+        self.update_price_rollup(products)
+        self.update_price_stats(products)
+        if evaluate_alerts:
+            self.evaluate_price_alerts(products)
+        if self.record_price_history(products):
+            self.refresh_price_cube(products)
+
+        # Novos dados tornam obsoletos os resultados de analytics em cache
+        from .query_cache import query_cache
+        query_cache.bump_generation()
+
+        # Os snapshots do dashboard são recalculados quando o rastreamento termina
+        from .dashboard_snapshots import dashboard_snapshots
+        dashboard_snapshots.schedule_refresh()
+
+    def record_price_history(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Grava os snapshots recém-indexados na tabela price_history do banco
+        relacional (COPY em lote no PostgreSQL)
+
+        Returns:
+            int: Número de linhas novas no histórico
+        """
+        from .price_history import price_history_store
+
+        try:
+            return price_history_store.ingest(products)
+        except Exception as e:
+            logger.error(f"Erro ao gravar histórico de preços no banco: {e}")
+            return 0
+
+    def refresh_price_cube(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Recalcula no cubo vendedor × produto × dia apenas os pares (produto, dia)
+        do lote recém-gravado no histórico
+
+        Returns:
+            int: Número de dias atualizados
+        """
+        from .price_cube import price_cube
+
+        try:
+            return price_cube.refresh_products(products)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar o cubo de preços: {e}")
+            return 0
+
+    def update_price_rollup(self, products: List[Dict[str, Any]]) -> bool:
+        """
+        Atualiza o resumo diário de preços com um lote recém-indexado.
+
+        O lote é agregado em memória por produto × vendedor × dia e cada grupo
+        gera um único upsert, de modo que o custo depende do número de grupos
+        e não do número de documentos.
+
+        Args:
+            products: Lista de documentos que acabaram de ser indexados
+
+        Returns:
+            bool: True se o resumo foi atualizado, False caso contrário
+        """
+        try:
+            groups: Dict[tuple, Dict[str, Any]] = {}
+            for product in products:
+                price = _first_value(product, "price", "preco")
+                timestamp = _parse_timestamp(product.get("timestamp"))
+                product_key = rollup_product_key(product)
+                if not price or timestamp is None or product_key is None:
+                    continue
+                try:
+                    price = float(price)
+                except (TypeError, ValueError):
+                    continue
+                if price <= 0:
+                    continue
+
+                seller = str(_first_value(product, "seller", "vendedor", default="Desconhecido"))
+                day = timestamp.date().isoformat()
+                last_seen = int(timestamp.timestamp() * 1000)
+
+                group = groups.get((product_key, seller, day))
+                if group is None:
+                    groups[(product_key, seller, day)] = {
+                        "product_key": product_key,
+                        "product_db_id": product.get("product_db_id"),
+                        "search_term": rollup_search_term(product),
+                        "title": _first_value(product, "title", "titulo", default=""),
+                        "seller": seller,
+                        "day": day,
+                        "min_price": price,
+                        "max_price": price,
+                        "sum_price": price,
+                        "count": 1,
+                        "last_price": price,
+                        "last_seen": last_seen
+                    }
+                    continue
+
+                group["min_price"] = min(group["min_price"], price)
+                group["max_price"] = max(group["max_price"], price)
+                group["sum_price"] += price
+                group["count"] += 1
+                if last_seen >= group["last_seen"]:
+                    group["last_price"] = price
+                    group["last_seen"] = last_seen
+
+            if not groups:
+                return False
+
+            actions = []
+            for group in groups.values():
+                group["avg_price"] = group["sum_price"] / group["count"]
+                doc_id = hashlib.sha1(
+                    f"{group['product_key']}|{group['seller']}|{group['day']}".encode("utf-8")
+                ).hexdigest()
+                actions.append({
+                    "_op_type": "update",
+                    "_index": ES_ROLLUP_INDEX,
+                    "_id": doc_id,
+                    "retry_on_conflict": 3,
+                    "script": {
+                        "source": ROLLUP_MERGE_SCRIPT,
+                        "lang": "painless",
+                        "params": {
+                            "min_price": group["min_price"],
+                            "max_price": group["max_price"],
+                            "sum_price": group["sum_price"],
+                            "count": group["count"],
+                            "last_price": group["last_price"],
+                            "last_seen": group["last_seen"]
+                        }
+                    },
+                    "upsert": group
+                })
 
+            helpers.bulk(self.client, actions)
+            logger.info(f"Resumo diário de preços atualizado: {len(actions)} grupos")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resumo diário de preços: {e}")
             return False
+
+    def evaluate_price_alerts(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Avalia os snapshots recém-indexados contra as regras de preço dos produtos
+        cadastrados, grava os alertas novos e envia uma notificação do lote.
+
+        Returns:
+            int: Número de alertas novos
+        """
+        from .price_alerts import price_alert_engine
+
+        try:
+            alerts = price_alert_engine.evaluate(products)
+            if not alerts:
+                return 0
+
+            created = []
+            actions = [
+                {"_op_type": "create", "_index": ES_PRICE_ALERTS_INDEX, "_id": alert["alert_id"], "_source": alert}
+                for alert in alerts
+            ]
+            # Alertas já gravados (mesma regra, anúncio e dia) são rejeitados (409) e ignorados
+            for alert, (ok, item) in zip(alerts, helpers.streaming_bulk(self.client, actions,
+                                                                        raise_on_error=False)):
+                if ok:
+                    created.append(alert)
+                elif item.get("create", {}).get("status") != 409:
+                    logger.warning(f"Falha ao gravar alerta de preço: {item}")
+
+            price_alert_engine.notify(created)
+            return len(created)
         except Exception as e:
-            logger.error(f"Erro ao indexar produtos em bulk: {e}")
+            logger.error(f"Erro ao avaliar alertas de preço: {e}")
+            return 0
+
+    def get_price_alerts(self, product_db_id: Optional[int] = None, level: Optional[str] = None,
+                         size: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """Alertas de preço, dos mais recentes para os mais antigos"""
+        filters = []
+        if product_db_id is not None:
+            filters.append({"term": {"product_db_id": product_db_id}})
+        if level:
+            filters.append({"term": {"level": level}})
+
+        response = self.client.search(
+            index=ES_PRICE_ALERTS_INDEX,
+            body={
+                "query": {"bool": {"filter": filters}},
+                "sort": [{"created_at": {"order": "desc"}}],
+                "from": offset,
+                "size": size
+            }
+        )
+        hits = response["hits"]
+        return {
+            "total": hits["total"]["value"],
+            "alerts": [hit["_source"] for hit in hits["hits"]]
+        }
+
+    def update_price_stats(self, products: List[Dict[str, Any]]) -> bool:
+        """
+        Atualiza as estatísticas acumuladas de preço (contagem, média e variância
+        de Welford, EWMA, mínimo, máximo e último preço) de cada produto × vendedor
+        do lote. Cada grupo gera um único upsert com os preços em ordem de
+        timestamp, e o script aplica cada preço em O(1) sobre o estado gravado.
+
+        Args:
+            products: Lista de documentos que acabaram de ser indexados
+
+        Returns:
+            bool: True se as estatísticas foram atualizadas, False caso contrário
+        """
+        from ..core.config import settings
+
+        try:
+            groups: Dict[tuple, Dict[str, Any]] = {}
+            for product in products:
+                price = _first_value(product, "price", "preco")
+                timestamp = _parse_timestamp(product.get("timestamp"))
+                product_key = rollup_product_key(product)
+                if not price or timestamp is None or product_key is None:
+                    continue
+                try:
+                    price = float(price)
+                except (TypeError, ValueError):
+                    continue
+                if price <= 0:
+                    continue
+
+                seller = str(_first_value(product, "seller", "vendedor", default="Desconhecido"))
+                group = groups.setdefault((product_key, seller), {
+                    "product_key": product_key,
+                    "product_db_id": product.get("product_db_id"),
+                    "title": _first_value(product, "title", "titulo", default=""),
+                    "seller": seller,
+                    "samples": []
+                })
+                group["samples"].append((int(timestamp.timestamp() * 1000), price))
+
+            if not groups:
+                return False
+
+            actions = []
+            for (product_key, seller), group in groups.items():
+                samples = sorted(group.pop("samples"))
+                last_seen, last_price = samples[-1]
+                actions.append({
+                    "_op_type": "update",
+                    "_index": ES_PRICE_STATS_INDEX,
+                    "_id": price_stats_id(product_key, seller),
+                    "retry_on_conflict": 3,
+                    "script": {
+                        "source": PRICE_STATS_UPDATE_SCRIPT,
+                        "lang": "painless",
+                        "params": {
+                            "prices": [price for _, price in samples],
+                            "alpha": settings.PRICE_STATS_EWMA_ALPHA,
+                            "last_price": last_price,
+                            "last_seen": last_seen
+                        }
+                    },
+                    # O script também roda na criação, a partir do estado vazio
+                    "scripted_upsert": True,
+                    "upsert": {
+                        **group,
+                        "count": 0, "mean": 0.0, "m2": 0.0, "variance": 0.0, "stddev": 0.0,
+                        "ewma": 0.0, "min_price": 0.0, "max_price": 0.0,
+                        "last_price": last_price, "last_seen": 0
+                    }
+                })
+
+            helpers.bulk(self.client, actions)
+            logger.info(f"Estatísticas de preço atualizadas: {len(actions)} produtos × vendedores")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao atualizar estatísticas de preço: {e}")
             return False
 
+    def get_price_stats(self, product_key: str, seller: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Estatísticas acumuladas de um produto, sem consultar o histórico: um GET
+        quando o vendedor é informado, ou uma busca pelos documentos do produto
+        (um por vendedor) com o total combinado entre eles.
+
+        Args:
+            product_key: Chave do produto (rollup_product_key: "db:<id>" ou "title:<título>")
+            seller: Vendedor (opcional)
+
+        Returns:
+            dict: {"product_key", "sellers": [...], "total": {...} ou None}
+        """
+        if seller is not None:
+            response = self.client.options(ignore_status=404).get(
+                index=ES_PRICE_STATS_INDEX, id=price_stats_id(product_key, seller)
+            )
+            sellers = [response["_source"]] if response.get("found") else []
+        else:
+            # Todos os vendedores do produto, em páginas (search_after), para que
+            # o total combinado não dependa de um limite de resultados
+            body = {
+                "query": {"term": {"product_key": product_key}},
+                "sort": [{"count": {"order": "desc"}}, {"seller": {"order": "asc"}}],
+                "size": PRICE_STATS_PAGE_SIZE
+            }
+            sellers = []
+            while True:
+                hits = self.client.search(index=ES_PRICE_STATS_INDEX, body=body)["hits"]["hits"]
+                sellers.extend(hit["_source"] for hit in hits)
+                if len(hits) < PRICE_STATS_PAGE_SIZE:
+                    break
+                body["search_after"] = hits[-1]["sort"]
+
+        return {
+            "product_key": product_key,
+            "sellers": sellers,
+            "total": combine_price_stats(sellers)
+        }
+
+    def clear_price_stats(self) -> None:
+        """Remove todas as estatísticas de preço (antes de reconstruí-las)"""
+        self.client.delete_by_query(index=ES_PRICE_STATS_INDEX, body={"query": {"match_all": {}}},
+                                    refresh=True, conflicts="proceed")
+
+    def rebuild_price_stats(self, chunk_size: int = 1000) -> int:
+        """
+        Reconstrói as estatísticas de preço a partir dos documentos brutos, em
+        ordem de timestamp (a EWMA depende da ordem dos preços).
+
+        Returns:
+            int: Número de documentos brutos processados
+        """
+        processed = 0
+        batch = []
+        for doc in self.iter_documents(page_size=chunk_size):
+            batch.append(doc)
+            if len(batch) >= chunk_size:
+                self.update_price_stats(batch)
+                processed += len(batch)
+                batch = []
+
+        if batch:
+            self.update_price_stats(batch)
+            processed += len(batch)
+
+        logger.info(f"Estatísticas de preço reconstruídas a partir de {processed} documentos")
+        return processed
+
+    def rebuild_price_history(self, period_days: Optional[int] = None, chunk_size: int = 1000) -> int:
+        """
+        Copia os documentos brutos para a tabela price_history (carga inicial do
+        histórico no banco relacional). Snapshots já gravados são ignorados.
+
+        Args:
+            period_days: Limita a carga aos últimos N dias (opcional)
+            chunk_size: Documentos gravados por lote (um COPY por lote)
+
+        Returns:
+            int: Número de linhas novas no histórico
+        """
+        from .price_history import price_history_store
+
+        query = None
+        if period_days is not None:
+            from ..core.time_windows import period_start_iso
+            query = {"range": {"timestamp": {"gte": period_start_iso(period_days)}}}
+
+        inserted = 0
+        batch, doc_ids = [], []
+        for hit in self._iter_hits(query, page_size=chunk_size):
+            # snapshot_id do histórico é sempre o _id do documento no Elasticsearch
+            batch.append(hit["_source"])
+            doc_ids.append(hit["_id"])
+            if len(batch) >= chunk_size:
+                inserted += price_history_store.ingest(batch, doc_ids)
+                batch, doc_ids = [], []
+
+        if batch:
+            inserted += price_history_store.ingest(batch, doc_ids)
+
+        logger.info(f"Histórico de preços no banco: {inserted} linhas novas")
+        return inserted
+
+    def rebuild_price_rollup(self, period_days: Optional[int] = None, chunk_size: int = 1000) -> int:
+        """
+        Reconstrói o resumo diário a partir dos documentos brutos. Os upserts
+        somam aos grupos existentes, então o período precisa ser limpo antes
+        com clear_price_rollup (o índice todo, ou a partir de
+        period_start_day(period_days) quando period_days é informado).
+
+        Args:
+            period_days: Limita a reconstrução aos últimos N dias, a partir do
+                início do primeiro dia (opcional)
+            chunk_size: Quantidade de documentos agregados por lote
+
+        Returns:
+            int: Número de documentos brutos processados
+        """
+        query: Dict[str, Any] = {"query": {"match_all": {}}}
+        if period_days is not None:
+            from ..core.time_windows import period_start
+            # Dias inteiros, os mesmos removidos por clear_price_rollup(period_start_day(...))
+            start_date = period_start(period_days, "day").isoformat()
+            query = {"query": {"range": {"timestamp": {"gte": start_date}}}}
+
+        processed = 0
+        batch = []
+        for hit in helpers.scan(self.client, index=ES_INDEX, query=query, size=chunk_size):
+            batch.append(hit["_source"])
+            if len(batch) >= chunk_size:
+                self.update_price_rollup(batch)
+                processed += len(batch)
+                batch = []
+
+        if batch:
+            self.update_price_rollup(batch)
+            processed += len(batch)
+
+        logger.info(f"Resumo diário reconstruído a partir de {processed} documentos")
+        return processed
+
+    def deduplicate_snapshots(self, dry_run: bool = False, chunk_size: int = 1000) -> Dict[str, int]:
+        """
+        Migra os documentos existentes para IDs determinísticos (snapshot_id).
+        Os documentos são percorridos em ordem de timestamp; quando vários caem no
+        mesmo anúncio × produto × janela, o mais recente prevalece e os demais são
+        removidos. Após a execução o resumo diário deve ser reconstruído.
+
+        Args:
+            dry_run: Apenas conta, sem alterar o índice
+            chunk_size: Ações por requisição bulk
+
+        Returns:
+            dict: Documentos lidos, já corretos, migrados e duplicados removidos
+        """
+        stats = {"lidos": 0, "corretos": 0, "migrados": 0, "duplicados": 0}
+        seen = set()
+        actions: List[Dict[str, Any]] = []
+
+        def flush():
+            if actions and not dry_run:
+                helpers.bulk(self.client, actions, chunk_size=chunk_size, raise_on_error=False)
+            actions.clear()
+
+        for hit in self._iter_hits(page_size=chunk_size):
+            stats["lidos"] += 1
+            source = hit["_source"]
+            doc_id = snapshot_id(source)
+            digest = bytes.fromhex(doc_id)
+
+            duplicate = digest in seen
+            seen.add(digest)
+
+            if hit["_id"] == doc_id and not duplicate:
+                stats["corretos"] += 1
+                continue
+            stats["duplicados" if duplicate else "migrados"] += 1
+
+            # Reindexa com o ID determinístico (o mais recente sobrescreve) e remove o antigo;
+            # um documento que já tinha o ID certo é regravado por ser mais novo que o migrado
+            actions.append({"_op_type": "index", "_index": ES_INDEX, "_id": doc_id, "_source": source})
+            if hit["_id"] != doc_id:
+                actions.append({"_op_type": "delete", "_index": ES_INDEX, "_id": hit["_id"]})
+            if len(actions) >= chunk_size:
+                flush()
+
+        flush()
+        logger.info(f"Deduplicação de snapshots concluída: {stats}")
+        return stats
+
+    def get_reviews(self, listing_id: Optional[str] = None, product_db_id: Optional[int] = None,
+                    size: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """
+        Busca comentários no índice de avaliações, dos mais recentes para os mais antigos.
+
+        Args:
+            listing_id: Anúncio (MLB...) cujos comentários devem ser retornados
+            product_db_id: Produto cadastrado (todos os anúncios dele)
+            size: Quantidade de comentários
+            offset: Deslocamento para paginação
+
+        Returns:
+            dict: {"total": int, "reviews": [...]}
+        """
+        response = self.client.search(index=ES_REVIEWS_INDEX, body=self._reviews_query(listing_id, product_db_id,
+                                                                                       size, offset))
+        return self._parse_reviews(response)
+
+    def get_listing(self, listing_id: str, include_reviews: bool = True, reviews_size: int = 50) -> Dict[str, Any]:
+        """
+        Snapshot mais recente de um anúncio, unido aos seus comentários quando
+        pedido. As duas consultas são enviadas em um único _msearch.
+        """
+        searches = [(ES_INDEX, {
+            "query": {"term": {"listing_id": listing_id}},
+            "sort": [{"timestamp": {"order": "desc"}}],
+            "size": 1
+        })]
+        if include_reviews:
+            searches.append((ES_REVIEWS_INDEX, self._reviews_query(listing_id, None, reviews_size, 0)))
+
+        responses = self.multi_search(searches)
+        hits = responses[0].get("hits", {}).get("hits", [])
+        result: Dict[str, Any] = {"snapshot": hits[0]["_source"] if hits else None}
+        if include_reviews:
+            result.update(self._parse_reviews(responses[1]))
+        return result
+
+    def _reviews_query(self, listing_id: Optional[str], product_db_id: Optional[int],
+                       size: int, offset: int) -> Dict[str, Any]:
+        filters = []
+        if listing_id:
+            filters.append({"term": {"listing_id": listing_id}})
+        if product_db_id is not None:
+            filters.append({"term": {"product_db_id": product_db_id}})
+        return {
+            "query": {"bool": {"filter": filters}} if filters else {"match_all": {}},
+            "sort": [{"first_seen": {"order": "desc"}}],
+            "from": offset,
+            "size": size
+        }
+
+    def _parse_reviews(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        hits = response.get("hits", {})
+        return {
+            "total": hits.get("total", {}).get("value", 0),
+            "reviews": [hit["_source"] for hit in hits.get("hits", [])]
+        }
+
+    def migrate_embedded_reviews(self, chunk_size: int = 500) -> Dict[str, int]:
+        """
+        Move os comentarios aninhados dos snapshots antigos para o índice de
+        avaliações e remove o campo dos snapshots, guardando apenas a contagem.
+
+        Returns:
+            dict: Snapshots processados e comentários novos gravados
+        """
+        query = {"nested": {"path": "comentarios", "query": {"match_all": {}}}}
+        stats = {"snapshots": 0, "comentarios_novos": 0}
+        actions: List[Dict[str, Any]] = []
+
+        for hit in self._iter_hits(query=query, page_size=chunk_size):
+            source = dict(hit["_source"])
+            source.setdefault("listing_id", listing_key(source))
+            actions.extend(review_actions(source, extract_reviews(source)))
+            stats["snapshots"] += 1
+            if len(actions) >= chunk_size:
+                stats["comentarios_novos"] += self.index_reviews(actions)
+                actions = []
+
+        if actions:
+            stats["comentarios_novos"] += self.index_reviews(actions)
+
+        if stats["snapshots"]:
+            self.client.update_by_query(
+                index=ES_INDEX,
+                body={
+                    "query": query,
+                    "script": {
+                        "source": REMOVE_EMBEDDED_REVIEWS_SCRIPT,
+                        "lang": "painless"
+                    }
+                },
+                conflicts="proceed",
+                refresh=True,
+                wait_for_completion=True
+            )
+
+        logger.info(f"Migração de comentários concluída: {stats}")
+        return stats
+
+    def backfill_derived_fields(self, chunk_size: int = 1000) -> Dict[str, int]:
+        """
+        Calcula os campos derivados (derived_fields) dos snapshots já gravados,
+        atualizando apenas os documentos cujo valor mudou.
+
+        Returns:
+            dict: Documentos lidos, atualizados e com erro
+        """
+        stats = {"lidos": 0, "atualizados": 0, "erros": 0}
+
+        def actions():
+            for hit in self._iter_hits(page_size=chunk_size):
+                stats["lidos"] += 1
+                source = hit["_source"]
+                fields = derived_fields(source)
+                if all(source.get(field) == value for field, value in fields.items()):
+                    continue
+                yield {"_op_type": "update", "_index": ES_INDEX, "_id": hit["_id"], "doc": fields}
+
+        for ok, item in helpers.streaming_bulk(self.client, actions(), chunk_size=chunk_size,
+                                               raise_on_error=False):
+            if ok:
+                stats["atualizados"] += 1
+            else:
+                stats["erros"] += 1
+                logger.warning(f"Falha ao atualizar campos derivados: {item}")
+
+        if stats["atualizados"]:
+            from .query_cache import query_cache
+            query_cache.bump_generation()
+
+        logger.info(f"Campos derivados recalculados: {stats}")
+        return stats
+
+    def clear_price_rollup(self, start_day: Optional[str] = None) -> None:
+        """
+        Remove os documentos do resumo diário antes de reconstruí-lo: todos, ou
+        só os dias a partir de start_day (YYYY-MM-DD)
+        """
+        query: Dict[str, Any] = {"match_all": {}}
+        if start_day is not None:
+            query = {"range": {"day": {"gte": start_day}}}
+        self.client.delete_by_query(index=ES_ROLLUP_INDEX, body={"query": query},
+                                    refresh=True, conflicts="proceed")
+
     def search_products(self, query: Dict[str, Any] = None, size: int = 100) -> List[Dict[str, Any]]:
         """
         Busca produtos no Elasticsearch
@@ -242,153 +1580,191 @@ class ElasticsearchService:
                 results.append(product)
 
             return results
+        except ElasticsearchUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Erro ao buscar produtos: {e}")
+            from .query_cache import mark_degraded
+            mark_degraded("search_products")
             return []
 
-    def get_top_products(self, size: int = 10, period_days: int = 30):
-        """
-        Retorna os produtos mais encontrados nas buscas, filtrando
-        apenas pelos produtos que estão cadastrados no sistema.
-        Usa uma abordagem mais rigorosa para garantir que apenas produtos registrados apareçam.
+    def iter_documents(self, query: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                       page_size: int = 1000, keep_alive: str = "2m") -> Iterator[Dict[str, Any]]:
         """
-        try:
-            # Calcula a data de início do período
-            start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
+        Percorre todos os documentos que atendem à consulta usando point-in-time
+        e search_after, mantendo apenas uma página em memória por vez.
 
-            # Obter produtos cadastrados no banco de dados
-            from ..models.product import Product
-            from ..db.session import SessionLocal
+        Args:
+            query: Cláusula "query" do Elasticsearch (opcional, padrão é match_all)
+            fields: Campos de _source a retornar (opcional, padrão é todos)
+            page_size: Documentos por página
+            keep_alive: Tempo de vida do point-in-time entre páginas
 
-            db = SessionLocal()
-            registered_products = db.query(Product).filter(Product.is_active == True).all()
+        Yields:
+            Documentos (_source) em ordem crescente de timestamp
+        """
+        for hit in self._iter_hits(query, fields, page_size, keep_alive):
+            yield hit["_source"]
 
-            # Se não houver produtos cadastrados, retorna lista vazia
-            if not registered_products:
-                logger.warning("Não há produtos cadastrados no banco de dados.")
-                return []
+    def _iter_hits(self, query: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                   page_size: int = 1000, keep_alive: str = "2m") -> Iterator[Dict[str, Any]]:
+        """Como iter_documents, mas retorna os hits completos (_id e _source)"""
+        pit_id = self.client.open_point_in_time(index=ES_INDEX, keep_alive=keep_alive)["id"]
+        try:
+            search_after = None
+            while True:
+                body: Dict[str, Any] = {
+                    "query": query or {"match_all": {}},
+                    "pit": {"id": pit_id, "keep_alive": keep_alive},
+                    # _shard_doc desempata documentos com o mesmo timestamp
+                    "sort": [{"timestamp": {"order": "asc", "unmapped_type": "date"}}, {"_shard_doc": "asc"}],
+                    "size": page_size,
+                    "track_total_hits": False
+                }
+                if fields:
+                    body["_source"] = fields
+                if search_after is not None:
+                    body["search_after"] = search_after
 
-            # Extrair IDs dos produtos cadastrados para referência
-            registered_product_ids = [p.id for p in registered_products]
+                response = self.client.search(body=body)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
 
-            # Extrair termos de busca exatos dos produtos cadastrados
-            exact_product_terms = []
+                # O point-in-time pode ser renovado a cada página
+                pit_id = response.get("pit_id", pit_id)
+                search_after = hits[-1]["sort"]
 
-            for product in registered_products:
-                # Adicionar identificadores exatos
-                if product.name:
-                    exact_product_terms.append(product.name.lower())
-                if product.pn:
-                    exact_product_terms.append(product.pn.lower())
+                yield from hits
 
-            # Fechar a conexão com o banco de dados
-            db.close()
+                if len(hits) < page_size:
+                    break
+        finally:
+            try:
+                self.client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                logger.warning(f"Erro ao fechar point-in-time: {e}")
 
-            # Buscar produtos por ID diretamente - primeira abordagem
-            direct_id_query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "range": {
-                                    "timestamp": {
-                                        "gte": start_date
-                                    }
+    def top_products_query(self, size: int = 10, period_days: int = 30) -> Optional[Dict[str, Any]]:
+        """
+        Monta a consulta de produtos mais encontrados, restrita aos produtos
+        cadastrados. Retorna None quando não há produtos cadastrados.
+        Uma única consulta combina o filtro por ID e por título exato e usa
+        collapse para trazer apenas o documento mais recente de cada produto.
+
+        O título exato é comparado pelo product_key ("title:<título em
+        minúsculas>"), gravado na ingestão, já que title.keyword diferencia
+        maiúsculas. Snapshots sem product_key (índices anteriores ao campo,
+        antes de scripts/backfill_derived_fields.py) ficam de fora em vez de
+        caírem todos no mesmo grupo nulo do collapse.
+        """
+        # Calcula a data de início do período
+        from ..core.time_windows import period_start_iso
+        start_date = period_start_iso(period_days)
+
+        # Produtos cadastrados vêm do cache (sem SQL no caminho da requisição)
+        from .product_cache import get_registered_products
+
+        registered = get_registered_products()
+
+        # Se não houver produtos cadastrados, não há o que consultar
+        if not registered["ids"]:
+            logger.warning("Não há produtos cadastrados no banco de dados.")
+            return None
+
+        return {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "range": {
+                                "timestamp": {
+                                    "gte": start_date
                                 }
                             }
-                        ],
-                        "should": [
-                            {
-                                "terms": {
-                                    "product_db_id": registered_product_ids
-                                }
+                        },
+                        {
+                            "exists": {
+                                "field": "product_key"
                             }
-                        ],
-                        "minimum_should_match": 1
-                    }
-                },
-                "sort": [
-                    {
-                        "timestamp": {
-                            "order": "desc"
                         }
-                    }
-                ],
-                "size": size
-            }
-
-            # Executa a consulta direta por ID
-            direct_response = self.client.search(index=ES_INDEX, body=direct_id_query)
-
-            # Se encontrou resultados suficientes pela busca direta, retorna esses resultados
-            if len(direct_response["hits"]["hits"]) >= size:
-                return self._process_product_results(direct_response["hits"]["hits"], size)
-
-            # Caso contrário, tenta uma segunda abordagem com termos exatos
-            exact_terms_query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "range": {
-                                    "timestamp": {
-                                        "gte": start_date
-                                    }
-                                }
+                    ],
+                    "should": [
+                        {
+                            "terms": {
+                                "product_db_id": registered["ids"]
                             }
-                        ],
-                        "should": [
-                            {
-                                "terms": {
-                                    "title.keyword": exact_product_terms
-                                }
+                        },
+                        {
+                            "terms": {
+                                "product_key": [f"title:{term.strip()}" for term in registered["terms"]]
                             }
-                        ],
-                        "minimum_should_match": 1
-                    }
-                },
-                "sort": [
-                    {
-                        "timestamp": {
-                            "order": "desc"
                         }
+                    ],
+                    "minimum_should_match": 1
+                }
+            },
+            # Um resultado por produto: o documento mais recente de cada product_key
+            # ("db:<id>" do produto cadastrado, ou o título normalizado)
+            "collapse": {
+                "field": "product_key"
+            },
+            "sort": [
+                {
+                    "timestamp": {
+                        "order": "desc"
                     }
-                ],
-                "size": size
-            }
-
-            # Executa a consulta por termos exatos
-            exact_response = self.client.search(index=ES_INDEX, body=exact_terms_query)
-
-            # Combina os resultados de ambas as consultas, removendo duplicatas
-            combined_results = {}
-
-            # Adiciona os resultados da busca direta por ID
-            for hit in direct_response["hits"]["hits"]:
-                doc_id = hit["_id"]
-                if doc_id not in combined_results:
-                    combined_results[doc_id] = hit
+                }
+            ],
+            "_source": ["id", "title", "price", "seller", "url", "timestamp", "product_db_id"],
+            "size": size
+        }
 
-            # Adiciona os resultados da busca por termos exatos
-            for hit in exact_response["hits"]["hits"]:
-                doc_id = hit["_id"]
-                if doc_id not in combined_results:
-                    combined_results[doc_id] = hit
+    def get_top_products(self, size: int = 10, period_days: int = 30):
+        """
+        Retorna os produtos mais encontrados nas buscas, filtrando
+        apenas pelos produtos que estão cadastrados no sistema.
+        """
+        try:
+            query = self.top_products_query(size, period_days)
+            if query is None:
+                return []
 
-            # Converte para lista e ordena por timestamp (mais recente primeiro)
-            hits_list = list(combined_results.values())
-            hits_list.sort(key=lambda x: x["_source"].get("timestamp", ""), reverse=True)
+            response = self.client.search(index=ES_INDEX, body=query)
 
-            # Retorna os resultados processados
-            return self._process_product_results(hits_list, size)
+            return self.format_top_products(response["hits"]["hits"], size)
 
+        except ElasticsearchUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Erro ao buscar top produtos: {str(e)}")
+            from .query_cache import mark_degraded
+            mark_degraded("top_products")
             return []
 
-    def _process_product_results(self, hits, size):
+    def multi_search(self, searches: List[tuple]) -> List[Dict[str, Any]]:
         """
-        Processa os resultados da busca e formata para o formato esperado pela API
+        Executa várias consultas em uma única requisição _msearch
+
+        Args:
+            searches: Lista de tuplas (índice, corpo da consulta)
+
+        Returns:
+            Lista de respostas na mesma ordem das consultas; consultas que
+            falharam trazem a chave "error"
+        """
+        body = []
+        for index, query in searches:
+            body.append({"index": index})
+            body.append(query)
+
+        response = self.client.msearch(body=body)
+        return response["responses"]
+
+    def format_top_products(self, hits, size):
+        """
+        Processa os resultados da busca de top_products_query e formata para o
+        formato esperado pela API (também usado pelo bundle do dashboard)
         """
         top_products = []
         for hit in hits[:size]:  # Limita ao tamanho solicitado
@@ -405,34 +1781,40 @@ class ElasticsearchService:
 
         return top_products
 
-    def get_price_evolution(self, product: str, period_days: int = 30) -> List[Dict[str, Any]]:
+    def get_price_evolution(self, product: str, period_days: int = 30,
+                            resolution: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Retorna a evolução de preço de um produto específico
+        Retorna a evolução de preço de um produto específico a partir do
+        resumo diário (um ponto por vendedor e dia)
 
         Args:
             product: Nome do produto
             period_days: Período em dias para a análise
+            resolution: Número máximo de pontos; a série de cada vendedor é
+                reduzida com LTTB para caber no total (opcional)
 
         Returns:
             Lista com a evolução de preço do produto
         """
         try:
             # Calcula a data de início do período
-            start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
+            from ..core.time_windows import period_start_day
+            start_date = period_start_day(period_days)
 
-            # Consulta para encontrar o histórico de preços
+            # Consulta para encontrar o histórico de preços: um bucket por vendedor e dia,
+            # percorrido em páginas pela composite aggregation (sem limite de hits)
             query = {
                 "query": {
                     "bool": {
                         "must": [
                             {
                                 "match": {
-                                    "titulo": product
+                                    "title": product
                                 }
                             },
                             {
                                 "range": {
-                                    "timestamp": {
+                                    "day": {
                                         "gte": start_date
                                     }
                                 }
@@ -440,56 +1822,147 @@ class ElasticsearchService:
                         ]
                     }
                 },
-                "sort": [
-                    {
-                        "timestamp": {
-                            "order": "asc"
+                "aggs": {
+                    "points": {
+                        "composite": {
+                            "size": 1000,
+                            "sources": [
+                                {"seller": {"terms": {"field": "seller"}}},
+                                {"day": {"date_histogram": {"field": "day", "calendar_interval": "1d",
+                                                            "format": "yyyy-MM-dd"}}}
+                            ]
+                        },
+                        "aggs": {
+                            "sum_price": {"sum": {"field": "sum_price"}},
+                            "samples": {"sum": {"field": "count"}},
+                            "min_price": {"min": {"field": "min_price"}},
+                            "max_price": {"max": {"field": "max_price"}},
+                            "last_seen": {"max": {"field": "last_seen"}},
+                            "last": {
+                                "top_metrics": {
+                                    "metrics": {"field": "last_price"},
+                                    "sort": {"last_seen": "desc"}
+                                }
+                            }
                         }
                     }
-                ],
-                "size": 1000  # Limite razoável para histórico
+                },
+                "size": 0
             }
 
-            response = self.client.search(index=ES_INDEX, body=query)
-
             # Processa os resultados
             result = []
-            for hit in response["hits"]["hits"]:
-                result.append({
-                    "timestamp": hit["_source"]["timestamp"],
-                    "preco": hit["_source"]["preco"],
-                    "vendedor": hit["_source"].get("vendedor", "Desconhecido")
-                })
+            while True:
+                response = self.client.search(index=ES_ROLLUP_INDEX, body=query)
+                aggregation = response["aggregations"]["points"]
+                for bucket in aggregation["buckets"]:
+                    samples = bucket["samples"]["value"]
+                    if not samples:
+                        continue
+                    last = bucket["last"]["top"]
+                    result.append({
+                        "timestamp": bucket["key"]["day"],
+                        "preco": round(bucket["sum_price"]["value"] / samples, 2),
+                        "preco_min": bucket["min_price"]["value"],
+                        "preco_max": bucket["max_price"]["value"],
+                        "ultimo_preco": last[0]["metrics"]["last_price"] if last else None,
+                        "amostras": int(samples),
+                        "vendedor": bucket["key"]["seller"],
+                        "_x": int(bucket["last_seen"]["value"])
+                    })
+                after_key = aggregation.get("after_key")
+                if not after_key or len(aggregation["buckets"]) < query["aggs"]["points"]["composite"]["size"]:
+                    break
+                query["aggs"]["points"]["composite"]["after"] = after_key
+
+            # A composite percorre vendedor a vendedor; a série volta em ordem de dia
+            result.sort(key=lambda point: (point["timestamp"], point["vendedor"]))
+
+            if resolution and len(result) > resolution:
+                result = self._downsample_by_seller(result, resolution)
+
+            for point in result:
+                point.pop("_x", None)
 
             return result
+        except ElasticsearchUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Erro ao buscar evolução de preço: {e}")
+            from .query_cache import mark_degraded
+            mark_degraded("price_evolution")
             return []
 
 
+    def _downsample_by_seller(self, points: List[Dict[str, Any]], resolution: int) -> List[Dict[str, Any]]:
+        """
+        Reduz a série de cada vendedor com LTTB, dividindo a resolução
+        proporcionalmente ao número de pontos de cada um
+        """
+        from .timeseries import downsample_points
+
+        by_seller: Dict[str, List[Dict[str, Any]]] = {}
+        for point in points:
+            by_seller.setdefault(point["vendedor"], []).append(point)
+
+        reduced = []
+        for seller_points in by_seller.values():
+            budget = max(3, round(resolution * len(seller_points) / len(points)))
+            reduced.extend(downsample_points(seller_points, budget, "_x", "preco"))
+
+        reduced.sort(key=lambda point: point["_x"])
+        return reduced
+
+
+_shared_service: Optional[ElasticsearchService] = None
+_shared_lock = threading.Lock()
+
+
+def get_es_service() -> ElasticsearchService:
+    """Instância compartilhada pelo processo (rotas, backends e funções de compatibilidade)"""
+    global _shared_service
+
+    with _shared_lock:
+        if _shared_service is None:
+            _shared_service = ElasticsearchService()
+        return _shared_service
+
+
 # Funções de compatibilidade para manter scripts existentes funcionando
 def get_elasticsearch_client():
     """Função de compatibilidade que retorna um cliente Elasticsearch"""
-    service = ElasticsearchService()
+    service = get_es_service()
     return service.client
 
 def setup_index(client):
     """Função de compatibilidade para configurar o índice"""
-    service = ElasticsearchService()
-    # O índice já foi configurado no construtor, então não precisamos fazer nada aqui
+    # Os índices são configurados pelo serviço ao conectar, então não precisamos fazer nada aqui
     return
 
 def index_product(product_data):
     """Função de compatibilidade para indexar um produto"""
-    service = ElasticsearchService()
+    if _columnar_backend_enabled():
+        return _columnar_backend().index_products([product_data])
+    service = get_es_service()
     return service.index_product(product_data)
 
 def bulk_index_products(products):
     """Função de compatibilidade para indexar produtos em massa"""
-    service = ElasticsearchService()
+    if _columnar_backend_enabled():
+        return _columnar_backend().index_products(products)
+    service = get_es_service()
     return service.bulk_index_products(products)
 
+def _columnar_backend_enabled():
+    """Os scrapers gravam no backend embutido quando STORAGE_BACKEND não é elasticsearch"""
+    from app.core.config import settings
+    return settings.STORAGE_BACKEND.lower() != "elasticsearch"
+
+def _columnar_backend():
+    from app.services.storage_backend import get_storage_backend
+    return get_storage_backend()
+
 def search_products(query=None, size=100):
     """Função de compatibilidade para buscar produtos"""
-    service = ElasticsearchService()
+    service = get_es_service()
     return service.search_products(query, size)
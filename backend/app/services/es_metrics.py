@@ -0,0 +1,351 @@
+"""
+Instrumentação das consultas ao Elasticsearch.
+
+O cliente usado pelo ElasticsearchService é envolvido por InstrumentedClient,
+que mede cada search/msearch/count: o tempo informado pelo servidor (took), o
+tempo de parede no cliente, os shards consultados e os hits retornados. As
+medições são agregadas por endpoint da API em histogramas e expostas na rota
+administrativa /api/metrics/elasticsearch. Consultas acima de
+ES_SLOW_QUERY_MS vão para o log de consultas lentas; uma fração configurável
+(ES_PROFILE_SAMPLE_RATE) das buscas é executada com "profile": true para
+mostrar onde o tempo foi gasto em cada shard.
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from elasticsearch import ConnectionError as ESConnectionError, ConnectionTimeout
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Endpoint da requisição em andamento, definido pelo QueryMetricsMiddleware
+current_endpoint: ContextVar[str] = ContextVar("es_metrics_endpoint", default="sem-requisicao")
+
+# Limites (em ms) dos baldes dos histogramas
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+# Limite de endpoints distintos acompanhados; o excedente é agrupado em "outros"
+MAX_ENDPOINTS = 200
+# Tamanho máximo do corpo da consulta guardado no log de consultas lentas
+MAX_QUERY_CHARS = 2000
+
+
+class _Histogram:
+    """Histograma de latências com baldes fixos"""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Estimativa do percentil pelo limite superior do balde"""
+        count = sum(self.counts)
+        if not count:
+            return None
+        target = p * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return float(HISTOGRAM_BUCKETS_MS[i]) if i < len(HISTOGRAM_BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        buckets = [
+            {"le": bound, "count": self.counts[i]}
+            for i, bound in enumerate(HISTOGRAM_BUCKETS_MS)
+        ]
+        buckets.append({"le": "+Inf", "count": self.counts[-1]})
+        return {
+            "buckets": buckets,
+            "avg_ms": round(self.total / count, 2) if count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 2)
+        }
+
+
+class _EndpointStats:
+    """Medições acumuladas de um endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.shards = 0
+        self.hits = 0
+        self.took = _Histogram()
+        self.wall = _Histogram()
+        self.operations: Dict[str, int] = {}
+        self.last_profile: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "consultas": self.count,
+            "erros": self.errors,
+            "lentas": self.slow,
+            "shards": self.shards,
+            "hits_retornados": self.hits,
+            "operacoes": dict(self.operations),
+            "took_servidor": self.took.to_dict(),
+            "tempo_cliente": self.wall.to_dict(),
+            "amostra_profile": self.last_profile
+        }
+
+
+class QueryMetrics:
+    """Agregador das medições de consultas, compartilhado pelo processo"""
+
+    def __init__(self, slow_query_ms: float, slow_log_size: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, _EndpointStats] = {}
+        self._slow_queries: deque = deque(maxlen=slow_log_size)
+        self._started_at = datetime.now()
+
+    def record(self, endpoint: str, operation: str, index: Any, took_ms: Optional[float],
+               wall_ms: float, shards: int, hits: int, body: Any = None,
+               profile: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """Registra uma consulta e, se passar do limite, adiciona ao log de lentas"""
+        slow = wall_ms >= self.slow_query_ms
+
+        with self._lock:
+            if endpoint not in self._endpoints and len(self._endpoints) >= MAX_ENDPOINTS:
+                endpoint = "outros"
+            stats = self._endpoints.setdefault(endpoint, _EndpointStats())
+            stats.count += 1
+            stats.operations[operation] = stats.operations.get(operation, 0) + 1
+            stats.shards += shards
+            stats.hits += hits
+            stats.wall.observe(wall_ms)
+            if took_ms is not None:
+                stats.took.observe(took_ms)
+            if error:
+                stats.errors += 1
+            if slow:
+                stats.slow += 1
+            if profile is not None:
+                stats.last_profile = profile
+
+        if slow:
+            entry = {
+                "timestamp": datetime.now().isoformat(),
+                "endpoint": endpoint,
+                "operacao": operation,
+                "indice": index,
+                "took_ms": took_ms,
+                "tempo_cliente_ms": round(wall_ms, 2),
+                "shards": shards,
+                "hits": hits,
+                "consulta": _truncate_body(body),
+                "profile": profile,
+                "erro": error
+            }
+            with self._lock:
+                self._slow_queries.append(entry)
+            logger.warning(
+                f"Consulta lenta ao Elasticsearch em {endpoint}: {operation} em {index} "
+                f"({wall_ms:.0f} ms no cliente, took={took_ms} ms, {shards} shards, {hits} hits)"
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {name: stats.to_dict() for name, stats in self._endpoints.items()}
+        return {
+            "desde": self._started_at.isoformat(),
+            "limite_consulta_lenta_ms": self.slow_query_ms,
+            "baldes_ms": HISTOGRAM_BUCKETS_MS,
+            "endpoints": dict(sorted(endpoints.items(), key=lambda item: -item[1]["consultas"]))
+        }
+
+    def slow_queries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Consultas lentas mais recentes primeiro"""
+        with self._lock:
+            entries = list(self._slow_queries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self._slow_queries.clear()
+            self._started_at = datetime.now()
+
+
+query_metrics = QueryMetrics(
+    slow_query_ms=settings.ES_SLOW_QUERY_MS,
+    slow_log_size=settings.ES_SLOW_QUERY_LOG_SIZE
+)
+
+
+def _truncate_body(body: Any) -> Optional[str]:
+    if body is None:
+        return None
+    try:
+        text = json.dumps(body, default=str, ensure_ascii=False)
+    except (TypeError, ValueError):
+        text = str(body)
+    return text if len(text) <= MAX_QUERY_CHARS else text[:MAX_QUERY_CHARS] + "..."
+
+
+def _summarize_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Resume o profile do Elasticsearch: tempo de consulta e agregações por shard"""
+    shards = []
+    for shard in profile.get("shards", []):
+        query_ns = 0
+        top_queries = []
+        for search in shard.get("searches", []):
+            for query in search.get("query", []):
+                query_ns += query.get("time_in_nanos", 0)
+                top_queries.append({
+                    "tipo": query.get("type"),
+                    "descricao": str(query.get("description", ""))[:200],
+                    "tempo_ms": round(query.get("time_in_nanos", 0) / 1e6, 3)
+                })
+        aggregations = [
+            {
+                "tipo": agg.get("type"),
+                "nome": agg.get("description"),
+                "tempo_ms": round(agg.get("time_in_nanos", 0) / 1e6, 3)
+            }
+            for agg in shard.get("aggregations", [])
+        ]
+        shards.append({
+            "shard": shard.get("id"),
+            "consulta_ms": round(query_ns / 1e6, 3),
+            "consultas": top_queries,
+            "agregacoes": aggregations
+        })
+    return {"timestamp": datetime.now().isoformat(), "shards": shards}
+
+
+def _response_stats(operation: str, response: Any):
+    """Extrai (took, shards, hits) de uma resposta de search, msearch ou count"""
+    if operation == "msearch":
+        took = response.get("took")
+        shards = 0
+        hits = 0
+        for item in response.get("responses", []):
+            shards += item.get("_shards", {}).get("total", 0)
+            hits += len(item.get("hits", {}).get("hits", []))
+        return took, shards, hits
+
+    took = response.get("took")
+    shards = response.get("_shards", {}).get("total", 0)
+    hits = len(response.get("hits", {}).get("hits", []))
+    return took, shards, hits
+
+
+class InstrumentedClient:
+    """
+    Envolve o cliente Elasticsearch medindo search, msearch e count. Os demais
+    atributos (indices, bulk, options, ...) são repassados ao cliente original.
+
+    Falhas de conexão (cluster que caiu depois de conectado) nas chamadas feitas
+    por este objeto são entregues a on_connection_lost, que o ElasticsearchService
+    usa para voltar ao modo degradado e reconectar em segundo plano.
+    """
+
+    INSTRUMENTED = ("search", "msearch", "count")
+    CONNECTION_ERRORS = (ESConnectionError, ConnectionTimeout)
+
+    def __init__(self, client, metrics: QueryMetrics = query_metrics,
+                 on_connection_lost: Optional[Callable[[Exception], None]] = None):
+        self._client = client
+        self._metrics = metrics
+        self._on_connection_lost = on_connection_lost
+
+    @property
+    def wrapped(self):
+        """Cliente Elasticsearch original, sem instrumentação"""
+        return self._client
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        def guarded(*args, **kwargs):
+            try:
+                return attribute(*args, **kwargs)
+            except self.CONNECTION_ERRORS as e:
+                self._connection_lost(e)
+                raise
+        return guarded
+
+    def _connection_lost(self, error: Exception) -> None:
+        """Repassa a falha de conexão; on_connection_lost pode levantar outra exceção"""
+        if self._on_connection_lost is not None:
+            self._on_connection_lost(error)
+
+    def search(self, *args, **kwargs):
+        return self._call("search", *args, **kwargs)
+
+    def msearch(self, *args, **kwargs):
+        return self._call("msearch", *args, **kwargs)
+
+    def count(self, *args, **kwargs):
+        return self._call("count", *args, **kwargs)
+
+    def _call(self, operation: str, *args, **kwargs):
+        try:
+            return self._measure(operation, *args, **kwargs)
+        except self.CONNECTION_ERRORS as e:
+            self._connection_lost(e)
+            raise
+
+    def _measure(self, operation: str, *args, **kwargs):
+        method = getattr(self._client, operation)
+        if not settings.ES_METRICS_ENABLED:
+            return method(*args, **kwargs)
+
+        body = kwargs.get("body")
+        profiled = (
+            operation == "search"
+            and isinstance(body, dict)
+            and settings.ES_PROFILE_SAMPLE_RATE > 0
+            and random.random() < settings.ES_PROFILE_SAMPLE_RATE
+        )
+        if profiled:
+            kwargs["body"] = {**body, "profile": True}
+
+        endpoint = current_endpoint.get()
+        index = kwargs.get("index")
+        start = time.perf_counter()
+        try:
+            response = method(*args, **kwargs)
+        except Exception as e:
+            wall_ms = (time.perf_counter() - start) * 1000
+            self._metrics.record(endpoint, operation, index, None, wall_ms, 0, 0, body=body, error=str(e))
+            raise
+
+        wall_ms = (time.perf_counter() - start) * 1000
+        try:
+            took, shards, hits = _response_stats(operation, response)
+            profile = _summarize_profile(response["profile"]) if profiled and "profile" in response else None
+            self._metrics.record(endpoint, operation, index, took, wall_ms, shards, hits,
+                                 body=body, profile=profile)
+        except Exception as e:
+            logger.warning(f"Erro ao registrar métricas da consulta ao Elasticsearch: {e}")
+        return response
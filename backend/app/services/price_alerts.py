@@ -0,0 +1,246 @@
+"""
+Motor de alertas de preço.
+
+Cada produto cadastrado com preço de referência (Product.reference_price) gera
+regras de limite: "abaixo_referencia" dispara quando um anúncio do produto é
+encontrado por um preço menor ou igual à referência, e "queda_forte" quando o
+preço fica PRICE_ALERT_STRONG_DROP abaixo dela.
+
+As regras ficam em um índice ordenado por limite para cada produto, então
+avaliar um snapshot é uma busca binária no produto dele: o custo não cresce com
+o número total de regras. Os snapshots novos de cada ingestão são avaliados em
+lote (ElasticsearchService.after_ingest); os alertas têm ID fixo por regra,
+anúncio e dia e são gravados com op_type "create", de modo que o mesmo alerta
+não é gerado duas vezes, e os novos de um lote saem em uma única notificação.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Máximo de alertas listados no corpo da notificação de um lote
+MAX_ALERTS_IN_NOTIFICATION = 50
+
+
+class ThresholdIndex:
+    """Regras de cada produto ordenadas por limite de preço"""
+
+    def __init__(self):
+        self._thresholds: Dict[str, List[float]] = defaultdict(list)
+        self._rules: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.size = 0
+
+    def add(self, key: str, rule: Dict[str, Any]) -> None:
+        thresholds = self._thresholds[key]
+        position = bisect.bisect_left(thresholds, rule["threshold"])
+        thresholds.insert(position, rule["threshold"])
+        self._rules[key].insert(position, rule)
+        self.size += 1
+
+    def match(self, key: str, price: float) -> List[Dict[str, Any]]:
+        """Regras do produto cujo limite é maior ou igual ao preço"""
+        thresholds = self._thresholds.get(key)
+        if not thresholds:
+            return []
+        return self._rules[key][bisect.bisect_left(thresholds, price):]
+
+
+def build_threshold_index(alert_rules: List[Tuple[int, str, Optional[str], float]]) -> ThresholdIndex:
+    """
+    Monta o índice a partir dos produtos ativos com preço de referência
+    (id, nome, termo de busca, preço de referência). As regras de um produto
+    ficam sob o ID ("db:<id>") e sob o termo de busca ("term:<termo>"), para
+    casar também os snapshots de buscas que não trazem o ID do produto.
+    """
+    index = ThresholdIndex()
+    for product_id, name, search_terms, reference_price in alert_rules:
+        if not reference_price or reference_price <= 0:
+            continue
+
+        levels = [("abaixo_referencia", reference_price)]
+        if settings.PRICE_ALERT_STRONG_DROP > 0:
+            levels.append(("queda_forte", reference_price * (1 - settings.PRICE_ALERT_STRONG_DROP)))
+
+        keys = [f"db:{product_id}"]
+        if search_terms:
+            keys.append(f"term:{search_terms.strip().lower()}")
+
+        for level, threshold in levels:
+            rule = {
+                "rule_id": f"{product_id}:{level}",
+                "level": level,
+                "product_db_id": product_id,
+                "product_name": name,
+                "threshold": round(threshold, 2),
+                "reference_price": reference_price
+            }
+            for key in keys:
+                index.add(key, rule)
+    return index
+
+
+def price_alert_id(rule_id: str, listing_id: str, day: str) -> str:
+    """Um alerta por regra, anúncio e dia"""
+    return hashlib.sha1(f"{rule_id}|{listing_id}|{day}".encode("utf-8")).hexdigest()
+
+
+class PriceAlertEngine:
+    """Avalia lotes de snapshots contra as regras dos produtos cadastrados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[ThresholdIndex] = None
+        self._source: Optional[Dict[str, Any]] = None
+
+    def _current_index(self) -> ThresholdIndex:
+        """Reconstrói o índice quando o cache de produtos cadastrados é recarregado"""
+        from app.services.product_cache import get_registered_products
+
+        registered = get_registered_products()
+        with self._lock:
+            if registered is not self._source:
+                self._index = build_threshold_index(registered["alert_rules"])
+                self._source = registered
+                logger.info(f"Índice de alertas de preço montado: {self._index.size} regras")
+            return self._index
+
+    def evaluate(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Alertas disparados por um lote de snapshots. No mesmo lote, cada regra ×
+        anúncio × dia gera um único alerta, com o menor preço encontrado.
+        """
+        from app.services.elasticsearch_service import _first_value, _parse_timestamp, listing_key
+
+        if not settings.PRICE_ALERTS_ENABLED or not docs:
+            return []
+
+        index = self._current_index()
+        if not index.size:
+            return []
+
+        alerts: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            try:
+                price = float(_first_value(doc, "price", "preco"))
+            except (TypeError, ValueError):
+                continue
+            if price <= 0:
+                continue
+
+            if doc.get("product_db_id") is not None:
+                key = f"db:{doc['product_db_id']}"
+            else:
+                key = f"term:{str(_first_value(doc, 'search_term', 'busca', default='')).strip().lower()}"
+
+            rules = index.match(key, price)
+            if not rules:
+                continue
+
+            timestamp = _parse_timestamp(doc.get("timestamp")) or datetime.now()
+            listing_id = doc.get("listing_id") or listing_key(doc)
+            for rule in rules:
+                alert_id = price_alert_id(rule["rule_id"], listing_id, timestamp.date().isoformat())
+                current = alerts.get(alert_id)
+                if current is not None and current["price"] <= price:
+                    continue
+                alerts[alert_id] = {
+                    "alert_id": alert_id,
+                    "rule_id": rule["rule_id"],
+                    "level": rule["level"],
+                    "product_db_id": rule["product_db_id"],
+                    "product_name": rule["product_name"],
+                    "listing_id": listing_id,
+                    "title": _first_value(doc, "title", "titulo", default=""),
+                    "seller": _first_value(doc, "seller", "vendedor"),
+                    "url": _first_value(doc, "url", "link"),
+                    "price": price,
+                    "threshold": rule["threshold"],
+                    "reference_price": rule["reference_price"],
+                    "discount_pct": round((1 - price / rule["reference_price"]) * 100, 1),
+                    "timestamp": timestamp.isoformat(),
+                    "created_at": datetime.now().isoformat()
+                }
+
+        return list(alerts.values())
+
+    def notify(self, alerts: List[Dict[str, Any]]) -> None:
+        """
+        Uma notificação por lote: um registro no log do sistema e, se
+        PRICE_ALERT_EMAIL_TO estiver configurado, um e-mail com o resumo
+        """
+        if not alerts:
+            return
+
+        products = sorted({alert["product_name"] or str(alert["product_db_id"]) for alert in alerts})
+        summary = f"{len(alerts)} alertas de preço em {len(products)} produtos: {', '.join(products[:10])}"
+        if len(products) > 10:
+            summary += ", ..."
+        logger.info(summary)
+        self._log(summary)
+
+        if settings.PRICE_ALERT_EMAIL_TO:
+            body = self._email_body(alerts)
+            # O envio usa SMTP bloqueante; roda fora da ingestão
+            threading.Thread(
+                target=lambda: asyncio.run(self._send_email(summary, body)),
+                name="price-alert-email",
+                daemon=True
+            ).start()
+
+    def _log(self, description: str) -> None:
+        from app.db.session import SessionLocal
+        from app.models.system_log import SystemLog, LogLevel, LogCategory
+
+        db = SessionLocal()
+        try:
+            db.add(SystemLog(
+                action="price_alert",
+                description=description,
+                level=LogLevel.MEDIUM,
+                category=LogCategory.PRODUCT
+            ))
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Não foi possível registrar os alertas de preço no log do sistema: {e}")
+        finally:
+            db.close()
+
+    def _email_body(self, alerts: List[Dict[str, Any]]) -> str:
+        # Uma linha por anúncio, com o nível mais forte entre as regras disparadas
+        strongest: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+        for alert in alerts:
+            key = (alert["product_db_id"], alert["listing_id"])
+            if key not in strongest or alert["threshold"] < strongest[key]["threshold"]:
+                strongest[key] = alert
+
+        ordered = sorted(strongest.values(), key=lambda alert: -alert["discount_pct"])
+        lines = ["Novos alertas de preço:", ""]
+        for alert in ordered[:MAX_ALERTS_IN_NOTIFICATION]:
+            level = " [queda forte]" if alert["level"] == "queda_forte" else ""
+            lines.append(
+                f"- {alert['product_name']}{level}: R$ {alert['price']:.2f} "
+                f"({alert['discount_pct']}% abaixo da referência de R$ {alert['reference_price']:.2f}) "
+                f"- {alert['seller'] or 'vendedor não informado'} - {alert['url'] or alert['title']}"
+            )
+        if len(ordered) > MAX_ALERTS_IN_NOTIFICATION:
+            lines.append(f"... e mais {len(ordered) - MAX_ALERTS_IN_NOTIFICATION} alertas")
+        return "\n".join(lines)
+
+    async def _send_email(self, subject: str, body: str) -> None:
+        from app.services.email_service import send_email
+
+        for recipient in settings.PRICE_ALERT_EMAIL_TO.split(","):
+            if recipient.strip():
+                await send_email(recipient.strip(), f"HP Tracker - {subject}"[:200], body)
+
+
+price_alert_engine = PriceAlertEngine()
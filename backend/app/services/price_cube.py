@@ -0,0 +1,242 @@
+"""
+Cubo de métricas vendedor × produto × dia (tabela price_cube).
+
+Cada célula guarda preço mínimo, máximo e soma, snapshots, anúncios distintos
+e soma/quantidade de avaliações de um vendedor para um produto em um dia,
+calculados a partir da tabela price_history. A atualização é incremental:
+após cada ingestão só as células dos pares (produto, dia) tocados pelo lote
+são recalculadas (DELETE + INSERT ... SELECT ... GROUP BY na mesma transação),
+então reprocessar um dia é idempotente e não há deriva como em somas
+acumuladas.
+
+As consultas de fatiamento (por vendedor, produto, dia e categoria, com
+filtros e comparação com o preço de referência do produto cadastrado)
+reagregam as células do cubo, que tem uma linha por vendedor × produto × dia
+em vez de uma por snapshot.
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import Date, DateTime, bindparam, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.models.price_cube import PriceCube
+from app.models.price_history import PriceHistory
+from app.services.price_history import day_bounds, history_row, local_day
+
+logger = logging.getLogger(__name__)
+
+TABLE = PriceCube.__tablename__
+HISTORY_TABLE = PriceHistory.__tablename__
+UNKNOWN_SELLER = "Desconhecido"
+
+# Dimensões de agrupamento → colunas (c: cubo, p: produto cadastrado)
+DIMENSIONS = {
+    "seller": ["c.seller"],
+    "product": ["c.product_key", "c.product_id", "p.name", "p.reference_price"],
+    "day": ["c.day"],
+    "category": ["p.category"],
+}
+
+# Métricas aceitas na ordenação
+METRICS = ("min_price", "avg_price", "max_price", "snapshots", "listings", "avg_rating", "below_reference_days")
+
+_SELECT_METRICS = (
+    "MIN(c.min_price) AS min_price, MAX(c.max_price) AS max_price, "
+    "SUM(c.sum_price) / SUM(c.snapshots) AS avg_price, "
+    "SUM(c.snapshots) AS snapshots, SUM(c.listings) AS listings, "
+    "SUM(c.rating_sum) / NULLIF(SUM(c.rating_count), 0) AS avg_rating, "
+    # Dias distintos (não células vendedor × dia) com algum preço abaixo da referência
+    "COUNT(DISTINCT CASE WHEN p.reference_price > 0 AND c.min_price < p.reference_price THEN c.day END) "
+    "AS below_reference_days"
+)
+
+
+def touched_groups(products: Iterable[Dict[str, Any]]) -> Dict[date, Set[str]]:
+    """Pares (dia em ANALYTICS_TIMEZONE, produto) de um lote de snapshots, agrupados por dia"""
+    groups: Dict[date, Set[str]] = {}
+    for row in map(history_row, products):
+        if row:
+            groups.setdefault(local_day(row["timestamp"]), set()).add(row["product_key"])
+    return groups
+
+
+def _round(value: Any, digits: int = 2) -> Optional[float]:
+    return round(float(value), digits) if value is not None else None
+
+
+class PriceCubeStore:
+    """Atualização incremental e consultas do cubo"""
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self._engine = engine
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from app.db.session import engine
+            self._engine = engine
+        return self._engine
+
+    # Atualização
+
+    def _refresh_day(self, connection: Connection, day: date, product_keys: Optional[Set[str]]) -> None:
+        """Recalcula as células de um dia (todas, ou só as dos produtos informados)"""
+        # O histórico está em UTC; o dia do cubo é o de ANALYTICS_TIMEZONE
+        start, end = day_bounds(day)
+        params: Dict[str, Any] = {
+            "day": day,
+            "start": start,
+            "end": end,
+            "now": datetime.now(),
+            "unknown": UNKNOWN_SELLER
+        }
+        key_filter = ""
+        if product_keys is not None:
+            key_filter = " AND product_key IN :keys"
+            params["keys"] = sorted(product_keys)
+
+        delete = text(f"DELETE FROM {TABLE} WHERE day = :day{key_filter}")
+        insert = text(
+            f"INSERT INTO {TABLE} (product_key, seller, day, product_id, min_price, max_price, sum_price, "
+            f"snapshots, listings, rating_sum, rating_count, refreshed_at) "
+            f"SELECT product_key, COALESCE(seller, :unknown), :day, MAX(product_id), MIN(price), MAX(price), "
+            f"SUM(price), COUNT(*), COUNT(DISTINCT COALESCE(listing_id, snapshot_id)), "
+            f"COALESCE(SUM(rating), 0), COUNT(rating), :now "
+            f"FROM {HISTORY_TABLE} WHERE timestamp >= :start AND timestamp < :end{key_filter} "
+            f"GROUP BY product_key, COALESCE(seller, :unknown)"
+        ).bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime),
+                     bindparam("now", type_=DateTime))
+        for statement in (delete, insert):
+            statement = statement.bindparams(bindparam("day", type_=Date))
+            if product_keys is not None:
+                statement = statement.bindparams(bindparam("keys", expanding=True))
+            connection.execute(statement, params)
+
+    def refresh(self, groups: Dict[date, Set[str]]) -> int:
+        """
+        Recalcula as células dos pares (dia, produto) informados
+
+        Returns:
+            int: Número de dias atualizados
+        """
+        if not settings.PRICE_CUBE_ENABLED or not groups:
+            return 0
+        with self.engine.begin() as connection:
+            for day in sorted(groups):
+                self._refresh_day(connection, day, groups[day])
+        return len(groups)
+
+    def refresh_products(self, products: List[Dict[str, Any]]) -> int:
+        """Atualiza o cubo com os dias e produtos de um lote recém-ingerido"""
+        return self.refresh(touched_groups(products))
+
+    def rebuild(self, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """
+        Recalcula o cubo inteiro (ou o intervalo informado) a partir de
+        price_history, um dia por transação
+
+        Returns:
+            int: Número de dias recalculados
+        """
+        with self.engine.connect() as connection:
+            first, last = connection.execute(text(f"SELECT MIN(timestamp), MAX(timestamp) FROM {HISTORY_TABLE}")).one()
+        if first is None:
+            return 0
+        # SQLite devolve texto em agregações sem tipo
+        first = first if isinstance(first, datetime) else datetime.fromisoformat(str(first))
+        last = last if isinstance(last, datetime) else datetime.fromisoformat(str(last))
+
+        day = max(local_day(first), start) if start else local_day(first)
+        last_day = min(local_day(last), end) if end else local_day(last)
+        days = 0
+        while day <= last_day:
+            with self.engine.begin() as connection:
+                self._refresh_day(connection, day, None)
+            day += timedelta(days=1)
+            days += 1
+        logger.info(f"Cubo de preços recalculado: {days} dias")
+        return days
+
+    # Consultas
+
+    def query(self, start: date, end: date, dimensions: List[str],
+              product_id: Optional[int] = None, product_key: Optional[str] = None,
+              seller: Optional[str] = None, category: Optional[str] = None,
+              below_reference: bool = False, order_by: str = "snapshots",
+              descending: bool = True, size: int = 100) -> List[Dict[str, Any]]:
+        """
+        Reagrega as células do período pelas dimensões pedidas
+
+        Args:
+            start, end: Dias inicial e final (inclusive)
+            dimensions: Subconjunto de DIMENSIONS ("seller", "product", "day", "category")
+            product_id, product_key, seller, category: Filtros opcionais
+            below_reference: Apenas células com preço mínimo abaixo do preço de
+                referência do produto cadastrado
+            order_by: Métrica de ordenação (METRICS)
+            descending: Ordem decrescente
+            size: Número máximo de linhas
+        """
+        unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+        if unknown or not dimensions:
+            raise ValueError(f"Dimensões inválidas: {', '.join(unknown) or 'nenhuma'}")
+        if order_by not in METRICS:
+            raise ValueError(f"Métrica de ordenação inválida: {order_by}")
+
+        columns = [column for dimension in dimensions for column in DIMENSIONS[dimension]]
+        filters = ["c.day >= :start", "c.day <= :end"]
+        params: Dict[str, Any] = {"start": start, "end": end, "size": size}
+        for column, name, value in (("c.product_id", "product_id", product_id),
+                                    ("c.product_key", "product_key", product_key),
+                                    ("c.seller", "seller", seller),
+                                    ("p.category", "category", category)):
+            if value is not None:
+                filters.append(f"{column} = :{name}")
+                params[name] = value
+        if below_reference:
+            filters.append("p.reference_price > 0 AND c.min_price < p.reference_price")
+
+        sql = (
+            f"SELECT {', '.join(columns)}, {_SELECT_METRICS} "
+            f"FROM {TABLE} c LEFT JOIN products p ON p.id = c.product_id "
+            f"WHERE {' AND '.join(filters)} "
+            f"GROUP BY {', '.join(columns)} "
+            f"ORDER BY {order_by} {'DESC' if descending else 'ASC'} LIMIT :size"
+        )
+        statement = text(sql).bindparams(bindparam("start", type_=Date), bindparam("end", type_=Date))
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement, params).mappings().all()
+
+        results = []
+        for row in rows:
+            item: Dict[str, Any] = {}
+            if "seller" in dimensions:
+                item["seller"] = row["seller"]
+            if "product" in dimensions:
+                item["product_key"] = row["product_key"]
+                item["product_db_id"] = row["product_id"]
+                item["product_name"] = row["name"]
+                item["reference_price"] = _round(row["reference_price"])
+            if "day" in dimensions:
+                day = row["day"]
+                item["day"] = day.isoformat() if isinstance(day, date) else day
+            if "category" in dimensions:
+                item["category"] = row["category"]
+            item.update({
+                "min_price": _round(row["min_price"]),
+                "avg_price": _round(row["avg_price"]),
+                "max_price": _round(row["max_price"]),
+                "snapshots": int(row["snapshots"]),
+                "listings": int(row["listings"]),
+                "avg_rating": _round(row["avg_rating"], 1),
+                "below_reference_days": int(row["below_reference_days"] or 0)
+            })
+            results.append(item)
+        return results
+
+
+price_cube = PriceCubeStore()
@@ -0,0 +1,326 @@
+"""
+Histórico de preços no banco relacional (tabela price_history).
+
+Cada snapshot com preço gravado no Elasticsearch também ganha uma linha na
+tabela price_history, de modo que os gráficos de histórico de um produto podem
+ser servidos só com SQL, sem o cluster. No PostgreSQL a tabela é particionada
+por mês (price_history_AAAAMM): as partições são criadas sob demanda antes de
+cada ingestão, as consultas por período leem só as partições do intervalo e a
+retenção pode ser feita removendo partições inteiras.
+
+A ingestão é em lote: no PostgreSQL (psycopg2) as linhas vão por COPY para uma
+tabela temporária e entram com um único INSERT ... SELECT ... ON CONFLICT DO
+NOTHING, então reingerir o mesmo snapshot não duplica o histórico. Nos demais
+bancos (SQLite em desenvolvimento) são inserções de várias linhas por comando.
+
+Os timestamps são gravados em UTC (sem fuso na coluna). Os documentos trazem o
+horário local do rastreador sem indicação de fuso, que é interpretado em
+ANALYTICS_TIMEZONE, como nas janelas de app.core.time_windows; os dias do cubo
+(local_day, day_bounds) também são os dias desse fuso.
+"""
+
+import csv
+import io
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.models.price_history import PriceHistory
+from app.services import analytics_queries as queries
+from app.services.elasticsearch_service import _first_value, _parse_timestamp, rollup_product_key, snapshot_id
+
+logger = logging.getLogger(__name__)
+
+TABLE = PriceHistory.__tablename__
+COLUMNS = ("snapshot_id", "timestamp", "product_id", "product_key", "listing_id", "seller", "price", "rating")
+STAGING_TABLE = "price_history_staging"
+
+# Linhas por comando nas inserções de várias linhas
+INSERT_BATCH_SIZE = 1000
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value: datetime) -> datetime:
+    value = month_start(value)
+    return value.replace(year=value.year + 1, month=1) if value.month == 12 else value.replace(month=value.month + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_{month:%Y%m}"
+
+
+def to_utc(value: datetime) -> datetime:
+    """Converte para UTC sem fuso; valores sem fuso estão em ANALYTICS_TIMEZONE"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(settings.ANALYTICS_TIMEZONE))
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_day(value: datetime) -> date:
+    """Dia em ANALYTICS_TIMEZONE de um timestamp gravado (UTC sem fuso)"""
+    return value.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(settings.ANALYTICS_TIMEZONE)).date()
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Início e fim (exclusivo), em UTC sem fuso, de um dia em ANALYTICS_TIMEZONE"""
+    return (to_utc(datetime.combine(day, datetime.min.time())),
+            to_utc(datetime.combine(day + timedelta(days=1), datetime.min.time())))
+
+
+def history_row(product: Dict[str, Any], doc_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Linha do histórico de um documento de snapshot; None sem preço, data ou
+    produto. snapshot_id é o _id do documento no Elasticsearch: doc_id quando
+    informado (hit["_id"]), senão snapshot_id(product), o mesmo da ingestão
+    """
+    timestamp = _parse_timestamp(product.get("timestamp"))
+    product_key = rollup_product_key(product)
+    try:
+        price = float(_first_value(product, "price", "preco") or 0)
+    except (TypeError, ValueError):
+        return None
+    if timestamp is None or product_key is None or price <= 0:
+        return None
+
+    timestamp = to_utc(timestamp)
+
+    product_id = product.get("product_db_id")
+    try:
+        product_id = int(product_id) if product_id is not None else None
+    except (TypeError, ValueError):
+        product_id = None
+
+    try:
+        rating = float(_first_value(product, "rating", "avaliacao"))
+    except (TypeError, ValueError):
+        rating = None
+
+    seller = _first_value(product, "seller", "vendedor")
+    return {
+        "snapshot_id": doc_id or snapshot_id(product),
+        "timestamp": timestamp,
+        "product_id": product_id,
+        "product_key": product_key,
+        "listing_id": product.get("listing_id"),
+        "seller": str(seller) if seller is not None else None,
+        "price": price,
+        "rating": rating if rating and rating > 0 else None
+    }
+
+
+class PriceHistoryStore:
+    """Gravação em lote e consulta do histórico de preços"""
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self._engine = engine
+        self._partitions: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from app.db.session import engine
+            self._engine = engine
+        return self._engine
+
+    @property
+    def partitioned(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    # Partições
+
+    def ensure_partitions(self, connection: Connection, months: Iterable[datetime]) -> List[str]:
+        """
+        Cria as partições mensais que ainda não existem (PostgreSQL). Retorna os
+        nomes verificados, que só entram no cache após o commit (_remember)
+        """
+        with self._lock:
+            missing = sorted({month_start(month) for month in months
+                              if partition_name(month_start(month)) not in self._partitions})
+        if not missing:
+            return []
+
+        # Serializa a criação entre processos (rastreadores em paralelo)
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": TABLE})
+        for month in missing:
+            name = partition_name(month)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+            ))
+        return [partition_name(month) for month in missing]
+
+    def _remember(self, partitions: List[str]) -> None:
+        with self._lock:
+            self._partitions.update(partitions)
+
+    def list_partitions(self) -> List[str]:
+        if not self.partitioned:
+            return []
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = :table ORDER BY child.relname"
+            ), {"table": TABLE})
+            return [row[0] for row in rows]
+
+    def prepare(self, months_ahead: int = 1) -> None:
+        """Cria a partição do mês corrente e dos próximos meses (na inicialização)"""
+        if not self.partitioned:
+            return
+        month = month_start(datetime.now(timezone.utc).replace(tzinfo=None))
+        months = [month]
+        for _ in range(months_ahead):
+            month = next_month(month)
+            months.append(month)
+        with self.engine.begin() as connection:
+            partitions = self.ensure_partitions(connection, months)
+        self._remember(partitions)
+
+    # Ingestão
+
+    def ingest(self, products: List[Dict[str, Any]], doc_ids: Optional[List[str]] = None) -> int:
+        """
+        Grava o histórico de um lote de snapshots recém-indexados
+
+        Args:
+            products: Documentos do lote
+            doc_ids: _id de cada documento no Elasticsearch (opcional; sem ele,
+                snapshot_id(product))
+
+        Returns:
+            int: Número de linhas novas
+        """
+        if not settings.PRICE_HISTORY_ENABLED:
+            return 0
+        rows = [row for row in map(history_row, products, doc_ids or [None] * len(products)) if row]
+        if not rows:
+            return 0
+
+        partitions: List[str] = []
+        with self.engine.begin() as connection:
+            if self.partitioned:
+                partitions = self.ensure_partitions(connection, (row["timestamp"] for row in rows))
+            # COPY pelo psycopg2; outros drivers usam as inserções de várias linhas
+            if self.partitioned and connection.dialect.driver == "psycopg2":
+                inserted = self._copy(connection, rows)
+            else:
+                inserted = self._insert(connection, rows)
+        self._remember(partitions)
+        return inserted
+
+    def _copy(self, connection: Connection, rows: List[Dict[str, Any]]) -> int:
+        """COPY para a tabela temporária e um único INSERT ... SELECT no histórico"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # Campo vazio sem aspas é NULL no COPY em CSV
+            writer.writerow(["" if row[column] is None else row[column] for column in COLUMNS])
+        buffer.seek(0)
+
+        columns = ", ".join(COLUMNS)
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                f"(LIKE {TABLE} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            )
+            cursor.copy_expert(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(
+                f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {STAGING_TABLE} ON CONFLICT DO NOTHING"
+            )
+            return max(cursor.rowcount, 0)
+        finally:
+            cursor.close()
+
+    def _insert(self, connection: Connection, rows: List[Dict[str, Any]]) -> int:
+        """Inserções de várias linhas por comando, ignorando snapshots já gravados"""
+        dialect = self.engine.dialect.name
+        inserted = 0
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[start:start + INSERT_BATCH_SIZE]
+            if dialect == "postgresql":
+                statement = postgresql.insert(PriceHistory).values(batch).on_conflict_do_nothing()
+            elif dialect == "sqlite":
+                statement = sqlite.insert(PriceHistory).values(batch).on_conflict_do_nothing()
+            else:
+                statement = PriceHistory.__table__.insert().values(batch)
+            inserted += max(connection.execute(statement).rowcount, 0)
+        return inserted
+
+    # Consultas
+
+    def _bucket_expression(self) -> str:
+        """
+        Início do intervalo de cada linha em segundos desde a época, contado no
+        horário de ANALYTICS_TIMEZONE: os dias começam à meia-noite local, como
+        os dias do cubo e do resumo diário do Elasticsearch (chave = data local
+        à meia-noite UTC). O PostgreSQL converte cada linha pelo fuso (inclusive
+        horário de verão); o SQLite, sem base de fusos, soma o deslocamento do
+        fuso no fim do período
+        """
+        if self.engine.dialect.name == "postgresql":
+            return ("FLOOR(EXTRACT(EPOCH FROM (timestamp AT TIME ZONE 'UTC') AT TIME ZONE :timezone) "
+                    "/ :step) * :step")
+        return "(CAST(strftime('%s', timestamp) AS INTEGER) + :utc_offset) / :step * :step"
+
+    def history(self, start: datetime, interval_days: int, product_id: Optional[int] = None,
+                product_key: Optional[str] = None, seller: Optional[str] = None,
+                end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Preço médio, mínimo e máximo de um produto por intervalo de interval_days
+        dias (no formato de parse_price_evolution), do período [start, end];
+        start e end sem fuso e os limites dos intervalos estão em ANALYTICS_TIMEZONE
+        """
+        if product_id is None and product_key is None:
+            raise ValueError("Informe product_id ou product_key")
+        start = to_utc(start)
+        end = to_utc(end) if end is not None else None
+
+        # Produto cadastrado usa (product_id, timestamp); os demais, (product_key, timestamp)
+        filters = ["product_id = :product_id" if product_id is not None else "product_key = :product_key",
+                   "timestamp >= :start"]
+        zone = ZoneInfo(settings.ANALYTICS_TIMEZONE)
+        reference = (end or datetime.now(timezone.utc).replace(tzinfo=None)).replace(tzinfo=timezone.utc)
+        params: Dict[str, Any] = {"product_id": product_id, "product_key": product_key,
+                                  "start": start, "step": interval_days * 86400,
+                                  "timezone": settings.ANALYTICS_TIMEZONE,
+                                  "utc_offset": int(reference.astimezone(zone).utcoffset().total_seconds())}
+        if end is not None:
+            filters.append("timestamp <= :end")
+            params["end"] = end
+        if seller:
+            filters.append("seller = :seller")
+            params["seller"] = seller
+
+        sql = (
+            f"SELECT {self._bucket_expression()} AS bucket, SUM(price), COUNT(price), MIN(price), MAX(price) "
+            f"FROM {TABLE} WHERE {' AND '.join(filters)} GROUP BY bucket ORDER BY bucket"
+        )
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(sql), params).all()
+
+        buckets = [
+            {
+                "key": int(bucket) * 1000, "doc_count": count,
+                "sum_price": {"value": float(sum_price)}, "sample_count": {"value": count},
+                "min_price": {"value": float(min_price)}, "max_price": {"value": float(max_price)}
+            }
+            for bucket, sum_price, count, min_price, max_price in rows
+        ]
+        return queries.parse_price_evolution({"aggregations": {"price_over_time": {"buckets": buckets}}})
+
+
+price_history_store = PriceHistoryStore()
@@ -0,0 +1,152 @@
+"""
+Cache em memória dos produtos cadastrados.
+Evita abrir uma sessão SQL a cada consulta analítica que precisa saber quais
+produtos estão ativos. O cache é invalidado pelas rotas de CRUD de produtos
+e expira sozinho após PRODUCT_CACHE_TTL_SECONDS para cobrir alterações feitas
+fora da API (scripts, importações diretas no banco).
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_snapshot: Optional[Dict[str, Any]] = None
+_loaded_at: float = 0.0
+# Após uma falha ao ler as categorias, não tenta o banco de novo a cada documento
+_categories_retry_at: float = 0.0
+
+
+def _load_registered_products() -> Dict[str, Any]:
+    """Carrega do banco os produtos ativos e monta os conjuntos usados nas consultas"""
+    from app.models.product import Product
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        registered_products = db.query(Product).filter(Product.is_active == True).all()
+
+        ids = []
+        terms = set()
+        categories_by_id = {}
+        categories_by_term = {}
+        alert_rules = []
+        catalog = {}
+        for product in registered_products:
+            ids.append(product.id)
+            catalog[product.id] = {"id": product.id, "name": product.name, "pn": product.pn,
+                                   "search_terms": product.search_terms,
+                                   "reference_price": product.reference_price}
+            if product.name:
+                terms.add(product.name.lower())
+            if product.pn:
+                terms.add(product.pn.lower())
+            # Categoria já calculada ao salvar o produto (Product.category)
+            if product.category:
+                categories_by_id[product.id] = product.category
+                if product.search_terms:
+                    categories_by_term[product.search_terms.strip().lower()] = product.category
+            # Produtos com preço de referência geram regras de alerta (price_alerts)
+            if product.reference_price and product.reference_price > 0:
+                alert_rules.append((product.id, product.name, product.search_terms, product.reference_price))
+
+        return {
+            "ids": ids,
+            "terms": sorted(terms),
+            "categories": {"by_id": categories_by_id, "by_term": categories_by_term},
+            "alert_rules": alert_rules,
+            "catalog": catalog
+        }
+    finally:
+        db.close()
+
+
+def get_registered_products() -> Dict[str, Any]:
+    """
+    Retorna os IDs e termos exatos (nome e PN em minúsculas) dos produtos ativos
+    e as categorias já calculadas de cada um, além das regras de alerta de preço.
+
+    Returns:
+        dict: {"ids": [...], "terms": [...], "categories": {"by_id": {...}, "by_term": {...}},
+               "alert_rules": [(id, nome, termo de busca, preço de referência), ...],
+               "catalog": {id: {"id", "name", "pn", "search_terms", "reference_price"}}}
+    """
+    global _snapshot, _loaded_at
+
+    with _lock:
+        expired = time.monotonic() - _loaded_at > settings.PRODUCT_CACHE_TTL_SECONDS
+        if _snapshot is None or expired:
+            _snapshot = _load_registered_products()
+            _loaded_at = time.monotonic()
+            logger.info(f"Cache de produtos cadastrados carregado: {len(_snapshot['ids'])} produtos")
+        return _snapshot
+
+
+def get_registered_categories() -> Dict[str, Dict[Any, str]]:
+    """
+    Categorias dos produtos ativos, por ID e por termo de busca (minúsculas),
+    usadas para gravar o campo category na ingestão. Sem acesso ao banco (por
+    exemplo, em scripts fora da API), retorna mapas vazios.
+
+    Returns:
+        dict: {"by_id": {id: categoria}, "by_term": {termo: categoria}}
+    """
+    global _categories_retry_at
+
+    if time.monotonic() < _categories_retry_at:
+        return {"by_id": {}, "by_term": {}}
+    try:
+        return get_registered_products()["categories"]
+    except Exception as e:
+        _categories_retry_at = time.monotonic() + settings.PRODUCT_CACHE_TTL_SECONDS
+        logger.warning(f"Categorias dos produtos cadastrados indisponíveis: {e}")
+        return {"by_id": {}, "by_term": {}}
+
+
+def resolve_registered_products(ids: Optional[List[int]] = None,
+                                pns: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Produtos ativos pelos IDs e/ou part numbers (sem diferenciar maiúsculas),
+    na ordem pedida e sem repetições
+
+    Returns:
+        tuple: (produtos encontrados, identificadores não encontrados)
+    """
+    catalog = get_registered_products()["catalog"]
+    by_pn = {product["pn"].strip().lower(): product for product in catalog.values() if product["pn"]}
+
+    found: Dict[int, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for product_id in ids or []:
+        product = catalog.get(product_id)
+        if product is None:
+            missing.append(str(product_id))
+        else:
+            found.setdefault(product_id, product)
+    for pn in pns or []:
+        product = by_pn.get(pn.strip().lower())
+        if product is None:
+            missing.append(pn)
+        else:
+            found.setdefault(product["id"], product)
+    return list(found.values()), missing
+
+
+def invalidate_registered_products() -> None:
+    """
+    Descarta o cache; a próxima consulta recarrega os produtos do banco.
+    Também invalida os resultados de analytics, que dependem dos produtos cadastrados.
+    """
+    global _snapshot
+
+    with _lock:
+        _snapshot = None
+    logger.info("Cache de produtos cadastrados invalidado")
+
+    from app.services.query_cache import query_cache
+    query_cache.bump_generation()
@@ -0,0 +1,218 @@
+"""
+Cache de resultados das consultas de analytics e dashboard.
+
+Os dados só mudam quando um rastreamento termina, então os resultados são
+guardados até a próxima ingestão. Cada chave inclui um contador de geração que
+o caminho de ingestão incrementa após cada envio em lote ao Elasticsearch;
+resultados de gerações anteriores simplesmente deixam de ser encontrados.
+
+Há dois níveis: um LRU em memória (por processo) e, opcionalmente, o Redis,
+que compartilha resultados e o contador de geração entre workers. A geração
+também é incrementada quando a conexão com o Elasticsearch é restabelecida.
+"""
+
+import json
+import time
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Chave do contador de geração no Redis
+REDIS_GENERATION_KEY = "query-cache:generation"
+# Intervalo mínimo entre leituras do contador de geração no Redis
+GENERATION_REFRESH_SECONDS = 1.0
+
+# Falhas engolidas durante a requisição atual (ver mark_degraded); a lista é
+# compartilhada, então marcações feitas em threads do threadpool também contam
+_degraded: ContextVar[Optional[List[str]]] = ContextVar("query_cache_degraded", default=None)
+
+
+class QueryCache:
+    """Cache LRU em memória com nível opcional no Redis, invalidado por geração"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._generation_checked_at = 0.0
+        self._redis = self._connect_redis(redis_url) if redis_url else None
+
+    def _connect_redis(self, redis_url: str):
+        """Conecta ao Redis; em caso de falha o cache funciona apenas em memória"""
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            client.ping()
+            logger.info("Cache de consultas usando Redis como segundo nível")
+            return client
+        except Exception as e:
+            logger.warning(f"Redis indisponível para o cache de consultas, usando apenas memória: {e}")
+            return None
+
+    @property
+    def redis(self):
+        """Cliente Redis do segundo nível, ou None quando o cache é só em memória"""
+        return self._redis
+
+    @property
+    def generation(self) -> int:
+        """Geração atual dos dados (sincronizada com o Redis quando disponível)"""
+        if self._redis is not None and time.monotonic() - self._generation_checked_at > GENERATION_REFRESH_SECONDS:
+            try:
+                value = self._redis.get(REDIS_GENERATION_KEY)
+                self._generation = int(value) if value is not None else 0
+            except Exception as e:
+                logger.warning(f"Erro ao ler geração do cache no Redis: {e}")
+            self._generation_checked_at = time.monotonic()
+        return self._generation
+
+    def bump_generation(self) -> int:
+        """Invalida todos os resultados em cache; chamado após cada ingestão"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+        if self._redis is not None:
+            try:
+                self._generation = int(self._redis.incr(REDIS_GENERATION_KEY))
+                self._generation_checked_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Erro ao incrementar geração do cache no Redis: {e}")
+
+        logger.info(f"Cache de consultas invalidado (geração {self._generation})")
+        return self._generation
+
+    def make_key(self, endpoint: str, params: Dict[str, Any]) -> str:
+        """Monta a chave a partir do endpoint e dos parâmetros normalizados"""
+        normalized = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        return f"query-cache:{self.generation}:{endpoint}:{normalized}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor), consultando a memória e depois o Redis"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    return True, value
+                del self._entries[key]
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._store_local(key, value)
+                    return True, value
+            except Exception as e:
+                logger.warning(f"Erro ao ler cache de consultas no Redis: {e}")
+
+        return False, None
+
+    def set(self, key: str, value: Any) -> None:
+        """Guarda o resultado na memória e, se configurado, no Redis"""
+        self._store_local(key, value)
+
+        if self._redis is not None:
+            try:
+                self._redis.set(key, json.dumps(value, default=str), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Erro ao gravar cache de consultas no Redis: {e}")
+
+    def _store_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+query_cache = QueryCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+    redis_url=settings.REDIS_URL if settings.QUERY_CACHE_USE_REDIS else None
+)
+
+
+def mark_degraded(reason: str) -> None:
+    """
+    Marca o resultado da requisição atual como degradado. Chamado por quem
+    engole uma falha do Elasticsearch e devolve um resultado vazio no lugar,
+    para que esse vazio não seja confundido com um resultado legítimo
+    """
+    reasons = _degraded.get()
+    if reasons is not None:
+        reasons.append(reason)
+
+
+@contextmanager
+def track_degraded() -> Iterator[List[str]]:
+    """Coleta as marcações de mark_degraded feitas no bloco (repassadas ao bloco externo, se houver)"""
+    parent = _degraded.get()
+    reasons: List[str] = []
+    token = _degraded.set(reasons)
+    try:
+        yield reasons
+    finally:
+        _degraded.reset(token)
+        if parent is not None:
+            parent.extend(reasons)
+
+
+def is_cacheable(value: Any, degraded: bool = False) -> bool:
+    """
+    Resultados degradados não entram no cache: uma consulta que falhou e voltou
+    vazia (mark_degraded) ou uma resposta com "success": False ou "errors"
+    fixaria a falha até a próxima ingestão ou o fim do TTL. Resultados vazios
+    legítimos (nenhum dado no período) são guardados normalmente.
+    """
+    if degraded or value is None:
+        return False
+    if isinstance(value, dict):
+        if value.get("success") is False or value.get("errors"):
+            return False
+    return True
+
+
+def cached_query(endpoint: str) -> Callable:
+    """
+    Decorador para rotas GET de analytics/dashboard. A chave é formada pelo
+    nome do endpoint e pelos parâmetros recebidos; respostas degradadas
+    (mark_degraded) ou com "success": False não são guardadas (is_cacheable)
+    para não fixar o resultado de uma falha temporária.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            if not settings.QUERY_CACHE_ENABLED:
+                return await func(**kwargs)
+
+            key = query_cache.make_key(endpoint, kwargs)
+            found, value = query_cache.get(key)
+            if found:
+                return value
+
+            with track_degraded() as reasons:
+                value = await func(**kwargs)
+            if is_cacheable(value, degraded=bool(reasons)):
+                query_cache.set(key, value)
+            else:
+                logger.debug(f"Resultado de '{endpoint}' fora do cache: {', '.join(reasons) or 'falha'}")
+            return value
+
+        return wrapper
+
+    return decorator
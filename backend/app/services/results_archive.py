@@ -0,0 +1,389 @@
+"""
+Manifesto e arquivamento dos resultados salvos pelo rastreador.
+
+Cada busca salva em scrapers/resultados/ultima_busca_*.json ganha uma linha no
+manifesto (manifest.jsonl, só de acréscimo) com termo(s), horário, quantidade
+de produtos e tamanho. O manifesto é lido uma vez e depois apenas a partir do
+último deslocamento lido, e mantido em memória ordenado por horário: o arquivo
+mais recente sai em O(1) e consultas por período e termo são buscas binárias,
+sem listar o diretório nem chamar stat em cada arquivo.
+
+Arquivos mais antigos que RESULTS_COMPACT_AFTER_DAYS são compactados em
+arquivos zip mensais (arquivo_AAAAMM.zip, um membro por busca, JSON sem
+indentação). A ordem é segura contra interrupções: o membro é gravado no zip,
+o manifesto registra o arquivamento e só então o JSON original é removido.
+Os resultados arquivados continuam legíveis por read().
+
+O rastreador e a API acrescentam ao mesmo manifesto: acréscimos, compactação e
+reescrita tomam um flock exclusivo em manifest.lock. Cada reescrita abre o
+manifesto com uma linha de geração, que o leitor confere antes de continuar do
+último deslocamento lido.
+"""
+
+import os
+import json
+import uuid
+import bisect
+import logging
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: sem trava entre processos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "app", "scrapers", "resultados")
+
+MANIFEST_NAME = "manifest.jsonl"
+LOCK_NAME = "manifest.lock"
+FILE_PREFIX = "ultima_busca_"
+FILE_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+# Maior nome possível: limite superior das chaves (horário, nome) de um horário
+_MAX_NAME = chr(0x10FFFF)
+
+
+def file_timestamp(name: str) -> Optional[datetime]:
+    """Horário da busca codificado no nome ultima_busca_AAAAMMDD_HHMMSS.json"""
+    stem = os.path.basename(name)
+    if not (stem.startswith(FILE_PREFIX) and stem.endswith(".json")):
+        return None
+    try:
+        return datetime.strptime(stem[len(FILE_PREFIX):-len(".json")], FILE_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def describe_results(name: str, results: List[Dict[str, Any]], size: int,
+                     timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """Linha do manifesto de um arquivo de resultados"""
+    timestamp = timestamp or file_timestamp(name) or datetime.now()
+    terms = sorted({str(item.get("search_term")) for item in results if item.get("search_term")})
+    return {
+        "file": name,
+        "timestamp": timestamp.isoformat(),
+        "terms": terms,
+        "count": len(results),
+        "size": size,
+        "archive": None
+    }
+
+
+class ResultsArchive:
+    """Índice em memória do manifesto, com consulta, leitura e compactação"""
+
+    def __init__(self, results_dir: str = RESULTS_DIR):
+        self.results_dir = results_dir
+        self.manifest_path = os.path.join(results_dir, MANIFEST_NAME)
+        self.lock_path = os.path.join(results_dir, LOCK_NAME)
+        self._lock = threading.RLock()
+        self._lock_depth = 0                   # flock reentrante dentro do processo
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._order: List[tuple] = []          # (timestamp, nome), ordenado
+        self._loose: List[tuple] = []          # idem, só os JSON ainda não arquivados
+        self._by_term: Dict[str, List[tuple]] = {}
+        self._offset = 0
+        self._generation: Optional[str] = None
+        self._loaded = False
+
+    # Manifesto
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        name = record["file"]
+        if record.get("op") == "archive":
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry["archive"] = record["archive"]
+                self._remove_key(self._loose, (entry["timestamp"], name))
+            return
+        if record.get("op") == "delete":
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                key = (entry["timestamp"], name)
+                self._remove_key(self._order, key)
+                self._remove_key(self._loose, key)
+                for term in entry["terms"]:
+                    self._remove_key(self._by_term.get(term.lower(), []), key)
+            return
+
+        if name in self._entries:
+            return
+        entry = dict(record)
+        self._entries[name] = entry
+        key = (entry["timestamp"], name)
+        bisect.insort(self._order, key)
+        if not entry.get("archive"):
+            bisect.insort(self._loose, key)
+        for term in entry["terms"]:
+            bisect.insort(self._by_term.setdefault(term.lower(), []), key)
+
+    @staticmethod
+    def _remove_key(keys: List[tuple], key: tuple) -> None:
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        self._order.clear()
+        self._loose.clear()
+        self._by_term.clear()
+        self._offset = 0
+        self._generation = None
+
+    @contextmanager
+    def _manifest_lock(self):
+        """Trava exclusiva entre processos (flock em manifest.lock), reentrante na mesma thread"""
+        with self._lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            os.makedirs(self.results_dir, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Lê as linhas novas do manifesto (de outros processos ou após reescrita)"""
+        with self._lock:
+            try:
+                f = open(self.manifest_path, "rb")
+            except OSError:
+                if not self._loaded:
+                    self._loaded = True
+                    if os.path.isdir(self.results_dir):
+                        self.rebuild()
+                return
+
+            with f:
+                # A reescrita (os.replace) cria outro arquivo com outra geração,
+                # e o deslocamento lido do anterior não vale para ele
+                first = f.readline()
+                generation = None
+                if first.startswith(b'{"op": "generation"') and first.endswith(b"\n"):
+                    generation = json.loads(first)["generation"]
+                size = os.fstat(f.fileno()).st_size
+                if generation != self._generation or size < self._offset:
+                    self._reset()
+                    self._generation = generation
+                if size == self._offset:
+                    self._loaded = True
+                    return
+
+                f.seek(self._offset)
+                data = f.read()
+            # Uma linha incompleta (gravação em andamento) fica para a próxima leitura
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                        if record.get("op") != "generation":
+                            self._apply(record)
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Linha inválida no manifesto de resultados: {e}")
+            self._offset += len(complete)
+            self._loaded = True
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._manifest_lock():
+            self._refresh()
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._refresh()
+
+    def rebuild(self) -> int:
+        """Recria o manifesto a partir dos arquivos do diretório (migração inicial)"""
+        records = []
+        for name in sorted(os.listdir(self.results_dir)):
+            path = os.path.join(self.results_dir, name)
+            if file_timestamp(name) is None or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    results = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Arquivo de resultados ignorado no manifesto ({name}): {e}")
+                continue
+            records.append(describe_results(name, results if isinstance(results, list) else [],
+                                            os.path.getsize(path)))
+
+        for archive_name in sorted(os.listdir(self.results_dir)):
+            if not (archive_name.startswith("arquivo_") and archive_name.endswith(".zip")):
+                continue
+            with zipfile.ZipFile(os.path.join(self.results_dir, archive_name)) as archive:
+                for info in archive.infolist():
+                    results = json.loads(archive.read(info))
+                    record = describe_results(info.filename, results, info.file_size)
+                    record["archive"] = archive_name
+                    records.append(record)
+
+        with self._manifest_lock():
+            self._write_manifest(records)
+        logger.info(f"Manifesto de resultados recriado com {len(records)} arquivos")
+        return len(records)
+
+    def _write_manifest(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Substitui o manifesto atomicamente por um estado consolidado, sob
+        _manifest_lock para que nenhum acréscimo de outro processo se perca
+        """
+        with self._manifest_lock():
+            temp_path = self.manifest_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "generation", "generation": uuid.uuid4().hex}) + "\n")
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.manifest_path)
+            self._reset()
+            self._refresh()
+
+    # Registro e consulta
+
+    def record(self, path: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Registra um arquivo recém-salvo pelo rastreador"""
+        record = describe_results(os.path.basename(path), results, os.path.getsize(path))
+        self._append([record])
+        return record
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Entrada mais recente do manifesto"""
+        self._refresh()
+        with self._lock:
+            if not self._order:
+                return None
+            return dict(self._entries[self._order[-1][1]])
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              term: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Entradas do período (e do termo de busca), da mais antiga para a mais recente"""
+        self._refresh()
+        with self._lock:
+            keys = self._by_term.get(term.strip().lower(), []) if term else self._order
+            low = bisect.bisect_left(keys, (start.isoformat(),)) if start else 0
+            high = bisect.bisect_right(keys, (end.isoformat(), _MAX_NAME)) if end else len(keys)
+            return [dict(self._entries[name]) for _, name in keys[low:high]]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            entry = self._entries.get(os.path.basename(name))
+            return dict(entry) if entry else None
+
+    def path(self, entry: Dict[str, Any]) -> str:
+        """Caminho do JSON avulso de uma entrada (ainda não arquivada)"""
+        return os.path.join(self.results_dir, entry["file"])
+
+    def read(self, name: str) -> List[Dict[str, Any]]:
+        """Produtos de um arquivo de resultados, avulso ou já compactado"""
+        name = os.path.basename(name)
+        entry = self.get(name)
+        if entry is not None and entry.get("archive"):
+            with zipfile.ZipFile(os.path.join(self.results_dir, entry["archive"])) as archive:
+                return json.loads(archive.read(name))
+        with open(os.path.join(self.results_dir, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # Compactação
+
+    def compact(self, older_than_days: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Move os JSON avulsos mais antigos que older_than_days para os zips
+        mensais e consolida o manifesto
+        """
+        if older_than_days is None:
+            older_than_days = settings.RESULTS_COMPACT_AFTER_DAYS
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+
+        # Toda a compactação sob a trava: outro processo não grava no mesmo zip
+        # e os acréscimos do rastreador esperam a reescrita do manifesto
+        with self._manifest_lock():
+            self._refresh()
+            candidates = [dict(self._entries[name]) for timestamp, name in self._loose if timestamp < cutoff]
+
+            by_archive: Dict[str, List[Dict[str, Any]]] = {}
+            for entry in candidates:
+                archive_name = f"arquivo_{entry['timestamp'][:7].replace('-', '')}.zip"
+                by_archive.setdefault(archive_name, []).append(entry)
+
+            archived, missing, bytes_before = 0, 0, 0
+            for archive_name, entries in by_archive.items():
+                operations, done = [], []
+                with zipfile.ZipFile(os.path.join(self.results_dir, archive_name), "a",
+                                     compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+                    existing = set(archive.namelist())
+                    for entry in entries:
+                        path = self.path(entry)
+                        if entry["file"] in existing:
+                            # Arquivado antes de uma interrupção: só falta o manifesto
+                            pass
+                        elif os.path.exists(path):
+                            with open(path, "r", encoding="utf-8") as f:
+                                results = json.load(f)
+                            archive.writestr(entry["file"], json.dumps(results, ensure_ascii=False,
+                                                                      separators=(",", ":")))
+                        else:
+                            # O JSON sumiu sem ter sido arquivado: sai do manifesto
+                            operations.append({"op": "delete", "file": entry["file"]})
+                            missing += 1
+                            continue
+                        operations.append({"op": "archive", "file": entry["file"], "archive": archive_name})
+                        done.append(path)
+
+                # Zip fechado (gravado), depois o manifesto, e só então os originais saem
+                self._append(operations)
+                for path in done:
+                    if os.path.exists(path):
+                        bytes_before += os.path.getsize(path)
+                        os.remove(path)
+                archived += len(done)
+
+            if archived or missing:
+                # Consolida as operações em uma linha por arquivo (com as linhas
+                # acrescentadas por outros processos até aqui)
+                self._refresh()
+                self._write_manifest([self._entries[name] for _, name in self._order])
+
+        summary = {
+            "arquivados": archived,
+            "removidos_do_manifesto": missing,
+            "bytes_liberados": bytes_before,
+            "zips": sorted(by_archive)
+        }
+        if archived:
+            logger.info(f"Resultados compactados: {archived} arquivos em {len(by_archive)} zips")
+        return summary
+
+    def maybe_compact(self) -> Optional[Dict[str, Any]]:
+        """Compacta se o JSON avulso mais antigo já passou do prazo; checagem O(1) no caso comum"""
+        if settings.RESULTS_COMPACT_AFTER_DAYS <= 0:
+            return None
+        self._refresh()
+        cutoff = (datetime.now() - timedelta(days=settings.RESULTS_COMPACT_AFTER_DAYS)).isoformat()
+        with self._lock:
+            oldest_loose = self._loose[0][0] if self._loose else None
+        if oldest_loose is None or oldest_loose >= cutoff:
+            return None
+        return self.compact()
+
+
+results_archive = ResultsArchive()
@@ -0,0 +1,434 @@
+"""
+Carga histórica das saídas antigas dos rastreadores.
+
+Lê os arquivos resultados*.csv, busca_*.csv e os resultados do rastreador
+listados no manifesto de scrapers/resultados (ultima_busca_*.json, avulsos ou
+já compactados nos zips mensais, via results_archive) em streaming, converte
+cada linha para o esquema dos documentos do índice e envia em lotes paralelos
+ao Elasticsearch (ou ao backend configurado em STORAGE_BACKEND).
+
+Cada documento recebe o mesmo ID determinístico usado na ingestão normal
+(snapshot_id) e é enviado com op_type "create": repetir a carga, ou carregar um
+arquivo cujos dados já chegaram ao índice, não duplica documentos nem o resumo
+diário.
+O progresso de cada arquivo é gravado em um checkpoint, permitindo retomar uma
+carga interrompida a partir do último lote confirmado. Documentos gravados
+pela execução interrompida depois do checkpoint (409 ao retomar, com o mesmo
+source_file e source_row) passam pelas estruturas derivadas na retomada.
+"""
+
+import os
+import re
+import csv
+import json
+import time
+import glob
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from app.services.elasticsearch_service import snapshot_id, listing_key, derived_fields
+from app.services.results_archive import results_archive
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Arquivos considerados quando nenhum caminho é informado (além dos do manifesto)
+DEFAULT_PATTERNS = [
+    os.path.join(BACKEND_DIR, "**", "resultados*.csv"),
+    os.path.join(os.path.dirname(BACKEND_DIR), "Mercado-Livre-Scraper-master", "resultados", "busca_*.csv"),
+]
+
+# Cabeçalhos (em minúsculas) das diferentes versões dos rastreadores → campo canônico
+FIELD_ALIASES = {
+    "title": ["title", "titulo", "título", "título encontrado"],
+    "price": ["price", "current_price", "preço atual", "preço (r$)", "preco", "preço"],
+    "original_price": ["original_price", "preço original"],
+    "seller": ["seller", "vendedor"],
+    "url": ["url", "link"],
+    "rating": ["rating", "avaliação", "avaliacao"],
+    "review_count": ["review_count", "num_reviews", "num. avaliações"],
+    "timestamp": ["timestamp", "search_date", "data"],
+    "search_term": ["search_term", "busca"],
+    "pn": ["pn"],
+    "product_id": ["product_id", "id"],
+    "availability": ["availability", "disponibilidade"],
+    "condition": ["condition", "condição"],
+}
+
+# Campos booleanos preservados dos arquivos JSON
+BOOLEAN_FIELDS = ["free_shipping", "is_original", "is_remanufactured", "is_international",
+                  "is_mercado_livre_full"]
+
+FILENAME_TIMESTAMP = re.compile(r"(\d{8}_\d{6})")
+FILENAME_SEARCH_TERM = re.compile(r"^busca_(.+)_\d{8}_\d{6}\.csv$")
+
+
+def discover_files(patterns: Optional[List[str]] = None) -> List[str]:
+    """
+    Expande os padrões em uma lista ordenada de arquivos. Sem padrões, usa
+    DEFAULT_PATTERNS e todos os resultados do manifesto (results_archive.query),
+    inclusive os compactados, que não existem mais como JSON avulso
+    """
+    files = set()
+    if not patterns:
+        files.update(os.path.abspath(results_archive.path(entry)) for entry in results_archive.query())
+    for pattern in patterns or DEFAULT_PATTERNS:
+        if os.path.isfile(pattern):
+            files.add(os.path.abspath(pattern))
+            continue
+        for path in glob.glob(pattern, recursive=True):
+            if path.endswith((".csv", ".json", ".jsonl", ".ndjson")):
+                files.add(os.path.abspath(path))
+    return sorted(files)
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """Converte preços como 1349.00, "R$ 1.349,00" ou "279" em float"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = re.sub(r"[^\d,.\-]", "", str(value))
+    if not text:
+        return None
+    if "," in text:
+        # Formato brasileiro: ponto como milhar e vírgula como decimal
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _file_context(path: str) -> Dict[str, Any]:
+    """Informações deduzidas do nome do arquivo (termo de busca e data da coleta)"""
+    name = os.path.basename(path)
+    context: Dict[str, Any] = {"source_file": os.path.join(os.path.basename(os.path.dirname(path)), name)}
+
+    match = FILENAME_TIMESTAMP.search(name)
+    if match:
+        context["timestamp"] = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").isoformat()
+    elif os.path.exists(path):
+        context["timestamp"] = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+    else:
+        entry = results_archive.get(path)
+        context["timestamp"] = entry["timestamp"] if entry else datetime.now().isoformat()
+
+    match = FILENAME_SEARCH_TERM.match(name)
+    if match:
+        context["search_term"] = match.group(1)
+
+    return context
+
+
+def normalize_record(record: Dict[str, Any], context: Dict[str, Any],
+                     row_number: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Converte uma linha de CSV ou um item de JSON no documento canônico do índice.
+    Linhas sem título e sem preço (buscas sem resultado) são descartadas.
+    """
+    lowered = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+
+    doc: Dict[str, Any] = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            value = lowered.get(alias)
+            if value is not None and value != "":
+                doc[field] = value
+                break
+
+    price = parse_price(doc.get("price"))
+    if not doc.get("title") and price is None:
+        return None
+
+    doc["price"] = price
+    if "original_price" in doc:
+        doc["original_price"] = parse_price(doc["original_price"])
+    if "rating" in doc:
+        doc["rating"] = parse_price(doc["rating"])
+    if "review_count" in doc:
+        try:
+            doc["review_count"] = int(float(doc["review_count"]))
+        except (TypeError, ValueError):
+            del doc["review_count"]
+
+    # Só IDs de anúncio (MLB...) são mantidos; nos CSVs antigos "id" é o número da linha
+    if not str(doc.get("product_id", "")).upper().startswith("MLB"):
+        doc.pop("product_id", None)
+
+    for field in BOOLEAN_FIELDS:
+        if field in lowered and isinstance(lowered[field], bool):
+            doc[field] = lowered[field]
+
+    doc.setdefault("timestamp", context["timestamp"])
+    if "search_term" in context:
+        doc.setdefault("search_term", context["search_term"])
+
+    doc["source"] = "backfill"
+    doc["source_file"] = context["source_file"]
+    if row_number is not None:
+        doc["source_row"] = row_number
+    # Mesmos campos que _prepare_snapshot completa na ingestão normal
+    doc["id"] = snapshot_id(doc)
+    doc["listing_id"] = listing_key(doc)
+    doc.update(derived_fields(doc))
+    return doc
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê os registros brutos de um arquivo CSV, JSON (lista) ou JSON Lines;
+    resultados compactados nos zips mensais são lidos por results_archive.read
+    """
+    if not os.path.exists(path) and results_archive.get(path) is not None:
+        data = results_archive.read(path)
+        yield from (data if isinstance(data, list) else [data])
+    elif path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            yield from csv.DictReader(f)
+    elif path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+
+
+def iter_documents(path: str, skip: int = 0) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """
+    Gera (número da linha, documento) a partir de `skip`. Linhas descartadas
+    geram documento None para que o checkpoint continue avançando.
+    """
+    context = _file_context(path)
+    for row_number, record in enumerate(iter_records(path)):
+        if row_number < skip:
+            continue
+        yield row_number, normalize_record(record, context, row_number)
+
+
+class Checkpoint:
+    """Progresso por arquivo, gravado em JSON após cada lote confirmado"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def _signature(self, file_path: str) -> Dict[str, Any]:
+        if not os.path.exists(file_path):
+            # Compactado: o manifesto guarda o tamanho original e o horário da busca
+            entry = results_archive.get(file_path) or {}
+            return {"size": entry.get("size"), "mtime": entry.get("timestamp")}
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def rows_done(self, file_path: str) -> Optional[int]:
+        """Linhas já confirmadas; None quando o arquivo foi concluído sem alterações"""
+        entry = self.files.get(file_path)
+        if not entry or any(entry.get(k) != v for k, v in self._signature(file_path).items()):
+            return 0
+        return None if entry.get("completed") else entry.get("rows_done", 0)
+
+    def update(self, file_path: str, rows_done: int, completed: bool = False) -> None:
+        self.files[file_path] = {**self._signature(file_path), "rows_done": rows_done, "completed": completed}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class BackfillReport:
+    """Contadores e vazão da carga"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.files = 0
+        self.skipped_files = 0
+        self.rows = 0
+        self.indexed = 0
+        self.existing = 0
+        self.discarded = 0
+        self.errors = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "arquivos": self.files,
+            "arquivos_ja_concluidos": self.skipped_files,
+            "linhas_lidas": self.rows,
+            "indexados": self.indexed,
+            "ja_existentes": self.existing,
+            "descartados": self.discarded,
+            "erros": self.errors,
+            "segundos": round(elapsed, 2),
+            "linhas_por_segundo": round(self.rows / elapsed, 1) if elapsed else 0.0
+        }
+
+
+def _backfill_file_es(service, path: str, skip: int, checkpoint: Checkpoint, report: BackfillReport,
+                      chunk_size: int, workers: int, evaluate_alerts: bool = False) -> None:
+    """
+    Envia um arquivo ao Elasticsearch com helpers.parallel_bulk. Cada lote
+    confirmado passa por ElasticsearchService.after_ingest, como na ingestão
+    normal, antes de o checkpoint avançar.
+
+    Ao retomar (skip > 0), os lotes que a execução interrompida já tinha
+    gravado voltam como 409 sem terem passado por after_ingest; os conflitos
+    cujo documento gravado tem o mesmo source_file e source_row foram criados
+    por essa execução e são derivados agora
+    """
+    from elasticsearch import helpers
+    from app.services.elasticsearch_service import ES_INDEX
+
+    # Documentos na ordem em que foram entregues ao parallel_bulk, que devolve
+    # os resultados na mesma ordem
+    pending: deque = deque()
+    rows_done = skip
+
+    def actions():
+        for row_number, doc in iter_documents(path, skip):
+            report.rows += 1
+            if doc is None:
+                # Linhas descartadas não têm resultado no bulk; ao retomar são lidas de novo
+                report.discarded += 1
+                continue
+            pending.append((row_number, doc))
+            yield {"_op_type": "create", "_index": ES_INDEX, "_id": doc["id"], "_source": doc}
+
+    def interrupted(conflicts: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        response = service.client.mget(index=ES_INDEX, ids=[doc["id"] for _, doc in conflicts],
+                                       source_includes=["source_file", "source_row"])
+        stored = {hit["_id"]: hit.get("_source", {}) for hit in response["docs"] if hit.get("found")}
+        return [doc for row_number, doc in conflicts
+                if stored.get(doc["id"], {}).get("source_file") == doc["source_file"]
+                and stored.get(doc["id"], {}).get("source_row") == row_number]
+
+    def derive(created: List[Dict[str, Any]], conflicts: List[Tuple[int, Dict[str, Any]]]) -> None:
+        # Só os documentos criados (agora ou pela execução interrompida) passam pelas estruturas derivadas
+        if conflicts:
+            created = created + interrupted(conflicts)
+        if created:
+            service.after_ingest(created, evaluate_alerts=evaluate_alerts)
+
+    created: List[Dict[str, Any]] = []
+    conflicts: List[Tuple[int, Dict[str, Any]]] = []
+    confirmed = 0
+    for ok, item in helpers.parallel_bulk(service.client, actions(), thread_count=workers,
+                                          chunk_size=chunk_size, raise_on_error=False,
+                                          raise_on_exception=False):
+        row_number, doc = pending.popleft()
+        status = item.get("create", {}).get("status")
+        if ok:
+            created.append(doc)
+            report.indexed += 1
+        elif status == 409:
+            report.existing += 1
+            if skip:
+                conflicts.append((row_number, doc))
+        else:
+            report.errors += 1
+            logger.warning(f"Falha ao indexar linha {row_number} de {path}: {item}")
+
+        confirmed += 1
+        rows_done = row_number + 1
+        if confirmed % chunk_size == 0:
+            derive(created, conflicts)
+            created, conflicts = [], []
+            checkpoint.update(path, rows_done)
+
+    derive(created, conflicts)
+    checkpoint.update(path, rows_done, completed=True)
+
+
+def _backfill_file_backend(backend, path: str, skip: int, checkpoint: Checkpoint, report: BackfillReport,
+                           chunk_size: int) -> None:
+    """Grava um arquivo no backend embutido, lote a lote"""
+    batch: List[Dict[str, Any]] = []
+    rows_done = skip
+    for row_number, doc in iter_documents(path, skip):
+        report.rows += 1
+        rows_done = row_number + 1
+        if doc is None:
+            report.discarded += 1
+            continue
+        batch.append(doc)
+        if len(batch) >= chunk_size:
+            if backend.index_products(batch):
+                report.indexed += len(batch)
+            else:
+                report.errors += len(batch)
+            batch = []
+            checkpoint.update(path, rows_done)
+
+    if batch:
+        if backend.index_products(batch):
+            report.indexed += len(batch)
+        else:
+            report.errors += len(batch)
+    checkpoint.update(path, rows_done, completed=True)
+
+
+def run_backfill(files: List[str], checkpoint_path: str, chunk_size: int = 2000,
+                 workers: int = 4, evaluate_alerts: bool = False) -> Dict[str, Any]:
+    """
+    Carrega os arquivos informados e devolve o relatório de vazão.
+
+    Args:
+        files: Arquivos a carregar (ver discover_files)
+        checkpoint_path: Arquivo JSON com o progresso de cada arquivo
+        chunk_size: Documentos por requisição bulk e intervalo entre checkpoints
+        workers: Requisições bulk simultâneas (apenas Elasticsearch)
+        evaluate_alerts: Avaliar os alertas de preço com os dados históricos
+            (desligado por padrão; apenas Elasticsearch)
+
+    Returns:
+        dict: Relatório com contadores e linhas por segundo
+    """
+    from app.core.config import settings
+    from app.services.storage_backend import get_storage_backend
+
+    checkpoint = Checkpoint(checkpoint_path)
+    report = BackfillReport()
+    backend = get_storage_backend()
+    use_es = settings.STORAGE_BACKEND.lower() == "elasticsearch"
+
+    for path in files:
+        skip = checkpoint.rows_done(path)
+        if skip is None:
+            report.skipped_files += 1
+            continue
+
+        report.files += 1
+        file_started = time.perf_counter()
+        rows_before = report.rows
+        try:
+            if use_es:
+                _backfill_file_es(backend.service, path, skip, checkpoint, report, chunk_size, workers,
+                                  evaluate_alerts)
+            else:
+                _backfill_file_backend(backend, path, skip, checkpoint, report, chunk_size)
+        except Exception as e:
+            logger.error(f"Erro na carga de {path}: {e}")
+            report.errors += 1
+            continue
+
+        elapsed = time.perf_counter() - file_started
+        rows = report.rows - rows_before
+        logger.info(f"{os.path.basename(path)}: {rows} linhas em {elapsed:.1f}s "
+                    f"({rows / elapsed if elapsed else 0:.0f} linhas/s)")
+
+    return report.to_dict()
@@ -0,0 +1,297 @@
+"""
+Estatísticas vetorizadas dos resultados de busca dos rastreadores.
+
+Os produtos de um ou mais arquivos scrapers/resultados/ultima_busca_*.json são
+convertidos em colunas NumPy (preço, avaliação, flags e códigos inteiros de
+vendedor, modelo e termo de busca) uma única vez; contagens, faixas de preço,
+percentis, histograma e o detalhamento por modelo de cartucho são então
+calculados sobre as colunas inteiras (bincount, percentile, argsort), sem
+laços por produto. Assim um período inteiro (milhões de linhas) é analisado
+em segundos, e não apenas o último arquivo.
+"""
+
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.results_archive import results_archive
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "app", "scrapers", "resultados")
+
+# ultima_busca_20250611_163103.json
+RESULT_FILE_PATTERN = re.compile(r"^ultima_busca_(\d{8}_\d{6})\.json$")
+
+NOT_SPECIFIED = "Não especificado"
+NOT_IDENTIFIED = "Não identificado"
+
+# Flags booleanas dos produtos → nome na resposta
+FLAGS = {
+    "is_original": "produtos_originais",
+    "is_remanufactured": "produtos_remanufaturados",
+    "free_shipping": "frete_gratis",
+    "is_international": "produtos_internacionais",
+    "is_mercado_livre_full": "produtos_mercado_livre_full",
+    "is_official_store": "lojas_oficiais",
+}
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+
+def result_file_timestamp(path: str) -> datetime:
+    """Data da busca pelo nome do arquivo; a data de modificação quando o nome não segue o padrão"""
+    match = RESULT_FILE_PATTERN.match(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def list_result_files(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      term: Optional[str] = None) -> List[str]:
+    """
+    Arquivos de resultados do período (e do termo de busca), do mais antigo
+    para o mais recente, consultados no manifesto. Arquivos já compactados
+    aparecem com o caminho original e são lidos do zip por load_result_files.
+    """
+    return [os.path.join(RESULTS_DIR, entry["file"]) for entry in results_archive.query(start, end, term)]
+
+
+def load_result_files(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    """Concatena os produtos dos arquivos; arquivos ilegíveis são ignorados com aviso"""
+    records: List[Dict[str, Any]] = []
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = orjson.loads(f.read()) if orjson is not None else json.load(f)
+            else:
+                # Compactado em um arquivo_AAAAMM.zip
+                data = results_archive.read(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Arquivo de resultados ignorado ({path}): {e}")
+            continue
+        if isinstance(data, list):
+            records.extend(data)
+    return records
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _float_column(records: List[Dict[str, Any]], field: str) -> np.ndarray:
+    """Coluna numérica; ausentes e inválidos viram 0"""
+    values = [r.get(field) for r in records]
+    try:
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Algum valor textual: converte um a um
+        column = np.array([_number(value) for value in values], dtype=np.float64)
+    return np.nan_to_num(column, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _factorize(records: List[Dict[str, Any]], field: str, default: str) -> Tuple[np.ndarray, List[str]]:
+    """Códigos inteiros (0..k-1) e rótulos de uma coluna de texto"""
+    index: Dict[Any, int] = {}
+    codes = np.array([index.setdefault(r.get(field), len(index)) for r in records], dtype=np.int64)
+
+    # Ausentes e vazios (None, "") são um único rótulo padrão
+    labels = [value if value else default for value in index]
+    if len(set(labels)) < len(labels):
+        unique_labels: Dict[str, int] = {}
+        remap = np.array([unique_labels.setdefault(label, len(unique_labels)) for label in labels], dtype=np.int64)
+        return remap[codes], list(unique_labels)
+    return codes, labels
+
+
+class ResultColumns:
+    """Resultados de busca em formato colunar"""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.size = len(records)
+        self.price = _float_column(records, "price")
+        self.rating = _float_column(records, "rating")
+        # Mesma regra de verdade da avaliação original (valor "truthy")
+        self.flags = {
+            flag: np.array([r.get(flag) for r in records], dtype=bool)
+            for flag in FLAGS
+        }
+        self.seller, self.sellers = _factorize(records, "seller", NOT_SPECIFIED)
+        self.model, self.models = _factorize(records, "cartridge_model", NOT_IDENTIFIED)
+        self.term, self.terms = _factorize(records, "search_term", NOT_SPECIFIED)
+
+
+def _round(value: float, digits: int = 2) -> float:
+    return round(float(value), digits)
+
+
+def _grouped_percentiles(sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray,
+                         q: float) -> np.ndarray:
+    """Percentil q (0-100, interpolação linear) de cada grupo em valores ordenados por grupo"""
+    position = starts + (counts - 1) * (q / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + counts - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+
+def _top(counts: np.ndarray, labels: List[str], limit: Optional[int] = None) -> Dict[str, int]:
+    order = np.argsort(-counts, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+    return {labels[i]: int(counts[i]) for i in order if counts[i] > 0}
+
+
+def price_summary(prices: np.ndarray, bins: int) -> Dict[str, Any]:
+    """Faixa, média, mediana, desvio, percentis e histograma dos preços válidos"""
+    if not prices.size:
+        return {"min": 0, "max": 0, "media": 0, "mediana": 0, "desvio_padrao": 0,
+                "percentis": {}, "histograma": []}
+
+    percentiles = np.percentile(prices, PERCENTILES)
+    counts, edges = np.histogram(prices, bins=bins)
+    return {
+        "min": _round(prices.min()),
+        "max": _round(prices.max()),
+        "media": _round(prices.mean()),
+        "mediana": _round(np.median(prices)),
+        "desvio_padrao": _round(prices.std()),
+        "percentis": {f"p{p}": _round(v) for p, v in zip(PERCENTILES, percentiles)},
+        "histograma": [
+            {"de": _round(edges[i]), "ate": _round(edges[i + 1]), "quantidade": int(counts[i])}
+            for i in range(len(counts))
+        ]
+    }
+
+
+def model_breakdown(columns: ResultColumns) -> List[Dict[str, Any]]:
+    """Contagens, preços, avaliação e vendedores distintos por modelo de cartucho"""
+    k = len(columns.models)
+    if not k:
+        return []
+
+    totals = np.bincount(columns.model, minlength=k)
+    flag_counts = {
+        flag: np.bincount(columns.model, weights=values, minlength=k)
+        for flag, values in columns.flags.items()
+    }
+
+    rated = columns.rating > 0
+    rated_counts = np.bincount(columns.model[rated], minlength=k)
+    rating_sums = np.bincount(columns.model[rated], weights=columns.rating[rated], minlength=k)
+
+    # Vendedores distintos: pares (modelo, vendedor) únicos
+    seller_count = max(len(columns.sellers), 1)
+    pairs = np.sort(columns.model * seller_count + columns.seller)
+    if pairs.size:
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    distinct_sellers = np.bincount(pairs // seller_count, minlength=k)
+
+    # Preços ordenados por (modelo, preço): cada modelo vira uma fatia contígua.
+    # Duas ordenações (preço, depois modelo estável) são mais rápidas que lexsort
+    valid = columns.price > 0
+    models, prices = columns.model[valid], columns.price[valid]
+    order = np.argsort(prices)
+    order = order[np.argsort(models[order], kind="stable")]
+    models, prices = models[order], prices[order]
+    price_counts = np.bincount(models, minlength=k)
+    starts = np.searchsorted(models, np.arange(k))
+    price_sums = np.bincount(models, weights=prices, minlength=k)
+
+    has_prices = price_counts > 0
+    safe_counts = np.maximum(price_counts, 1)
+    safe_starts = np.minimum(starts, max(prices.size - 1, 0))
+    percentiles = {}
+    if prices.size:
+        for q in (25, 50, 75):
+            percentiles[q] = _grouped_percentiles(prices, safe_starts, safe_counts, q)
+
+    breakdown = []
+    for i in np.argsort(-totals, kind="stable"):
+        entry = {
+            "modelo": columns.models[i],
+            "total": int(totals[i]),
+            "vendedores": int(distinct_sellers[i]),
+            "avaliacao_media": _round(rating_sums[i] / rated_counts[i], 1) if rated_counts[i] else None,
+            "precos": None
+        }
+        for flag, name in FLAGS.items():
+            entry[name] = int(flag_counts[flag][i])
+        if has_prices[i]:
+            entry["precos"] = {
+                "quantidade": int(price_counts[i]),
+                "min": _round(prices[starts[i]]),
+                "max": _round(prices[starts[i] + price_counts[i] - 1]),
+                "media": _round(price_sums[i] / price_counts[i]),
+                "p25": _round(percentiles[25][i]),
+                "mediana": _round(percentiles[50][i]),
+                "p75": _round(percentiles[75][i])
+            }
+        breakdown.append(entry)
+    return breakdown
+
+
+def analyze_search_results(records: List[Dict[str, Any]], bins: int = 20, top: int = 5) -> Dict[str, Any]:
+    """
+    Estatísticas de um conjunto de produtos. Mantém as chaves da avaliação
+    original (total_produtos, faixa_precos, vendedores, top_vendedores, ...)
+    e acrescenta percentis, histograma de preços e o detalhamento por modelo.
+    """
+    columns = ResultColumns(records)
+
+    seller_counts = np.bincount(columns.seller, minlength=len(columns.sellers))
+    model_counts = np.bincount(columns.model, minlength=len(columns.models))
+    rated = columns.rating[columns.rating > 0]
+
+    stats: Dict[str, Any] = {
+        "total_produtos": columns.size,
+        "termos_busca": columns.terms,
+        "faixa_precos": price_summary(columns.price[columns.price > 0], bins),
+        "vendedores": _top(seller_counts, columns.sellers),
+        "modelos_cartucho": _top(model_counts, columns.models),
+        "avaliacoes": {
+            "media": _round(rated.mean(), 1) if rated.size else 0,
+            "produtos_avaliados": int(rated.size)
+        }
+    }
+    for flag, name in FLAGS.items():
+        stats[name] = int(np.count_nonzero(columns.flags[flag]))
+
+    stats["top_vendedores"] = _top(seller_counts, columns.sellers, top)
+    stats["top_modelos_cartucho"] = _top(model_counts, columns.models, top)
+    stats["por_modelo"] = model_breakdown(columns)
+    return stats
+
+
+def evaluate_result_files(paths: List[str], bins: int = 20, top: int = 5) -> Dict[str, Any]:
+    """Analisa vários arquivos de resultados como um único conjunto"""
+    if not paths:
+        return {"erro": "Nenhum resultado de busca encontrado"}
+
+    records = load_result_files(paths)
+    if not records:
+        return {"erro": "Nenhum resultado disponível para análise"}
+
+    stats = analyze_search_results(records, bins=bins, top=top)
+    timestamps = [result_file_timestamp(path) for path in paths]
+    stats["arquivos"] = {
+        "quantidade": len(paths),
+        "primeiro": min(timestamps).isoformat(),
+        "ultimo": max(timestamps).isoformat()
+    }
+    return stats
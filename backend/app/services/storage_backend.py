@@ -0,0 +1,510 @@
+"""
+Backends de armazenamento das consultas de analytics.
+
+O backend padrão é o Elasticsearch. Para instalações pequenas e para a CI há um
+backend colunar embutido no processo (DuckDB, ou SQLite quando o DuckDB não
+estiver instalado), que não exige cluster nem JVM. Os dois expõem os mesmos
+métodos e devolvem os dados no mesmo formato: o backend colunar monta respostas
+com a estrutura das agregações do Elasticsearch e reutiliza os conversores de
+app.services.analytics_queries.
+
+O backend é escolhido por STORAGE_BACKEND ("elasticsearch", "duckdb" ou "sqlite").
+"""
+
+import re
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+from app.core.config import settings
+from app.core.time_windows import period_start_iso, period_start_day
+from app.services import analytics_queries as queries
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ("elasticsearch", "duckdb", "sqlite")
+
+# Vendedores por página ao percorrer todos eles para o ranking do widget
+SELLER_STATS_PAGE_SIZE = 1000
+
+
+class StorageBackend(ABC):
+    """Interface comum dos backends de analytics"""
+
+    name = ""
+
+    @abstractmethod
+    def index_products(self, products: List[Dict[str, Any]]) -> bool:
+        """Grava um lote de documentos de produtos rastreados"""
+
+    @abstractmethod
+    def price_distribution(self, period_days: int) -> List[Dict[str, Any]]:
+        """Quantidade de produtos por faixa de preço (PRICE_RANGES)"""
+
+    @abstractmethod
+    def price_evolution(self, product: str, period_days: int, interval: str) -> List[Dict[str, Any]]:
+        """Preço médio, mínimo e máximo por intervalo ("Nd"), a partir do resumo diário"""
+
+    @abstractmethod
+    def price_comparison(self, products: List[Dict[str, Any]], period_days: int, interval: str) -> Dict[str, Any]:
+        """
+        Séries alinhadas e dispersão de preço de vários produtos cadastrados
+        ({"id", "name", "pn", ...}) em uma única consulta (parse_price_comparison)
+        """
+
+    @abstractmethod
+    def seller_performance(self, period_days: int) -> List[Dict[str, Any]]:
+        """Vendedores com mais produtos, com avaliação e preço médios"""
+
+    @abstractmethod
+    def seller_stats(self, period_days: int, size: int,
+                     after: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Página de vendedores em ordem de nome, com contagens, percentis de preço e
+        avaliações, a partir do after_key da página anterior (parse_seller_stats)
+        """
+
+
+class ElasticsearchBackend(StorageBackend):
+    """Backend que consulta o cluster Elasticsearch"""
+
+    name = "elasticsearch"
+
+    def __init__(self, service=None):
+        self._service = service
+
+    @property
+    def service(self):
+        if self._service is None:
+            from app.services.elasticsearch_service import get_es_service
+            self._service = get_es_service()
+        return self._service
+
+    def index_products(self, products: List[Dict[str, Any]]) -> bool:
+        return self.service.bulk_index_products(products)
+
+    def price_distribution(self, period_days: int) -> List[Dict[str, Any]]:
+        from app.services.elasticsearch_service import ES_INDEX
+
+        body = queries.price_distribution_query(period_start_iso(period_days))
+        return queries.parse_price_distribution(self.service.client.search(index=ES_INDEX, body=body))
+
+    def price_evolution(self, product: str, period_days: int, interval: str) -> List[Dict[str, Any]]:
+        from app.services.elasticsearch_service import ES_ROLLUP_INDEX
+
+        body = queries.price_evolution_query(period_start_day(period_days), product, interval)
+        return queries.parse_price_evolution(self.service.client.search(index=ES_ROLLUP_INDEX, body=body))
+
+    def price_comparison(self, products: List[Dict[str, Any]], period_days: int, interval: str) -> Dict[str, Any]:
+        from app.services.elasticsearch_service import ES_ROLLUP_INDEX
+
+        body = queries.price_comparison_query(period_start_day(period_days), datetime.now().date().isoformat(),
+                                              products, interval)
+        return queries.parse_price_comparison(self.service.client.search(index=ES_ROLLUP_INDEX, body=body), products)
+
+    def seller_performance(self, period_days: int) -> List[Dict[str, Any]]:
+        return self.rank_sellers(period_days, self.seller_stats(period_days, SELLER_STATS_PAGE_SIZE))
+
+    def rank_sellers(self, period_days: int, page: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Ranking exato a partir da primeira página de seller_stats (já consultada,
+        por exemplo no _msearch do bundle): percorre as páginas seguintes, sem
+        terms de size fixo
+        """
+        sellers = list(page["sellers"])
+        while page["next_cursor"]:
+            page = self.seller_stats(period_days, SELLER_STATS_PAGE_SIZE, queries.decode_cursor(page["next_cursor"]))
+            sellers.extend(page["sellers"])
+        return queries.rank_seller_performance(sellers)
+
+    def seller_stats(self, period_days: int, size: int,
+                     after: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        from app.services.elasticsearch_service import ES_INDEX
+
+        body = queries.seller_stats_query(period_start_iso(period_days), size, after)
+        return queries.parse_seller_stats(self.service.client.search(index=ES_INDEX, body=body), size)
+
+
+# Tabela única com um registro por documento ingerido; os campos em português
+# dos documentos antigos (preco, vendedor, ...) são normalizados na gravação
+SNAPSHOTS_DDL = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    doc_id VARCHAR,
+    timestamp VARCHAR,
+    day VARCHAR,
+    title VARCHAR,
+    title_lower VARCHAR,
+    price DOUBLE,
+    seller VARCHAR,
+    rating DOUBLE,
+    search_term VARCHAR,
+    product_db_id BIGINT,
+    free_shipping BOOLEAN,
+    listing_id VARCHAR
+)
+"""
+
+SNAPSHOT_COLUMNS = ("doc_id", "timestamp", "day", "title", "title_lower", "price", "seller",
+                    "rating", "search_term", "product_db_id", "free_shipping", "listing_id")
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _day_epoch_ms(day: str) -> int:
+    """Meia-noite UTC do dia em milissegundos, como o Elasticsearch indexa campos date"""
+    return int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _interval_ms(interval: str) -> int:
+    match = re.fullmatch(r"(\d+)d", interval)
+    if not match:
+        raise ValueError(f"Intervalo não suportado: {interval}")
+    return int(match.group(1)) * 86400000
+
+
+def _percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """Percentil com interpolação linear sobre valores já ordenados"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class ColumnarBackend(StorageBackend):
+    """
+    Backend embutido sobre DuckDB (armazenamento colunar) ou SQLite.
+    As consultas usam apenas SQL comum aos dois bancos.
+    """
+
+    def __init__(self, engine: str, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.name, self._conn = self._connect(engine, path)
+        self._conn.execute(SNAPSHOTS_DDL)
+        self._add_missing_columns()
+        if self.name == "sqlite":
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON snapshots (timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_day ON snapshots (day)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_doc_id ON snapshots (doc_id)")
+        self._commit()
+        logger.info(f"Backend de analytics {self.name} inicializado em {path}")
+
+    def _connect(self, engine: str, path: str):
+        """Retorna (motor efetivo, conexão); sem o pacote duckdb, usa o SQLite da biblioteca padrão"""
+        if engine == "duckdb":
+            try:
+                import duckdb
+                return "duckdb", duckdb.connect(path)
+            except ImportError:
+                logger.warning("Pacote duckdb não instalado (pip install duckdb); usando SQLite no backend de analytics")
+
+        import sqlite3
+        return "sqlite", sqlite3.connect(path, check_same_thread=False)
+
+    def _add_missing_columns(self) -> None:
+        """Colunas criadas depois da primeira versão da tabela (ficam nulas nos registros antigos)"""
+        try:
+            self._conn.execute("SELECT listing_id FROM snapshots LIMIT 0")
+        except Exception:
+            self._conn.execute("ALTER TABLE snapshots ADD COLUMN listing_id VARCHAR")
+
+    def _commit(self) -> None:
+        # O DuckDB confirma cada comando automaticamente fora de transações explícitas
+        if self.name == "sqlite":
+            self._conn.commit()
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _snapshot_row(self, product: Dict[str, Any]) -> Optional[tuple]:
+        from app.services.elasticsearch_service import _first_value, _parse_timestamp, snapshot_id, listing_key
+
+        timestamp = _parse_timestamp(product.get("timestamp")) or datetime.now()
+        timestamp = timestamp.replace(tzinfo=None)
+        title = _first_value(product, "title", "titulo", default="")
+        seller = _first_value(product, "seller", "vendedor")
+
+        return (
+            snapshot_id(product),
+            timestamp.isoformat(timespec="seconds"),
+            timestamp.date().isoformat(),
+            str(title),
+            str(title).lower(),
+            _to_float(_first_value(product, "price", "preco")),
+            str(seller) if seller is not None else None,
+            _to_float(_first_value(product, "rating", "avaliacao")),
+            _first_value(product, "search_term", "busca"),
+            _to_int(product.get("product_db_id")),
+            bool(product.get("free_shipping")) if product.get("free_shipping") is not None else None,
+            product.get("listing_id") or listing_key(product)
+        )
+
+    def index_products(self, products: List[Dict[str, Any]]) -> bool:
+        try:
+            rows = [self._snapshot_row(product) for product in products]
+            if not rows:
+                return False
+
+            # Mesma semântica de upsert do Elasticsearch: o último snapshot de cada ID prevalece
+            rows = list({row[0]: row for row in rows}.values())
+            placeholders = ", ".join("?" for _ in SNAPSHOT_COLUMNS)
+            with self._lock:
+                self._conn.executemany("DELETE FROM snapshots WHERE doc_id = ?", [(row[0],) for row in rows])
+                self._conn.executemany(
+                    f"INSERT INTO snapshots ({', '.join(SNAPSHOT_COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+                self._commit()
+
+            logger.info(f"Inseridos {len(rows)} produtos no backend {self.name}")
+
+            from app.services.query_cache import query_cache
+            query_cache.bump_generation()
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar produtos no backend {self.name}: {e}")
+            return False
+
+    def price_distribution(self, period_days: int) -> List[Dict[str, Any]]:
+        cases = []
+        params: List[Any] = []
+        for i, price_range in enumerate(queries.PRICE_RANGES):
+            conditions = []
+            if "from" in price_range:
+                conditions.append("price >= ?")
+                params.append(price_range["from"])
+            if "to" in price_range:
+                conditions.append("price < ?")
+                params.append(price_range["to"])
+            cases.append(f"SUM(CASE WHEN {' AND '.join(conditions)} THEN 1 ELSE 0 END) AS r{i}")
+        params.append(period_start_iso(period_days))
+
+        row = self._query(
+            f"SELECT {', '.join(cases)} FROM snapshots WHERE price IS NOT NULL AND timestamp >= ?",
+            tuple(params)
+        )[0]
+
+        buckets = []
+        for price_range, count in zip(queries.PRICE_RANGES, row):
+            bucket = {"doc_count": count or 0}
+            low = float(price_range["from"]) if "from" in price_range else None
+            high = float(price_range["to"]) if "to" in price_range else None
+            if low is not None:
+                bucket["from"] = low
+            if high is not None:
+                bucket["to"] = high
+            bucket["key"] = f"{low if low is not None else '*'}-{high if high is not None else '*'}"
+            buckets.append(bucket)
+
+        return queries.parse_price_distribution({"aggregations": {"price_ranges": {"buckets": buckets}}})
+
+    def price_evolution(self, product: str, period_days: int, interval: str) -> List[Dict[str, Any]]:
+        sql = ("SELECT day, SUM(price), COUNT(price), MIN(price), MAX(price) FROM snapshots "
+               "WHERE price > 0 AND day >= ?")
+        params: List[Any] = [period_start_day(period_days)]
+
+        # Aproximação do "match" do Elasticsearch: basta um dos termos aparecer no título
+        if product.lower() != "all":
+            terms = [term for term in re.split(r"\W+", product.lower()) if term]
+            if terms:
+                sql += " AND (" + " OR ".join("title_lower LIKE ?" for _ in terms) + ")"
+                params.extend(f"%{term}%" for term in terms)
+        sql += " GROUP BY day"
+
+        # Agrupa os dias em intervalos fixos alinhados à época, como o fixed_interval
+        step = _interval_ms(interval)
+        buckets: Dict[int, Dict[str, Any]] = {}
+        for day, sum_price, count, min_price, max_price in self._query(sql, tuple(params)):
+            key = _day_epoch_ms(day) // step * step
+            bucket = buckets.setdefault(key, {
+                "key": key, "doc_count": 0,
+                "sum_price": {"value": 0.0}, "sample_count": {"value": 0},
+                "min_price": {"value": None}, "max_price": {"value": None}
+            })
+            bucket["doc_count"] += 1
+            bucket["sum_price"]["value"] += sum_price
+            bucket["sample_count"]["value"] += count
+            current_min = bucket["min_price"]["value"]
+            current_max = bucket["max_price"]["value"]
+            bucket["min_price"]["value"] = min_price if current_min is None else min(current_min, min_price)
+            bucket["max_price"]["value"] = max_price if current_max is None else max(current_max, max_price)
+
+        ordered = [buckets[key] for key in sorted(buckets)]
+        return queries.parse_price_evolution({"aggregations": {"price_over_time": {"buckets": ordered}}})
+
+    def price_comparison(self, products: List[Dict[str, Any]], period_days: int, interval: str) -> Dict[str, Any]:
+        product_ids = [product["id"] for product in products]
+        start_day = period_start_day(period_days)
+
+        # Mesma resolução do Elasticsearch (comparison_product_filter): product_db_id,
+        # ou o termo de busca do produto para snapshots gravados sem o ID
+        cases, case_params = [], []
+        for product in products:
+            cases.append("WHEN product_db_id = ? THEN ?")
+            case_params += [product["id"], product["id"]]
+            if product.get("search_terms"):
+                cases.append("WHEN product_db_id IS NULL AND LOWER(TRIM(search_term)) = ? THEN ?")
+                case_params += [product["search_terms"].strip().lower(), product["id"]]
+        resolved = f"CASE {' '.join(cases)} END"
+        source = (f"(SELECT {resolved} AS product_id, day, price, seller FROM snapshots "
+                  f"WHERE price > 0 AND day >= ?) AS resolved")
+        params = (*case_params, start_day)
+
+        # Uma consulta para todos os produtos; vendedores distintos em outra, sobre o mesmo filtro
+        rows = self._query(
+            f"SELECT product_id, day, SUM(price), COUNT(price), MIN(price), MAX(price) FROM {source} "
+            f"WHERE product_id IS NOT NULL GROUP BY product_id, day", params
+        )
+        sellers = dict(self._query(
+            f"SELECT product_id, COUNT(DISTINCT seller) FROM {source} "
+            f"WHERE product_id IS NOT NULL GROUP BY product_id", params
+        ))
+
+        # Mesmo formato do filters + date_histogram do Elasticsearch, com limites fixos
+        step = _interval_ms(interval)
+        first = _day_epoch_ms(start_day) // step * step
+        last = _day_epoch_ms(datetime.now().date().isoformat()) // step * step
+
+        def empty(key=None):
+            bucket = {"doc_count": 0, "sum_price": {"value": 0.0}, "sample_count": {"value": 0},
+                      "min_price": {"value": None}, "max_price": {"value": None}}
+            if key is not None:
+                bucket["key"] = key
+            return bucket
+
+        def merge(bucket, sum_price, count, min_price, max_price):
+            bucket["doc_count"] += 1
+            bucket["sum_price"]["value"] += sum_price
+            bucket["sample_count"]["value"] += count
+            current_min, current_max = bucket["min_price"]["value"], bucket["max_price"]["value"]
+            bucket["min_price"]["value"] = min_price if current_min is None else min(current_min, min_price)
+            bucket["max_price"]["value"] = max_price if current_max is None else max(current_max, max_price)
+
+        buckets = {}
+        for product_id in product_ids:
+            bucket = empty()
+            bucket["sellers"] = {"value": sellers.get(product_id, 0)}
+            bucket["points"] = {key: empty(key) for key in range(first, last + step, step)}
+            buckets[str(product_id)] = bucket
+
+        for product_id, day, sum_price, count, min_price, max_price in rows:
+            bucket = buckets[str(product_id)]
+            key = _day_epoch_ms(day) // step * step
+            merge(bucket["points"].setdefault(key, empty(key)), sum_price, count, min_price, max_price)
+            merge(bucket, sum_price, count, min_price, max_price)
+
+        for bucket in buckets.values():
+            points = bucket.pop("points")
+            bucket["price_over_time"] = {"buckets": [points[key] for key in sorted(points)]}
+        return queries.parse_price_comparison({"aggregations": {"products": {"buckets": buckets}}}, products)
+
+    def seller_performance(self, period_days: int) -> List[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT seller, COUNT(*) AS doc_count, AVG(rating), AVG(price) FROM snapshots "
+            "WHERE seller IS NOT NULL AND timestamp >= ? "
+            "GROUP BY seller ORDER BY doc_count DESC, seller ASC LIMIT 10",
+            (period_start_iso(period_days),)
+        )
+        buckets = [
+            {
+                "key": seller,
+                "doc_count": doc_count,
+                "avg_rating": {"value": avg_rating},
+                "avg_price": {"value": avg_price}
+            }
+            for seller, doc_count, avg_rating, avg_price in rows
+        ]
+        return queries.parse_seller_performance({"aggregations": {"sellers": {"buckets": buckets}}})
+
+    def seller_stats(self, period_days: int, size: int,
+                     after: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Paginação por chave (seller > último da página anterior), como a composite aggregation
+        start = period_start_iso(period_days)
+        sql = ("SELECT seller, COUNT(*), COUNT(DISTINCT listing_id), MIN(price), MAX(price), AVG(price), "
+               "MIN(rating), MAX(rating), AVG(rating), COUNT(rating) FROM snapshots "
+               "WHERE seller IS NOT NULL AND timestamp >= ?")
+        params: List[Any] = [start]
+        if after:
+            sql += " AND seller > ?"
+            params.append(after["seller"])
+        sql += " GROUP BY seller ORDER BY seller LIMIT ?"
+        params.append(size)
+        rows = self._query(sql, tuple(params))
+
+        prices: Dict[str, List[float]] = {}
+        if rows:
+            placeholders = ", ".join("?" for _ in rows)
+            for seller, price in self._query(
+                f"SELECT seller, price FROM snapshots WHERE price IS NOT NULL AND timestamp >= ? "
+                f"AND seller IN ({placeholders}) ORDER BY seller, price",
+                (start, *(row[0] for row in rows))
+            ):
+                prices.setdefault(seller, []).append(price)
+
+        buckets = []
+        for (seller, doc_count, listings, min_price, max_price, avg_price,
+             min_rating, max_rating, avg_rating, rating_count) in rows:
+            seller_prices = prices.get(seller, [])
+            buckets.append({
+                "key": {"seller": seller},
+                "doc_count": doc_count,
+                "listings": {"value": listings},
+                "price_stats": {"min": min_price, "max": max_price, "avg": avg_price},
+                "price_percentiles": {"values": {
+                    f"{float(percent)}": _percentile(seller_prices, percent)
+                    for percent in queries.SELLER_PRICE_PERCENTILES
+                }},
+                "rating_stats": {"min": min_rating, "max": max_rating, "avg": avg_rating, "count": rating_count}
+            })
+
+        aggregation: Dict[str, Any] = {"buckets": buckets}
+        if buckets:
+            aggregation["after_key"] = buckets[-1]["key"]
+        return queries.parse_seller_stats({"aggregations": {"sellers": aggregation}}, size)
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_storage_backend(name: Optional[str] = None, es_service=None) -> StorageBackend:
+    """Cria o backend indicado (padrão: STORAGE_BACKEND)"""
+    name = (name or settings.STORAGE_BACKEND).lower()
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Backend de armazenamento inválido: {name}")
+
+    if name == "elasticsearch":
+        return ElasticsearchBackend(es_service)
+    return ColumnarBackend(name, settings.COLUMNAR_STORAGE_PATH)
+
+
+def get_storage_backend(es_service=None) -> StorageBackend:
+    """
+    Backend compartilhado pelo processo. O serviço Elasticsearch já criado pela
+    rota pode ser repassado para evitar uma segunda conexão.
+    """
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_storage_backend(es_service=es_service)
+        elif es_service is not None and isinstance(_backend, ElasticsearchBackend) and _backend._service is None:
+            _backend._service = es_service
+        return _backend
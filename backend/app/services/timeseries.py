@@ -0,0 +1,101 @@
+"""
+Utilitários para séries temporais de preço.
+Escolhe o intervalo de agregação conforme a resolução pedida e reduz o número
+de pontos com o algoritmo Largest-Triangle-Three-Buckets (LTTB), que preserva
+picos e vales da curva ao contrário de uma simples média por janela.
+"""
+
+import math
+from typing import Dict, List, Any
+
+import numpy as np
+
+# Limites aceitos para o parâmetro de resolução dos endpoints
+DEFAULT_RESOLUTION = 200
+MIN_RESOLUTION = 10
+MAX_RESOLUTION = 2000
+
+
+def choose_interval(period_days: int, resolution: int = DEFAULT_RESOLUTION) -> str:
+    """
+    Retorna o intervalo fixo (em dias) do date_histogram para que o período
+    gere no máximo `resolution` buckets. O resumo de preços é diário, então
+    o menor intervalo possível é 1 dia.
+
+    Args:
+        period_days: Período analisado em dias
+        resolution: Número máximo de pontos desejado
+
+    Returns:
+        str: Intervalo no formato do Elasticsearch (ex.: "1d", "7d")
+    """
+    days_per_bucket = max(1, math.ceil(period_days / max(resolution, 1)))
+    return f"{days_per_bucket}d"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Seleciona os índices dos pontos mantidos pelo LTTB.
+
+    Args:
+        x: Eixo X em ordem crescente (ex.: timestamps em ms)
+        y: Valores da série
+        threshold: Número de pontos desejado
+
+    Returns:
+        np.ndarray: Índices selecionados, em ordem crescente
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Tamanho de cada bucket, descontando o primeiro e o último ponto
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Média do próximo bucket, usada como terceiro vértice do triângulo
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # Bucket atual: escolhe o ponto que forma o maior triângulo
+        range_start = int(math.floor(i * every)) + 1
+        range_end = int(math.floor((i + 1) * every)) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (y[range_start:range_end] - y[a])
+            - (x[a] - x[range_start:range_end]) * (avg_y - y[a])
+        )
+        a = range_start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_points(points: List[Dict[str, Any]], resolution: int,
+                      x_key: str, y_key: str) -> List[Dict[str, Any]]:
+    """
+    Reduz uma lista de pontos (dicionários já ordenados por `x_key`) para no
+    máximo `resolution` itens preservando a forma da curva de `y_key`.
+
+    Args:
+        points: Pontos da série, ordenados pelo eixo X
+        resolution: Número máximo de pontos
+        x_key: Campo com o eixo X (timestamp em ms ou número)
+        y_key: Campo com o valor da série
+
+    Returns:
+        Lista de pontos reduzida
+    """
+    if len(points) <= resolution:
+        return points
+
+    x = np.array([float(p[x_key]) for p in points], dtype=np.float64)
+    y = np.array([float(p[y_key] or 0) for p in points], dtype=np.float64)
+
+    return [points[i] for i in lttb_indices(x, y, resolution)]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+Script para calcular os campos derivados (availability_status, stock_bucket,
+price_band, category e product_key) dos snapshots indexados antes de eles
+serem gravados na ingestão. Só os documentos cujo valor mudou são atualizados,
+então o script pode ser executado novamente após mudanças nas regras de
+classificação. O top produtos agrupa por product_key e ignora snapshots sem o
+campo: execute o script após atualizar um índice antigo (a API avisa no log
+de inicialização enquanto houver snapshots sem product_key).
+
+Uso:
+    python scripts/backfill_derived_fields.py --lote 1000
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.elasticsearch_service import ElasticsearchService
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula os campos derivados dos snapshots existentes")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos por página e por requisição bulk")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("CAMPOS DERIVADOS DOS SNAPSHOTS")
+    print("=" * 80)
+
+    service = ElasticsearchService()
+    stats = service.backfill_derived_fields(chunk_size=args.lote)
+
+    print(f"\n{'Documentos lidos':<30}{stats['lidos']:>12}")
+    print(f"{'Atualizados':<30}{stats['atualizados']:>12}")
+    print(f"{'Erros':<30}{stats['erros']:>12}")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Script para carregar no Elasticsearch (ou no backend de STORAGE_BACKEND) as
+saídas antigas dos rastreadores: resultados*.csv, busca_*.csv e os
+resultados listados no manifesto de scrapers/resultados (inclusive os já
+compactados nos zips mensais).
+
+A carga pode ser interrompida e retomada: o progresso fica no arquivo de
+checkpoint e os documentos já enviados não são duplicados.
+
+Uso:
+    python scripts/backfill_scrape_outputs.py
+    python scripts/backfill_scrape_outputs.py "dados/**/*.csv" --lote 5000 --workers 8
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.scrape_backfill import discover_files, run_backfill
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga histórica das saídas dos rastreadores")
+    parser.add_argument("caminhos", nargs="*", help="Arquivos ou padrões glob (padrão: saídas conhecidas)")
+    parser.add_argument("--lote", type=int, default=2000, help="Documentos por requisição bulk")
+    parser.add_argument("--workers", type=int, default=4, help="Requisições bulk simultâneas")
+    parser.add_argument("--checkpoint", default="data/backfill_checkpoint.json",
+                        help="Arquivo de checkpoint para retomar a carga")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint existente")
+    parser.add_argument("--alertas", action="store_true",
+                        help="Avaliar os alertas de preço com os dados carregados")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("CARGA HISTÓRICA DAS SAÍDAS DOS RASTREADORES")
+    print("=" * 80)
+
+    if args.reiniciar and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    files = discover_files(args.caminhos or None)
+    print(f"\n{len(files)} arquivos encontrados")
+
+    report = run_backfill(files, args.checkpoint, chunk_size=args.lote, workers=args.workers,
+                          evaluate_alerts=args.alertas)
+
+    print("\n" + "=" * 80)
+    print("RELATÓRIO")
+    print("=" * 80)
+    for key, value in report.items():
+        print(f"{key:<25}{value:>15}")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Script para medir o custo de serialização e o tamanho transferido das
+respostas mais pesadas da API (/api/logs, /api/analytics/price-evolution e
+/api/dashboard/bundle): tempo do jsonable_encoder, do json padrão (JSONResponse)
+e do orjson (FastJSONResponse), e bytes sem compressão, com gzip e com brotli.
+
+Os payloads são montados com os dados reais (banco e Elasticsearch); com
+--sintetico, ou se a fonte estiver indisponível, são gerados dados de tamanho
+equivalente.
+
+Uso:
+    python scripts/benchmark_serialization.py --repeticoes 50 --dias 90
+    python scripts/benchmark_serialization.py --sintetico
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import inspect
+import argparse
+import logging
+import statistics
+from datetime import datetime, timedelta
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import settings
+from app.core.responses import orjson
+from app.services.timeseries import MAX_RESOLUTION
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_logs(limit):
+    """Uma página de /api/logs, como o response_model LogsPagination a entrega"""
+    from app.db.session import SessionLocal
+    from app.models.system_log import SystemLog
+    from app.models import user, product, seller, settings as settings_model  # noqa: F401 (mappers)
+    from app.schemas.system_log import LogResponse
+
+    db = SessionLocal()
+    try:
+        rows = db.query(SystemLog).order_by(SystemLog.timestamp.desc()).limit(limit).all()
+        total = db.query(SystemLog).count()
+    finally:
+        db.close()
+    if not rows:
+        raise ValueError("nenhum log no banco")
+    items = [LogResponse.model_validate(row, from_attributes=True) for row in rows]
+    return {"items": items, "total": total, "page": 1, "size": limit, "pages": -(-total // limit)}
+
+
+def load_route(module_name, function_name, **params):
+    """Executa a função original de uma rota (sem cache e sem snapshot)"""
+    import importlib
+
+    module = importlib.import_module(f"app.routers.{module_name}")
+    func = inspect.unwrap(getattr(module, function_name))
+    return asyncio.run(func(**params))
+
+
+def synthetic_logs(limit):
+    from app.models.system_log import LogLevel, LogCategory
+
+    now = datetime.now()
+    items = [
+        {
+            "id": i,
+            "timestamp": now - timedelta(minutes=i),
+            "level": LogLevel.LOW,
+            "category": LogCategory.SYSTEM,
+            "action": "logs_access",
+            "description": f"Usuário consultou logs do sistema com filtros: start_date=None end_date=None level=None {i}",
+            "ip_address": "172.21.101.185",
+            "user_id": 1,
+            "user_email": "admin@example.com"
+        }
+        for i in range(limit)
+    ]
+    return {"items": items, "total": limit * 50, "page": 1, "size": limit, "pages": 50}
+
+
+def synthetic_price_evolution(points):
+    start = datetime.now() - timedelta(days=90)
+    return {
+        "success": True,
+        "data": [
+            {
+                "timestamp": (start + timedelta(hours=i * 3)).isoformat(),
+                "avgPrice": 150.0 + (i % 37) * 1.37,
+                "minPrice": 120.0 + (i % 11),
+                "maxPrice": 199.9 - (i % 13),
+                "count": 40 + i % 17
+            }
+            for i in range(points)
+        ],
+        "message": f"Evolução de preço com {points} pontos"
+    }
+
+
+def measure(fn, repetitions):
+    """Mediana do tempo de fn em milissegundos"""
+    samples = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def benchmark(name, payload, repetitions):
+    encoded = jsonable_encoder(payload)
+    body = json.dumps(encoded, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    result = {
+        "nome": name,
+        "encoder_ms": measure(lambda: jsonable_encoder(payload), repetitions),
+        "json_ms": measure(lambda: json.dumps(encoded, ensure_ascii=False, allow_nan=False,
+                                              separators=(",", ":")).encode("utf-8"), repetitions),
+        "orjson_ms": None,
+        "bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL)),
+        "gzip_ms": measure(lambda: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL), repetitions),
+        "br_bytes": None,
+        "br_ms": None
+    }
+    if orjson is not None:
+        result["orjson_ms"] = measure(
+            lambda: orjson.dumps(encoded, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY), repetitions
+        )
+    if brotli is not None:
+        result["br_bytes"] = len(brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY))
+        result["br_ms"] = measure(lambda: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY), repetitions)
+    return result
+
+
+def fmt(value, suffix=""):
+    if value is None:
+        return "-"
+    return f"{value:.2f}{suffix}" if isinstance(value, float) else f"{value}{suffix}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede serialização e compressão das respostas pesadas da API")
+    parser.add_argument("--repeticoes", type=int, default=50, help="Execuções de cada medição")
+    parser.add_argument("--dias", type=int, default=90, help="Período das consultas de analytics")
+    parser.add_argument("--logs", type=int, default=100, help="Logs por página")
+    parser.add_argument("--sintetico", action="store_true", help="Usar dados gerados em vez do banco/Elasticsearch")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("BENCHMARK DE SERIALIZAÇÃO E COMPRESSÃO DAS RESPOSTAS")
+    print("=" * 80)
+    if orjson is None:
+        print("orjson não instalado: a API usa o json padrão")
+    if brotli is None:
+        print("brotli não instalado: a API comprime apenas com gzip")
+
+    sources = [
+        ("/api/logs",
+         lambda: load_logs(args.logs),
+         lambda: synthetic_logs(args.logs)),
+        ("/api/analytics/price-evolution",
+         lambda: load_route("analytics", "get_price_evolution", product="all",
+                            period_days=args.dias, resolution=MAX_RESOLUTION),
+         lambda: synthetic_price_evolution(MAX_RESOLUTION)),
+        ("/api/dashboard/bundle",
+         lambda: load_route("dashboard", "get_dashboard_bundle", size=10,
+                            period_days=args.dias, resolution=MAX_RESOLUTION),
+         lambda: {"success": True, "data": {"priceHistory": synthetic_price_evolution(MAX_RESOLUTION)["data"]},
+                  "errors": {}}),
+    ]
+
+    results = []
+    for name, load, synthetic in sources:
+        payload = None
+        if not args.sintetico:
+            try:
+                payload = load()
+            except Exception as e:
+                logger.warning(f"{name}: dados reais indisponíveis ({e}); usando dados sintéticos")
+        if payload is None:
+            payload = synthetic()
+        results.append(benchmark(name, payload, args.repeticoes))
+
+    print(f"\n{'Endpoint':<34}{'encoder':>9}{'json':>9}{'orjson':>9}{'bytes':>10}{'gzip':>9}{'br':>9}{'gzip ms':>9}{'br ms':>8}")
+    for r in results:
+        print(
+            f"{r['nome']:<34}{fmt(r['encoder_ms']):>9}{fmt(r['json_ms']):>9}{fmt(r['orjson_ms']):>9}"
+            f"{r['bytes']:>10}{fmt(r['gzip_bytes']):>9}{fmt(r['br_bytes']):>9}{fmt(r['gzip_ms']):>9}{fmt(r['br_ms']):>8}"
+        )
+    print("\nTempos em ms (mediana); bytes transferidos sem compressão, com gzip e com brotli")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Script para manter o manifesto dos resultados dos rastreadores
+(app/scrapers/resultados/manifest.jsonl): recria o manifesto a partir dos
+arquivos do diretório e compacta os JSON mais antigos em zips mensais.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.results_archive import results_archive
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recria o manifesto e compacta os resultados antigos")
+    parser.add_argument("--recriar", action="store_true", help="Recriar o manifesto a partir do diretório")
+    parser.add_argument("--dias", type=float, default=settings.RESULTS_COMPACT_AFTER_DAYS,
+                        help="Compactar arquivos com mais de N dias (0 compacta todos)")
+    parser.add_argument("--sem-compactar", action="store_true", help="Apenas recriar/listar o manifesto")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("MANIFESTO E COMPACTAÇÃO DOS RESULTADOS DE BUSCA")
+    print("=" * 80)
+
+    if args.recriar:
+        total = results_archive.rebuild()
+        print(f"\n✅ Manifesto recriado com {total} arquivos")
+
+    if not args.sem_compactar:
+        summary = results_archive.compact(older_than_days=args.dias)
+        print(f"\n✅ {summary['arquivados']} arquivos compactados em {', '.join(summary['zips']) or 'nenhum zip'}")
+        print(f"   {summary['bytes_liberados']} bytes de JSON removidos")
+        if summary["removidos_do_manifesto"]:
+            print(f"   {summary['removidos_do_manifesto']} entradas sem arquivo removidas do manifesto")
+
+    entries = results_archive.query()
+    archived = sum(1 for entry in entries if entry.get("archive"))
+    print(f"\nManifesto: {len(entries)} arquivos ({archived} compactados, {len(entries) - archived} avulsos)")
+    latest = results_archive.latest()
+    if latest:
+        print(f"Mais recente: {latest['file']} ({latest['count']} produtos, termos: {', '.join(latest['terms'])})")
@@ -11,6 +11,8 @@ from app.db.init_db import init_db
 # Import all models to ensure they're registered with the Base metadata
 from app.models.product import Product
 from app.models.user import User
+from app.models.price_history import PriceHistory
+from app.models.price_cube import PriceCube
 # Import any other model files here
 
 def create_tables():
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Script para migrar os snapshots já indexados para IDs determinísticos e remover
+duplicatas criadas por reenvios e execuções repetidas dos rastreadores.
+Em seguida o resumo diário e as estatísticas de preço são reconstruídos sem
+as duplicatas.
+
+Uso:
+    python scripts/dedupe_snapshots.py --simular
+    python scripts/dedupe_snapshots.py
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.elasticsearch_service import ElasticsearchService, ES_INDEX
+from app.services.query_cache import query_cache
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplica os snapshots do índice de produtos")
+    parser.add_argument("--simular", action="store_true", help="Apenas conta, sem alterar o índice")
+    parser.add_argument("--lote", type=int, default=1000, help="Ações por requisição bulk")
+    parser.add_argument("--sem-resumo", action="store_true", help="Não reconstruir o resumo diário e as estatísticas")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("DEDUPLICAÇÃO DE SNAPSHOTS")
+    print("=" * 80)
+
+    service = ElasticsearchService()
+    size_before = service.client.count(index=ES_INDEX)["count"]
+    stats = service.deduplicate_snapshots(dry_run=args.simular, chunk_size=args.lote)
+
+    print(f"\n{'Documentos lidos':<30}{stats['lidos']:>12}")
+    print(f"{'Já com ID determinístico':<30}{stats['corretos']:>12}")
+    print(f"{'Migrados':<30}{stats['migrados']:>12}")
+    print(f"{'Duplicados removidos':<30}{stats['duplicados']:>12}")
+
+    if args.simular:
+        print("\nSimulação: nenhuma alteração foi feita")
+        sys.exit(0)
+
+    service.client.indices.refresh(index=ES_INDEX)
+    size_after = service.client.count(index=ES_INDEX)["count"]
+    print(f"{'Documentos antes/depois':<30}{size_before:>6} / {size_after}")
+
+    if not args.sem_resumo and (stats["migrados"] or stats["duplicados"]):
+        print("\nReconstruindo o resumo diário de preços...")
+        service.clear_price_rollup()
+        total = service.rebuild_price_rollup(chunk_size=args.lote)
+        print(f"✅ Resumo reconstruído a partir de {total} documentos")
+
+        print("\nReconstruindo as estatísticas de preço...")
+        service.clear_price_stats()
+        total = service.rebuild_price_stats(chunk_size=args.lote)
+        print(f"✅ Estatísticas reconstruídas a partir de {total} documentos")
+
+    query_cache.bump_generation()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Script para medir a taxa de acerto do request cache do Elasticsearch nas
+consultas de analytics, comparando o início de período calculado com
+datetime.now() (um timestamp diferente a cada requisição) com o início
+alinhado por app.core.time_windows.
+
+Com --simulado o cluster não é usado: o relógio é avançado de --intervalo-min
+em --intervalo-min minutos ao longo de --horas horas e, para cada requisição
+simulada, o corpo da consulta de cada widget é serializado. O request cache do
+Elasticsearch usa o corpo da requisição como chave, então a taxa máxima de
+acerto é 1 - (corpos distintos / requisições). O número não considera as
+invalidações causadas pelo refresh do índice após cada ingestão.
+
+Uso:
+    python scripts/measure_request_cache.py --repeticoes 20 --dias 30
+    python scripts/measure_request_cache.py --simulado --horas 24 --intervalo-min 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+from datetime import datetime, timedelta
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.elasticsearch_service import ElasticsearchService, ES_INDEX
+from app.services import analytics_queries as queries
+from app.services.storage_backend import SELLER_STATS_PAGE_SIZE
+from app.core import time_windows
+from app.core.config import settings
+from app.core.time_windows import period_start_iso
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Consultas agregadas (size=0) que o request cache pode armazenar
+WIDGETS = {
+    "price-distribution": queries.price_distribution_query,
+    "search-trends": queries.search_trends_query,
+    "daily-searches": queries.daily_searches_query,
+    "seller-performance": lambda start_date: queries.seller_stats_query(start_date, SELLER_STATS_PAGE_SIZE),
+}
+
+
+def request_cache_stats(client):
+    """Retorna (acertos, falhas) acumulados do request cache do índice"""
+    stats = client.indices.stats(index=ES_INDEX, metric="request_cache")
+    cache = stats["_all"]["total"]["request_cache"]
+    return cache["hit_count"], cache["miss_count"]
+
+
+def measure(client, start_date_fn, repetitions):
+    """Executa cada widget `repetitions` vezes e devolve a taxa de acerto"""
+    client.indices.clear_cache(index=ES_INDEX, request=True)
+    hits_before, misses_before = request_cache_stats(client)
+
+    for _ in range(repetitions):
+        for build_query in WIDGETS.values():
+            client.search(index=ES_INDEX, body=build_query(start_date_fn()), request_cache=True)
+
+    hits_after, misses_after = request_cache_stats(client)
+    hits = hits_after - hits_before
+    misses = misses_after - misses_before
+    total = hits + misses
+    return hits, misses, (hits / total * 100) if total else 0.0
+
+
+def simulate(start_date_fn, period_days, hours, interval_minutes):
+    """
+    Requisições a cada interval_minutes durante `hours` horas, com o relógio
+    simulado; devolve (requisições, corpos distintos, taxa máxima de acerto)
+    """
+    clock = datetime.now(ZoneInfo(settings.ANALYTICS_TIMEZONE))
+    clock = clock.replace(hour=0, minute=0, second=0, microsecond=0)
+    bodies = set()
+    requests = 0
+    for step in range(int(hours * 60 / interval_minutes)):
+        # Alguns milissegundos entre requisições, como em um cliente real
+        now = clock + timedelta(minutes=step * interval_minutes, milliseconds=step % 997)
+        with mock.patch.object(time_windows, "_now", lambda tz, now=now: now.astimezone(tz)):
+            for name, build_query in WIDGETS.items():
+                body = build_query(start_date_fn(now, period_days))
+                bodies.add((name, json.dumps(body, sort_keys=True)))
+                requests += 1
+    return requests, len(bodies), (1 - len(bodies) / requests) * 100 if requests else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o request cache do Elasticsearch")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Execuções de cada widget")
+    parser.add_argument("--dias", type=int, default=30, help="Período das consultas em dias")
+    parser.add_argument("--simulado", action="store_true",
+                        help="Calcular a taxa máxima de acerto sem cluster (relógio simulado)")
+    parser.add_argument("--horas", type=float, default=24, help="Duração simulada em horas")
+    parser.add_argument("--intervalo-min", type=float, default=5, help="Minutos entre requisições simuladas")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("MEDIÇÃO DO REQUEST CACHE DO ELASTICSEARCH")
+    print("=" * 80)
+
+    if args.simulado:
+        unaligned = simulate(lambda now, days: (now.replace(tzinfo=None) - timedelta(days=days)).isoformat(),
+                             args.dias, args.horas, args.intervalo_min)
+        aligned = simulate(lambda now, days: period_start_iso(days), args.dias, args.horas, args.intervalo_min)
+
+        print(f"\n{args.horas:g} h, uma requisição por widget a cada {args.intervalo_min:g} min "
+              f"(alinhamento: {settings.ANALYTICS_WINDOW_ALIGNMENT})")
+        print(f"\n{'Janela':<25}{'Requisições':>12}{'Distintas':>12}{'Taxa máx.':>12}")
+        print(f"{'datetime.now()':<25}{unaligned[0]:>12}{unaligned[1]:>12}{unaligned[2]:>11.1f}%")
+        print(f"{'alinhada':<25}{aligned[0]:>12}{aligned[1]:>12}{aligned[2]:>11.1f}%")
+        sys.exit(0)
+
+    client = ElasticsearchService().client
+
+    unaligned = measure(
+        client,
+        lambda: (datetime.now() - timedelta(days=args.dias)).isoformat(),
+        args.repeticoes
+    )
+    aligned = measure(
+        client,
+        lambda: period_start_iso(args.dias),
+        args.repeticoes
+    )
+
+    print(f"\n{'Janela':<25}{'Acertos':>10}{'Falhas':>10}{'Taxa':>10}")
+    print(f"{'datetime.now()':<25}{unaligned[0]:>10}{unaligned[1]:>10}{unaligned[2]:>9.1f}%")
+    print(f"{'alinhada':<25}{aligned[0]:>10}{aligned[1]:>10}{aligned[2]:>9.1f}%")
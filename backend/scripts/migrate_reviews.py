@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Script para mover os comentários aninhados (campo comentarios) dos snapshots
+antigos para o índice de avaliações. Os snapshots passam a guardar apenas a
+contagem em num_comentarios.
+
+Os documentos aninhados removidos só deixam de ocupar espaço após o merge dos
+segmentos; use --expurgar para forçar esse merge ao final.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.elasticsearch_service import ElasticsearchService, ES_INDEX
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move comentários aninhados para o índice de avaliações")
+    parser.add_argument("--lote", type=int, default=500, help="Comentários gravados por requisição bulk")
+    parser.add_argument("--expurgar", action="store_true", help="Executar forcemerge para expurgar documentos removidos")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("MIGRAÇÃO DE COMENTÁRIOS PARA O ÍNDICE DE AVALIAÇÕES")
+    print("=" * 80)
+
+    service = ElasticsearchService()
+    stats = service.migrate_embedded_reviews(chunk_size=args.lote)
+
+    print(f"\n{'Snapshots com comentários':<30}{stats['snapshots']:>12}")
+    print(f"{'Comentários novos gravados':<30}{stats['comentarios_novos']:>12}")
+
+    if args.expurgar:
+        print("\nExecutando forcemerge (only_expunge_deletes)...")
+        service.client.indices.forcemerge(index=ES_INDEX, only_expunge_deletes=True)
+        print("✅ Segmentos mesclados")
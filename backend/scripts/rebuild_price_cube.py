@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+Script para recalcular o cubo vendedor × produto × dia (tabela price_cube) a
+partir da tabela price_history: carga inicial, após rebuild_price_history.py
+ou para corrigir um intervalo de dias.
+"""
+
+import os
+import sys
+import argparse
+import logging
+from datetime import datetime
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import engine, Base
+from app.models.price_cube import PriceCube
+from app.services.price_cube import price_cube
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula o cubo de preços a partir do histórico")
+    parser.add_argument("--inicio", help="Primeiro dia (YYYY-MM-DD); padrão: início do histórico")
+    parser.add_argument("--fim", help="Último dia (YYYY-MM-DD); padrão: fim do histórico")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("RECÁLCULO DO CUBO VENDEDOR × PRODUTO × DIA")
+    print("=" * 80)
+
+    Base.metadata.create_all(bind=engine, tables=[PriceCube.__table__])
+    days = price_cube.rebuild(parse_day(args.inicio), parse_day(args.fim))
+
+    print(f"\n✅ {days} dias recalculados")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Script para carregar o histórico de preços na tabela price_history do banco
+relacional a partir dos documentos brutos do Elasticsearch (carga inicial ou
+após limpar a tabela). Snapshots já gravados são ignorados, então o script
+pode ser executado de novo com segurança.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import engine, Base
+from app.models.price_history import PriceHistory
+from app.services.elasticsearch_service import ElasticsearchService
+from app.services.price_history import price_history_store
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carrega o histórico de preços no banco relacional")
+    parser.add_argument("--dias", type=int, default=None, help="Carregar apenas os últimos N dias")
+    parser.add_argument("--lote", type=int, default=5000, help="Documentos gravados por lote (um COPY por lote)")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("CARGA DO HISTÓRICO DE PREÇOS NO BANCO RELACIONAL")
+    print("=" * 80)
+
+    Base.metadata.create_all(bind=engine, tables=[PriceHistory.__table__])
+    price_history_store.prepare()
+
+    service = ElasticsearchService()
+    total = service.rebuild_price_history(period_days=args.dias, chunk_size=args.lote)
+
+    print(f"\n✅ {total} linhas novas no histórico")
+    partitions = price_history_store.list_partitions()
+    if partitions:
+        print(f"Partições: {', '.join(partitions)}")
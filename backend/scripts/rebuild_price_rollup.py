@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Script para reconstruir o índice de resumo diário de preços
+(produto × vendedor × dia) a partir dos documentos brutos do Elasticsearch.
+O resumo atual (ou, com --dias, os dias do período) é removido antes da
+reconstrução.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.time_windows import period_start_day
+from app.services.elasticsearch_service import ElasticsearchService
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstrói o resumo diário de preços")
+    parser.add_argument("--dias", type=int, default=None, help="Processar apenas os últimos N dias")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos agregados por lote")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("RECONSTRUÇÃO DO RESUMO DIÁRIO DE PREÇOS")
+    print("=" * 80)
+
+    service = ElasticsearchService()
+    service.clear_price_rollup(period_start_day(args.dias) if args.dias is not None else None)
+    total = service.rebuild_price_rollup(period_days=args.dias, chunk_size=args.lote)
+
+    print(f"\n✅ {total} documentos processados")
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Script para reconstruir as estatísticas acumuladas de preço (produto × vendedor)
+a partir dos documentos brutos do Elasticsearch, percorridos em ordem de
+timestamp. As estatísticas atuais são removidas antes da reconstrução.
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Adicionar o diretório raiz ao path para importar módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.elasticsearch_service import ElasticsearchService
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstrói as estatísticas de preço")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos agregados por lote")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("RECONSTRUÇÃO DAS ESTATÍSTICAS DE PREÇO")
+    print("=" * 80)
+
+    service = ElasticsearchService()
+    service.clear_price_stats()
+    total = service.rebuild_price_stats(chunk_size=args.lote)
+
+    print(f"\n✅ {total} documentos processados")